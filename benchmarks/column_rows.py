@@ -0,0 +1,97 @@
+"""Rendering time of the schema editor form, compiled column rows vs crispy.
+
+    python manage.py migrate
+    python benchmarks/column_rows.py [--columns 10,100,1000] [--repeat 5]
+
+A schema with the given number of columns of every type is created for
+each size inside a transaction that is rolled back afterwards. The form is
+built once per size and renderer and rendered --repeat times, the first
+rendering is not counted. Building it is reported on its own, it does not
+depend on the renderer.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "root_app.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import django
+
+django.setup()
+
+from crispy_forms.utils import render_crispy_form
+from django.db import transaction
+
+from schemas.bulk import bulk_create_columns
+from schemas.forms import DataSchemaForm
+from schemas.models import COLUMN_MODELS, DataSchemas
+
+
+class Rollback(Exception):
+    pass
+
+
+def render_seconds(form, repeat):
+    render_crispy_form(form)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        html = render_crispy_form(form)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(html)
+
+
+def measure(columns, repeat):
+    try:
+        with transaction.atomic():
+            schema = DataSchemas.objects.create(name="Column rows benchmark")
+            models = list(COLUMN_MODELS.values())
+            bulk_create_columns(
+                [
+                    models[order % len(models)](
+                        schema=schema, name="column %s" % order, order=order
+                    )
+                    for order in range(1, columns + 1)
+                ],
+                update_index=False,
+            )
+            started = time.perf_counter()
+            form = DataSchemaForm(schema_pk=schema.pk, compiled_rows=False)
+            build = time.perf_counter() - started
+            crispy, crispy_size = render_seconds(form, repeat)
+            form = DataSchemaForm(schema_pk=schema.pk, compiled_rows=True)
+            compiled, compiled_size = render_seconds(form, repeat)
+            raise Rollback()
+    except Rollback:
+        pass
+    return build, crispy, compiled, crispy_size, compiled_size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--columns", default="10,100,1000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        "%8s %9s %10s %12s %8s %10s"
+        % ("columns", "build ms", "crispy ms", "compiled ms", "speedup", "KB")
+    )
+    for columns in [int(value) for value in args.columns.split(",")]:
+        build, crispy, compiled, crispy_size, compiled_size = measure(
+            columns, args.repeat
+        )
+        print(
+            "%8s %9.1f %10.1f %12.1f %7.1fx %10s"
+            % (columns, build * 1000, crispy * 1000, compiled * 1000,
+               crispy / compiled, "%.0f/%.0f" % (crispy_size / 1024, compiled_size / 1024))
+        )  # fmt: skip
+
+
+if __name__ == "__main__":
+    main()
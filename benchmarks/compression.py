@@ -0,0 +1,103 @@
+"""Throughput of compressed exports, single stream vs blocks on threads.
+
+    python manage.py migrate
+    python benchmarks/compression.py [--rows 200000] [--threads 1,2,4,8]
+
+A schema with one column of every type is created inside a transaction
+that is rolled back afterwards, and its CSV export is generated once into
+memory: "generate" is the rate to beat. The same bytes are then
+compressed as one gzip stream, the way the export was compressed before,
+and by schemas.compression with every thread count, for gzip and for zstd
+when the zstandard package is installed. Rates are MB of CSV per second.
+"""
+
+import argparse
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "root_app.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import django
+
+django.setup()
+
+from django.db import transaction
+
+from schemas.bulk import bulk_create_columns
+from schemas.compression import compress_chunks, compression_methods
+from schemas.exports import export_schema
+from schemas.generation import load_columns
+from schemas.models import COLUMN_MODELS, DataSchemas
+
+
+class Rollback(Exception):
+    pass
+
+
+def generate_csv(rows):
+    # returns (chunks, seconds)
+    try:
+        with transaction.atomic():
+            schema = DataSchemas.objects.create(name="Compression benchmark")
+            bulk_create_columns(
+                [
+                    model(schema=schema, name=model.__name__.lower(), order=order)
+                    for order, model in enumerate(COLUMN_MODELS.values(), start=1)
+                ],
+                update_index=False,
+            )
+            started = time.perf_counter()
+            chunks = list(export_schema(schema, load_columns(schema), rows))
+            seconds = time.perf_counter() - started
+            raise Rollback()
+    except Rollback:
+        pass
+    return chunks, seconds
+
+
+def single_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return [compressor.compress(chunk) for chunk in chunks] + [compressor.flush()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--threads", default="1,2,4,8")
+    args = parser.parse_args()
+
+    chunks, seconds = generate_csv(args.rows)
+    size = sum(len(chunk) for chunk in chunks)
+    megabytes = size / 1024**2
+    print("%s rows, %.1f MB of CSV, %d CPUs" % (args.rows, megabytes, os.cpu_count()))
+    print("%-8s %8s %8s %8s" % ("method", "threads", "MB/s", "ratio"))
+    print("%-8s %8s %8.1f %8s" % ("generate", "", megabytes / seconds, ""))
+
+    runs = [("gzip", "stream", lambda: single_stream(chunks))]
+    for method in compression_methods:
+        for threads in [int(value) for value in args.threads.split(",")]:
+            runs.append(
+                (
+                    method,
+                    threads,
+                    lambda method=method, threads=threads: list(
+                        compress_chunks(chunks, method, threads)
+                    ),
+                )
+            )
+    for method, threads, run in runs:
+        started = time.perf_counter()
+        compressed = sum(len(block) for block in run())
+        seconds = time.perf_counter() - started
+        print(
+            "%-8s %8s %8.1f %8.2f"
+            % (method, threads, megabytes / seconds, size / compressed)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Concurrent slow downloads of one export, served by gunicorn (WSGI) and by
+uvicorn (ASGI).
+
+    python manage.py migrate
+    python benchmarks/concurrent_downloads.py --schema 1 [--clients 50]
+
+Every client reads at --client-rate bytes per second, like a download over
+a slow link. A sync gunicorn worker is tied to one download until it ends,
+the ASGI worker interleaves all of them.
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def download(host, port, path, rate):
+    started = time.monotonic()
+    # a small receive buffer, so the server cannot hand the whole
+    # download to the kernel at once
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, (host, port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    writer.write(
+        (
+            "GET %s HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n\r\n" % (path, host)
+        ).encode()
+    )
+    await writer.drain()
+    first_byte = None
+    size = 0
+    while True:
+        data = await reader.read(16384)
+        if not data:
+            break
+        if first_byte is None:
+            first_byte = time.monotonic() - started
+        size += len(data)
+        await asyncio.sleep(len(data) / rate)
+    writer.close()
+    return first_byte, time.monotonic() - started, size
+
+
+async def run_clients(port, path, clients, rate):
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *[download("127.0.0.1", port, path, rate) for _ in range(clients)],
+        return_exceptions=True,
+    )
+    elapsed = time.monotonic() - started
+    completed = [result for result in results if not isinstance(result, Exception)]
+    return elapsed, completed, len(results) - len(completed)
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server on port %s did not start" % (port,))
+
+
+def benchmark(name, command, port, args, env):
+    server = subprocess.Popen(command, cwd=ROOT, env=env, start_new_session=True)
+    try:
+        wait_for_port(port)
+        path = "/schema/%s/export/?rows=%s&format=csv" % (args.schema, args.rows)
+        # the first request fills the dataset cache, the measured ones read it
+        asyncio.run(run_clients(port, path, 1, 10**9))
+        elapsed, completed, failed = asyncio.run(
+            run_clients(port, path, args.clients, args.client_rate)
+        )
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+    first_bytes = sorted(result[0] or 0 for result in completed)
+    total = sum(result[2] for result in completed)
+    print(
+        "%-28s %3s done %3s failed  %6.1f s  %6.2f MB/s  "
+        "first byte median %5.2f s max %5.2f s"
+        % (
+            name,
+            len(completed),
+            failed,
+            elapsed,
+            total / elapsed / 2**20,
+            first_bytes[len(first_bytes) // 2] if first_bytes else 0,
+            first_bytes[-1] if first_bytes else 0,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--schema", type=int, required=True)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--client-rate", type=int, default=1024 * 1024)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        SECRET_KEY=os.environ.get("SECRET_KEY", "benchmark"),
+        # every client comes from 127.0.0.1, only the downloads are limited here
+        EXPORT_CONCURRENCY=str(args.clients * 2),
+        EXPORT_CONCURRENCY_PER_CLIENT=str(args.clients * 2),
+    )
+    print(
+        "%s clients at %s kB/s, %s rows"
+        % (args.clients, args.client_rate // 1024, args.rows)
+    )
+    benchmark(
+        "gunicorn, %s sync workers" % (args.workers,),
+        [sys.executable, "-m", "gunicorn", "root_app.wsgi", "--bind",
+         "127.0.0.1:8101", "--workers", str(args.workers), "--timeout", "300"],
+        8101,
+        args,
+        env,
+    )  # fmt: skip
+    benchmark(
+        "uvicorn, 1 worker",
+        [sys.executable, "-m", "uvicorn", "root_app.asgi:application",
+         "--port", "8102", "--log-level", "warning"],
+        8102,
+        args,
+        env,
+    )  # fmt: skip
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Concurrent editor sessions against a live server, with latency per step.
+
+    python manage.py migrate
+    python benchmarks/loadtest.py [--users 20] [--duration 60]
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 [--users 20]
+
+Without --url, gunicorn is started on --port with --workers sync workers.
+Every simulated user repeats the session below with its own cookies until
+--duration has passed, like a browser: it reads the CSRF token and the
+button names (delete_col_<pk>, submit_form_<pk>, ...) from each page and
+posts back every field of the form.
+
+    list          GET the schema list
+    create        "Create new schema"
+    rename        change the name, "Submit"
+    add_column    "Add New Column", --columns times
+    retype        change the type of one column, "Submit"
+    delete_column "Delete" one column
+    export        download --rows rows as CSV
+    delete        delete the schema
+
+Responses with status 429 or 503 are counted as rejected by admission
+control, other 4xx and 5xx responses, exceptions and pages without the
+expected buttons as errors.
+"""
+
+import argparse
+import http.client
+import http.cookiejar
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from html.parser import HTMLParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLUMN_TYPES = ["IntegerColumn", "FullNameColumn", "JobColumn", "PhoneColumn", "CompanyColumn"]  # fmt: skip
+STEPS = ["list", "create", "rename", "add_column", "retype", "delete_column", "export", "delete"]  # fmt: skip
+
+
+class FormParser(HTMLParser):
+    # the fields of the page's forms as a browser would submit them,
+    # submit buttons are collected separately
+    def __init__(self):
+        super().__init__()
+        self.fields = {}
+        self.buttons = []
+        self.select = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        name = attrs.get("name")
+        if tag == "input" and name:
+            if attrs.get("type") == "submit":
+                self.buttons.append(name)
+            else:
+                self.fields[name] = attrs.get("value", "")
+        elif tag == "select" and name:
+            self.select = name
+        elif tag == "option" and self.select:
+            if self.select not in self.fields or "selected" in attrs:
+                self.fields[self.select] = attrs.get("value", "")
+
+    def handle_endtag(self, tag):
+        if tag == "select":
+            self.select = None
+
+
+def parse_form(html):
+    parser = FormParser()
+    parser.feed(html)
+    return parser.fields, parser.buttons
+
+
+def button_pk(buttons, prefix):
+    for button in buttons:
+        if button.startswith(prefix):
+            return int(button[len(prefix) :])
+    raise ValueError("no %s... button on the page" % (prefix,))
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self.sessions = 0
+        self.error_samples = []
+
+    def add(self, step, seconds, outcome, detail=None):
+        with self.lock:
+            if outcome == "ok":
+                self.latencies[step].append(seconds)
+            elif outcome == "rejected":
+                self.rejected[step] += 1
+            else:
+                self.errors[step] += 1
+                if len(self.error_samples) < 10:
+                    self.error_samples.append("%s: %s" % (step, detail))
+
+
+class User:
+    def __init__(self, base_url, stats, args, number):
+        self.base_url = base_url
+        self.stats = stats
+        self.args = args
+        self.number = number
+        self.rng = random.Random(number)
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, step, path, data=None):
+        # returns the page text; the step is recorded either way
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, body, timeout=120) as response:
+                content = response.read()
+        except urllib.error.HTTPError as error:
+            error.read()
+            outcome = "rejected" if error.code in (429, 503) else "error"
+            self.stats.add(step, time.perf_counter() - started, outcome, error.code)
+            raise StepFailed()
+        except (OSError, http.client.HTTPException) as error:
+            self.stats.add(step, time.perf_counter() - started, "error", error)
+            raise StepFailed()
+        self.stats.add(step, time.perf_counter() - started, "ok")
+        return content.decode("utf-8", "replace")
+
+    def post_form(self, step, path, fields, button):
+        return self.request(step, path, dict(fields, **{button: ""}))
+
+    def expect(self, step, condition, detail):
+        # a 200 page that shows the step did not take effect
+        if not condition:
+            self.stats.add(step, 0, "error", detail)
+            raise StepFailed()
+
+    def page(self, step, html):
+        fields, buttons = parse_form(html)
+        self.expect(step, "csrfmiddlewaretoken" in fields, "no CSRF token on the page")
+        return fields, buttons
+
+    def session(self):
+        fields, buttons = self.page("list", self.request("list", "/"))
+        csrf = {"csrfmiddlewaretoken": fields["csrfmiddlewaretoken"]}
+        html = self.request("create", "/create_schema/", csrf)
+        fields, buttons = self.page("create", html)
+        pk = button_pk(buttons, "submit_form_")
+        path = "/schema/%s/" % (pk,)
+        try:
+            fields["name"] = "Load test user %s" % (self.number,)
+            html = self.post_form("rename", path, fields, "submit_form_%s" % pk)
+
+            for index in range(self.args.columns):
+                fields, buttons = self.page("add_column", html)
+                fields["add_column_name"] = "column %s" % (index,)
+                fields["add_column_type"] = self.rng.choice(COLUMN_TYPES)
+                html = self.post_form(
+                    "add_column", path, fields, "add_column_btn_%s" % pk
+                )
+                self.expect(
+                    "add_column",
+                    'value="column %s"' % (index,) in html,
+                    "the new column is not on the page",
+                )
+
+            fields, buttons = self.page("retype", html)
+            type_field = self.rng.choice(
+                [name for name in fields if name.startswith("col_type_")]
+            )
+            fields[type_field] = self.rng.choice(
+                [name for name in COLUMN_TYPES if name != fields[type_field]]
+            )
+            html = self.post_form("retype", path, fields, "submit_form_%s" % pk)
+
+            fields, buttons = self.page("delete_column", html)
+            delete_buttons = [
+                name for name in buttons if name.startswith("delete_col_")
+            ]
+            delete_button = self.rng.choice(delete_buttons)
+            html = self.post_form("delete_column", path, fields, delete_button)
+            self.expect(
+                "delete_column",
+                delete_button not in parse_form(html)[1],
+                "the deleted column is still on the page",
+            )
+
+            self.request("export", "/schema/%s/export/?rows=%s" % (pk, self.args.rows))
+        finally:
+            self.request("delete", "/delete/%s/" % (pk,), csrf)
+
+    def run(self, deadline):
+        while time.monotonic() < deadline:
+            try:
+                self.session()
+            except StepFailed:
+                continue
+            except (ValueError, IndexError, KeyError) as error:
+                self.stats.add("session", 0, "error", error)
+                continue
+            with self.stats.lock:
+                self.stats.sessions += 1
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)] * 1000
+
+
+def report(stats, elapsed):
+    print(
+        "%-14s %7s %6s %8s %7s %8s %8s %8s %8s"
+        % ("step", "ok", "errors", "rejected", "req/s", "p50 ms", "p95 ms", "p99 ms", "max ms")  # fmt: skip
+    )
+    total = 0
+    for step in STEPS + ["session"]:
+        latencies = sorted(stats.latencies[step])
+        errors, rejected = stats.errors[step], stats.rejected[step]
+        if not latencies and not errors and not rejected:
+            continue
+        total += len(latencies) + errors + rejected
+        print(
+            "%-14s %7s %6s %8s %7.1f %8s %8s %8s %8s"
+            % (
+                step,
+                len(latencies),
+                errors,
+                rejected,
+                len(latencies) / elapsed,
+                *(
+                    ("%.0f" % percentile(latencies, fraction) if latencies else "-")
+                    for fraction in (0.5, 0.95, 0.99, 1.0)
+                ),
+            )
+        )
+    print(
+        "%s sessions, %s requests in %.1f s: %.2f sessions/s, %.1f requests/s"
+        % (stats.sessions, total, elapsed, stats.sessions / elapsed, total / elapsed)
+    )
+    for sample in stats.error_samples:
+        print("  error %s" % (sample,))
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server on port %s did not start" % (port,))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="Server to test, gunicorn is started if not set")
+    parser.add_argument("--port", type=int, default=8103)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--ramp-up", type=float, default=5, help="seconds")
+    parser.add_argument("--columns", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        env = dict(
+            os.environ,
+            SECRET_KEY=os.environ.get("SECRET_KEY", "benchmark"),
+            # every user comes from 127.0.0.1
+            EXPORT_CONCURRENCY_PER_CLIENT=os.environ.get(
+                "EXPORT_CONCURRENCY_PER_CLIENT", str(args.users)
+            ),
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "root_app.wsgi", "--bind",
+             "127.0.0.1:%s" % args.port, "--workers", str(args.workers)],
+            cwd=ROOT, env=env, start_new_session=True,
+        )  # fmt: skip
+        base_url = "http://127.0.0.1:%s" % (args.port,)
+    base_url = base_url.rstrip("/")
+
+    stats = Stats()
+    try:
+        if server is not None:
+            wait_for_port(args.port)
+        started = time.monotonic()
+        deadline = started + args.duration
+        threads = []
+        for number in range(args.users):
+            user = User(base_url, stats, args, number)
+            thread = threading.Thread(target=user.run, args=(deadline,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(args.ramp_up / max(args.users, 1))
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+    print("%s users, %s, %.0f s" % (args.users, base_url, args.duration))
+    report(stats, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Import time of the project and time to first byte of fresh gunicorn workers.
+
+    python manage.py migrate
+    python benchmarks/startup.py [--imports 5] [--repeat 5]
+    python benchmarks/startup.py --max-import-ms 1500 --max-first-byte-ms 300
+
+Import time is measured in new interpreters that import root_app.wsgi,
+which also runs the settings and django.setup(); --importtime lists the
+packages that take longest, from python -X importtime.
+
+Then gunicorn is started with a single worker, once without and once with
+preloading and warm-up (WEB_PRELOAD and WEB_WARMUP, see gunicorn.conf.py).
+As soon as the port accepts connections, the steps below are requested in
+order, first by a fresh worker and then --repeat more times:
+
+    list     GET the schema list
+    create   "Create new schema", renders the editor
+    detail   GET the schema page
+    export   download 100 rows as CSV
+    delete   delete the schema
+
+The first request of each step against the median of the repeated ones
+shows what the worker still does lazily. With the --max-... options the
+exit status is 1 when the warmed up server exceeds them, for CI.
+"""
+
+import argparse
+import http.cookiejar
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from loadtest import ROOT, parse_form, wait_for_port
+
+STEPS = ["list", "create", "detail", "export", "delete"]
+CONFIGURATIONS = [
+    ("cold", {"WEB_PRELOAD": "0", "WEB_WARMUP": "0"}),
+    ("warm", {"WEB_PRELOAD": "1", "WEB_WARMUP": "1"}),
+]
+IMPORT_CODE = (
+    "import time; started = time.perf_counter(); import root_app.wsgi; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def environment(**extra):
+    return dict(
+        os.environ, SECRET_KEY=os.environ.get("SECRET_KEY", "benchmark"), **extra
+    )
+
+
+def import_seconds(count):
+    timings = []
+    for _ in range(count):
+        output = subprocess.check_output(
+            [sys.executable, "-c", IMPORT_CODE],
+            cwd=ROOT,
+            env=environment(),
+            stderr=subprocess.DEVNULL,
+        )
+        timings.append(float(output.decode().split()[-1]))
+    return timings
+
+
+def slowest_packages(limit):
+    # python -X importtime writes "import time: self [us] | cumulative | name",
+    # the self times are added up per top-level package
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import root_app.wsgi"],
+        cwd=ROOT,
+        env=environment(),
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+    )
+    packages = defaultdict(int)
+    for line in result.stderr.decode().splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+\d+ \|\s+(\S+)", line)
+        if match:
+            packages[match.group(2).split(".")[0]] += int(match.group(1))
+    return sorted(((us, name) for name, us in packages.items()), reverse=True)[:limit]
+
+
+class Session:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, path, data=None):
+        # returns (seconds to the response headers, body)
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        with self.opener.open(self.base_url + path, body, timeout=60) as response:
+            first_byte = time.perf_counter() - started
+            content = response.read()
+        return first_byte, content.decode("utf-8", "replace")
+
+    def run(self):
+        timings = {}
+        timings["list"], html = self.request("/")
+        csrf = {"csrfmiddlewaretoken": parse_form(html)[0]["csrfmiddlewaretoken"]}
+        timings["create"], html = self.request("/create_schema/", csrf)
+        pk = re.search(r'name="submit_form_(\d+)"', html).group(1)
+        timings["detail"], _ = self.request("/schema/%s/view/" % (pk,))
+        timings["export"], _ = self.request("/schema/%s/export/?rows=100" % (pk,))
+        timings["delete"], _ = self.request("/delete/%s/" % (pk,), csrf)
+        return timings
+
+
+def measure_server(port, extra_env, repeat):
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "root_app.wsgi", "--bind",
+         "127.0.0.1:%s" % port, "--workers", "1"],
+        cwd=ROOT, env=environment(**extra_env), start_new_session=True,
+        stderr=subprocess.DEVNULL,
+    )  # fmt: skip
+    try:
+        wait_for_port(port, timeout=60)
+        boot = time.perf_counter() - started
+        session = Session("http://127.0.0.1:%s" % (port,))
+        first = session.run()
+        repeated = [session.run() for _ in range(repeat)]
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+    warm = {
+        step: statistics.median(timings[step] for timings in repeated) for step in STEPS
+    }
+    return boot, first, warm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8104)
+    parser.add_argument("--imports", type=int, default=5, help="interpreters")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N",
+                        help="list the N packages taking longest to import")  # fmt: skip
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-first-byte-ms", type=float,
+                        help="limit for the first request of every step")  # fmt: skip
+    args = parser.parse_args()
+
+    imports = import_seconds(args.imports)
+    import_ms = statistics.median(imports) * 1000
+    print(
+        "import root_app.wsgi: median %.0f ms, min %.0f ms, max %.0f ms"
+        % (import_ms, min(imports) * 1000, max(imports) * 1000)
+    )
+    for microseconds, package in slowest_packages(args.importtime):
+        print("  %7.1f ms  %s" % (microseconds / 1000, package))
+
+    results = {}
+    for name, extra_env in CONFIGURATIONS:
+        results[name] = measure_server(args.port, extra_env, args.repeat)
+    print()
+    print(
+        "%-8s %-7s %9s %10s %10s" % ("server", "step", "boot ms", "first ms", "warm ms")
+    )
+    for name, (boot, first, warm) in results.items():
+        for index, step in enumerate(STEPS):
+            print(
+                "%-8s %-7s %9s %10.1f %10.1f"
+                % (name, step, "%.0f" % (boot * 1000) if index == 0 else "",
+                   first[step] * 1000, warm[step] * 1000)
+            )  # fmt: skip
+
+    failures = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append("import %.0f ms > %.0f ms" % (import_ms, args.max_import_ms))
+    if args.max_first_byte_ms is not None:
+        first = results["warm"][1]
+        for step in STEPS:
+            if first[step] * 1000 > args.max_first_byte_ms:
+                failures.append(
+                    "first %s %.0f ms > %.0f ms"
+                    % (step, first[step] * 1000, args.max_first_byte_ms)
+                )
+    for failure in failures:
+        print("FAILED: %s" % (failure,))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
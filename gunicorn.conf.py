@@ -0,0 +1,24 @@
+# Picked up by gunicorn from the working directory, see the Procfile.
+# The project is imported once in the master (preload_app) and warmed up
+# there and in every worker, see schemas/warmup.py. WEB_PRELOAD=0 and
+# WEB_WARMUP=0 turn this off, e.g. to compare with benchmarks/startup.py.
+import os
+
+preload_app = os.environ.get("WEB_PRELOAD", "1") != "0"
+warmup = os.environ.get("WEB_WARMUP", "1") != "0"
+
+
+def when_ready(server):
+    # the master, before any worker is forked
+    if warmup and preload_app:
+        from schemas.warmup import format_timings, warm_up
+
+        server.log.info("Warmed up: %s", format_timings(warm_up(connect=False)))
+
+
+def post_worker_init(worker):
+    # every worker, once it has loaded the application
+    if warmup:
+        from schemas.warmup import format_timings, warm_up
+
+        worker.log.info("Warmed up worker: %s", format_timings(warm_up()))
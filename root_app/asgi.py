@@ -9,8 +9,9 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from schemas.asgi import get_streaming_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'root_app.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
-application = get_asgi_application()
+application = get_streaming_asgi_application()
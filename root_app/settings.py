@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import environ
 
 env = os.environ.copy()
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
     
     # 3rd party
     'crispy_forms',
+    'haystack',
     
     # local
     'schemas.apps.SchemasConfig'
@@ -57,11 +59,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'schemas.middleware.StaticFilesMiddleware',
+    'schemas.slow_queries.SlowQueryMiddleware',
+    'schemas.metrics.MetricsMiddleware',
+    'schemas.tracing.TracingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'schemas.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,6 +75,16 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'root_app.urls'
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+# Full-text search over schema and column names, kept up to date on every save.
+# SQLite FTS5 index in a local file, see schemas/search_backends.py
+HAYSTACK_CONNECTIONS = {
+    'default': {
+        'ENGINE': 'schemas.search_backends.SQLiteFTSEngine',
+        'PATH': env('SEARCH_INDEX_PATH', default=str(BASE_DIR / 'search_index.sqlite3')),
+    },
+}
+HAYSTACK_SIGNAL_PROCESSOR = 'schemas.search_indexes.ColumnSignalProcessor'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -138,14 +154,111 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 # Configure Django App for Heroku.
+# The static files settings are below; its staticfiles option would put the
+# sync-only WhiteNoiseMiddleware in front of schemas.middleware.StaticFilesMiddleware
 import django_heroku
-django_heroku.settings(locals())
+django_heroku.settings(locals(), staticfiles=False)
 
 # Heroku: Update database configuration from $DATABASE_URL.
 import dj_database_url
 db_from_env = dj_database_url.config(conn_max_age=500)
 DATABASES['default'].update(db_from_env)
 
+# Optional read replica for the read-only schema pages and API,
+# e.g. REPLICA_DATABASE_URL=sqlite:////path/to/replica.sqlite3 to try it locally.
+# A client that has just written something keeps reading from the primary
+# for REPLICA_STICKY_SECONDS.
+REPLICA_DATABASE_URL = env('REPLICA_DATABASE_URL', default=None)
+REPLICA_DATABASE_ALIAS = None
+if REPLICA_DATABASE_URL:
+    REPLICA_DATABASE_ALIAS = 'replica'
+    DATABASES[REPLICA_DATABASE_ALIAS] = dj_database_url.parse(REPLICA_DATABASE_URL, conn_max_age=500)
+    DATABASES[REPLICA_DATABASE_ALIAS]['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['schemas.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', default=10)
+
+# Upper limit for the number of rows of a dataset export requested over HTTP
+EXPORT_MAX_ROWS = env.int('EXPORT_MAX_ROWS', default=1000000)
+
+# Compressed exports (?compress=gzip, or zstd with the zstandard package) are
+# compressed in blocks of EXPORT_COMPRESSION_BLOCK_BYTES by this many threads,
+# see schemas/compression.py.
+EXPORT_COMPRESSION_THREADS = env.int('EXPORT_COMPRESSION_THREADS', default=os.cpu_count() or 1)
+EXPORT_COMPRESSION_BLOCK_BYTES = env.int('EXPORT_COMPRESSION_BLOCK_BYTES', default=1024 ** 2)
+
+# Django's cache, local memory of every worker process by default, e.g.
+# CACHE_URL=memcache://127.0.0.1:11211 for one cache shared by all of them.
+CACHES = {'default': env.cache('CACHE_URL', default='locmemcache://')}
+
+# The schema editor shows the first SCHEMA_PREVIEW_ROWS generated rows, kept
+# in the cache per schema version, see schemas/preview.py. 0 hides them.
+SCHEMA_PREVIEW_ROWS = env.int('SCHEMA_PREVIEW_ROWS', default=20)
+SCHEMA_PREVIEW_CACHE_SECONDS = env.int('SCHEMA_PREVIEW_CACHE_SECONDS', default=24 * 3600)
+
+# Foreign key columns sample the keys of their parent table from a pool held
+# in memory up to this many bytes, larger pools are memory-mapped temporary
+# files (in TMPDIR), see schemas/generation.py.
+FOREIGN_KEY_POOL_MEMORY_BYTES = env.int('FOREIGN_KEY_POOL_MEMORY_BYTES', default=64 * 1024 ** 2)
+# Key pools kept per process for the next exports of the same schemas.
+FOREIGN_KEY_POOL_CACHE_BYTES = env.int('FOREIGN_KEY_POOL_CACHE_BYTES', default=256 * 1024 ** 2)
+
+# Exported datasets are kept on local disk and served from there when the same
+# schema, row count, seed and format are requested again. The least recently
+# used files are removed above DATASET_CACHE_MAX_BYTES, an empty
+# DATASET_CACHE_DIR turns the cache off.
+DATASET_CACHE_DIR = env('DATASET_CACHE_DIR', default=str(BASE_DIR / 'dataset_cache'))
+DATASET_CACHE_MAX_BYTES = env.int('DATASET_CACHE_MAX_BYTES', default=1024 ** 3)
+
+# Set by root_app/asgi.py: serve the schema list and the export with the
+# async views of schemas/async_views.py
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+# Concurrency limits for the expensive views, see schemas/admission.py.
+# The lock files have to be on a disk shared by all workers of the machine.
+# Queued requests keep their worker busy, keep "queue" below the worker count.
+ADMISSION_LOCK_DIR = env('ADMISSION_LOCK_DIR', default=os.path.join(tempfile.gettempdir(), 'schemas-admission'))
+# Set where a proxy appends the client address to X-Forwarded-For, e.g. on
+# Heroku, otherwise clients are told apart by REMOTE_ADDR.
+ADMISSION_TRUST_X_FORWARDED_FOR = env.bool('ADMISSION_TRUST_X_FORWARDED_FOR', default=False)
+ADMISSION_LIMITS = {
+    'export': {
+        'global': env.int('EXPORT_CONCURRENCY', default=2),
+        'per_client': env.int('EXPORT_CONCURRENCY_PER_CLIENT', default=1),
+        'queue': 2,
+        'timeout': 10,
+    },
+    'import': {'global': 2, 'per_client': 1, 'queue': 2, 'timeout': 10},
+    'clone': {'global': 2, 'per_client': 1, 'queue': 2, 'timeout': 5},
+}
+
+# Request metrics, see schemas/metrics.py. Every worker process writes its
+# counts to METRICS_DIR, /metrics adds them up in the Prometheus text format
+# for scrapers connecting from METRICS_ALLOWED_IPS. An empty METRICS_DIR
+# turns the metrics off.
+METRICS_DIR = env('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'schemas-metrics'))
+METRICS_FLUSH_SECONDS = env.float('METRICS_FLUSH_SECONDS', default=1.0)
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+
+# Tracing spans, see schemas/tracing.py. TRACING_SAMPLE_RATE of the requests
+# are traced, those slower than TRACING_SLOW_SECONDS are kept in TRACING_FILE
+# and shown to staff at /traces/. An empty TRACING_FILE turns tracing off.
+TRACING_FILE = env('TRACING_FILE', default=os.path.join(tempfile.gettempdir(), 'schemas-traces.jsonl'))
+TRACING_SAMPLE_RATE = env.float('TRACING_SAMPLE_RATE', default=0.05)
+TRACING_SLOW_SECONDS = env.float('TRACING_SLOW_SECONDS', default=0.5)
+TRACING_MAX_SPANS = env.int('TRACING_MAX_SPANS', default=1000)
+TRACING_MAX_BYTES = env.int('TRACING_MAX_BYTES', default=10 * 1024 ** 2)
+
+# Statements of the schemas views taking SLOW_QUERY_SECONDS or longer are
+# stored with their EXPLAIN output, see schemas/slow_queries.py and the
+# "Slow queries" admin. An empty SLOW_QUERY_SECONDS turns this off.
+SLOW_QUERY_SECONDS = env('SLOW_QUERY_SECONDS', default='0.1')
+SLOW_QUERY_SECONDS = float(SLOW_QUERY_SECONDS) if SLOW_QUERY_SECONDS else None
+SLOW_QUERY_KEEP = env.int('SLOW_QUERY_KEEP', default=200)
+
+# Unfiltered admin changelists of tables with more rows than this, going by
+# the database statistics, show the estimate instead of running COUNT(*).
+ADMIN_ESTIMATED_COUNT_ABOVE = env.int('ADMIN_ESTIMATED_COUNT_ABOVE', default=100000)
+
 # The absolute path to the directory where collectstatic will collect static files for deployment.
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
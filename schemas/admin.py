@@ -1,7 +1,221 @@
-from django.contrib import admin
+import json
 
-# Register your models here.
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count
+from django.http import HttpResponse
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
 
-from .models import DataSchemas
+from . import bulk
+from .models import DataSchemas, SchemaColumn, SlowQuery
+from .serializers import export_schemas
 
-admin.site.register(DataSchemas)
\ No newline at end of file
+# row count estimates from the statistics the database keeps for its planner,
+# None if there are none (SQLite before ANALYZE, tables never analyzed)
+ESTIMATED_COUNT_SQL = {
+    "postgresql": "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+    "mysql": "SELECT table_rows FROM information_schema.tables "
+    "WHERE table_schema = DATABASE() AND table_name = %s",
+    "sqlite": "SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = %s LIMIT 1",
+}
+
+
+def estimated_count(model, using):
+    connection = connections[using]
+    sql = ESTIMATED_COUNT_SQL.get(connection.vendor)
+    if sql is None:
+        return None
+    try:
+        # a savepoint, a missing sqlite_stat1 must not break the transaction
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(sql, [model._meta.db_table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    # COUNT(*) reads the whole table on PostgreSQL, so the unfiltered
+    # changelist of a large table uses the estimate. Searches and filters
+    # still count exactly.
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > settings.ADMIN_ESTIMATED_COUNT_ABOVE:
+                return estimate
+        return super().count
+
+
+def format_parameters(column):
+    return ", ".join(
+        "%s=%s" % (name, value) for name, value in column.parameters.items()
+    )
+
+
+class SchemaChangeList(ChangeList):
+    def get_queryset(self, request):
+        # annotated here and not in DataSchemasAdmin.get_queryset(): the
+        # querysets of the actions end up in single column __in subqueries
+        self.root_queryset = self.root_queryset.annotate(
+            column_count=Count("schemacolumn")
+        )
+        return super().get_queryset(request)
+
+
+class SchemaColumnInline(admin.TabularInline):
+    # read only: columns are edited in the schema editor, which keeps the
+    # search index and the concrete column types right
+    model = SchemaColumn
+    fields = readonly_fields = ["order", "name", "column_type", "parameters"]
+    ordering = ["order"]
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_subclasses()
+
+    @admin.display(description="Type")
+    def column_type(self, obj):
+        return obj.get_column_type_display()
+
+    @admin.display(description="Parameters")
+    def parameters(self, obj):
+        return format_parameters(obj)
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DataSchemas)
+class DataSchemasAdmin(admin.ModelAdmin):
+    list_display = ["name", "column_count", "column_separator", "modified_at", "version"]  # fmt: skip
+    search_fields = ["name"]
+    ordering = ["-modified_at"]
+    readonly_fields = ["modif_date", "modified_at", "version"]
+    inlines = [SchemaColumnInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ["delete_selected", "clone_selected", "export_selected"]
+
+    def get_changelist(self, request, **kwargs):
+        return SchemaChangeList
+
+    @admin.display(description="Columns", ordering="column_count")
+    def column_count(self, obj):
+        return obj.column_count
+
+    # replaces Django's delete_selected, which loads and deletes every
+    # column one by one to send the signals
+    @admin.action(permissions=["delete"], description="Delete selected schemas")
+    def delete_selected(self, request, queryset):
+        if request.POST.get("post"):
+            schema_count, column_count = bulk.delete_schemas(queryset)
+            self.message_user(
+                request,
+                "Deleted %s schemas with %s columns." % (schema_count, column_count),
+                messages.SUCCESS,
+            )
+            return None
+        opts = self.model._meta
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Are you sure?",
+            "objects_name": opts.verbose_name_plural,
+            "deletable_objects": [],
+            "model_count": {
+                opts.verbose_name_plural: queryset.count(),
+                SchemaColumn._meta.verbose_name_plural: SchemaColumn.objects.filter(
+                    schema__in=queryset
+                ).count(),
+            }.items(),
+            "queryset": queryset,
+            "opts": opts,
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+            "media": self.media,
+        }
+        request.current_app = self.admin_site.name
+        return TemplateResponse(
+            request, "admin/delete_selected_confirmation.html", context
+        )
+
+    @admin.action(permissions=["add"], description="Clone selected schemas")
+    def clone_selected(self, request, queryset):
+        clones = bulk.clone_schemas(queryset.order_by("pk"))
+        self.message_user(
+            request, "Created %s copies." % (len(clones),), messages.SUCCESS
+        )
+
+    @admin.action(permissions=["view"], description="Export selected schemas")
+    def export_selected(self, request, queryset):
+        # the format of the import API
+        response = HttpResponse(
+            json.dumps({"schemas": export_schemas(queryset)}, indent=2),
+            content_type="application/json",
+        )
+        response["Content-Disposition"] = 'attachment; filename="schemas.json"'
+        return response
+
+
+@admin.register(SchemaColumn)
+class SchemaColumnAdmin(admin.ModelAdmin):
+    list_display = ["name", "schema", "order", "column_type", "parameters"]
+    search_fields = ["name"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # list_select_related is ignored once the queryset has select_related()
+        return super().get_queryset(request).with_subclasses().select_related("schema")
+
+    @admin.display(description="Type")
+    def column_type(self, obj):
+        return obj.get_column_type_display()
+
+    @admin.display(description="Parameters")
+    def parameters(self, obj):
+        return format_parameters(obj)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = [
+        "normalized_sql_start",
+        "view",
+        "count",
+        "total_seconds",
+        "average_seconds",
+        "max_seconds",
+        "last_seen",
+    ]
+    list_filter = ["view", "database"]
+    search_fields = ["normalized_sql"]
+    ordering = ["-total_seconds"]
+    readonly_fields = [
+        field.name for field in SlowQuery._meta.fields if field.name != "id"
+    ] + ["average_seconds"]
+
+    @admin.display(description="Statement")
+    def normalized_sql_start(self, obj):
+        return obj.normalized_sql[:120]
+
+    def has_add_permission(self, request):
+        return False
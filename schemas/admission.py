@@ -0,0 +1,278 @@
+import fcntl
+import hashlib
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+
+# Concurrency limits for expensive views, shared by all worker processes of
+# one machine through flock()ed files in ADMISSION_LOCK_DIR. Holding a slot
+# means holding an exclusive lock on one of the slot files, so slots of a
+# crashed worker are freed by the kernel. The stats file counts the events
+# of each group and lists the held global and queue slots, so that reading
+# the stats never takes a slot. A per-client lock file is removed when its
+# slot is released. ADMISSION_LIMITS has one entry per group of views:
+#
+#   "global"      requests of the group running at the same time
+#   "per_client"  of which from the same client, more get a 429
+#   "queue"       requests waiting for a global slot, more get a 503
+#   "timeout"     seconds a request waits before it gets a 503
+#
+# Waiting requests keep their worker busy, which is what "queue" bounds.
+
+STATS_FILE = "stats.json"
+HOLDERS = "_holders"
+EVENTS = ["admitted", "queued", "rejected_client", "rejected_queue_full", "timed_out"]
+
+
+class Slot:
+    def __init__(self, name, lock_file, remove=False):
+        self.name = name
+        self.lock_file = lock_file
+        self.remove = remove
+        self.tracked = False
+
+    def release(self):
+        if self.lock_file is not None:
+            if self.tracked:
+                set_holder(self.name, None)
+            if self.remove:
+                # still locked, see try_lock()
+                os.remove(lock_path(self.name))
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+
+def lock_path(name):
+    return os.path.join(settings.ADMISSION_LOCK_DIR, name)
+
+
+def try_lock(name, remove=False):
+    # with remove, the file is deleted when the slot is released
+    os.makedirs(settings.ADMISSION_LOCK_DIR, exist_ok=True)
+    path = lock_path(name)
+    while True:
+        lock_file = open(path, "ab")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        # a lock on a file that its holder deleted in the meantime does not
+        # count, the next holder locks the new file at the same path
+        try:
+            current = os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino
+        except FileNotFoundError:
+            current = False
+        if current:
+            return Slot(name, lock_file, remove)
+        lock_file.close()
+
+
+def try_acquire(prefix, count, remove=False, track=False):
+    # starting at a random slot keeps the probes of concurrent requests apart;
+    # tracked slots are listed in the stats file with the pid holding them
+    offset = random.randrange(count) if count else 0
+    for index in range(count):
+        slot = try_lock("%s-%s" % (prefix, (offset + index) % count), remove)
+        if slot is not None:
+            if track:
+                set_holder(slot.name, os.getpid())
+                slot.tracked = True
+            return slot
+    return None
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # running as another user
+        return True
+    return True
+
+
+def client_id(request):
+    # Behind a proxy such as Heroku's router, which appends the address it
+    # saw to X-Forwarded-For, the last entry is the one that cannot be
+    # forged. Without one, clients could send a new header every time.
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if forwarded and settings.ADMISSION_TRUST_X_FORWARDED_FOR:
+        return forwarded.split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def client_prefix(group, request):
+    # one set of lock files per client, so unrelated clients never share a slot
+    digest = hashlib.sha1(client_id(request).encode()).hexdigest()
+    return "%s-client-%s" % (group, digest)
+
+
+@contextmanager
+def locked_stats():
+    os.makedirs(settings.ADMISSION_LOCK_DIR, exist_ok=True)
+    with open(lock_path(STATS_FILE), "a+") as stats_file:
+        fcntl.flock(stats_file, fcntl.LOCK_EX)
+        stats_file.seek(0)
+        try:
+            stats = json.loads(stats_file.read() or "{}")
+        except ValueError:
+            stats = {}
+        yield stats
+        stats_file.seek(0)
+        stats_file.truncate()
+        stats_file.write(json.dumps(stats))
+
+
+def record(group, event, wait_seconds=0.0):
+    with locked_stats() as stats:
+        counters = stats.setdefault(group, {})
+        counters[event] = counters.get(event, 0) + 1
+        if wait_seconds:
+            counters["wait_seconds"] = counters.get("wait_seconds", 0.0) + wait_seconds
+
+
+def set_holder(name, pid):
+    with locked_stats() as stats:
+        holders = stats.setdefault(HOLDERS, {})
+        if pid is None:
+            holders.pop(name, None)
+        else:
+            holders[name] = pid
+
+
+def admission_stats():
+    try:
+        with open(lock_path(STATS_FILE)) as stats_file:
+            fcntl.flock(stats_file, fcntl.LOCK_SH)
+            stats = json.loads(stats_file.read() or "{}")
+    except (FileNotFoundError, ValueError):
+        stats = {}
+    # holders of a crashed worker are left in the file, its pid is gone
+    holders = [
+        name for name, pid in stats.get(HOLDERS, {}).items() if process_exists(pid)
+    ]
+    result = {}
+    for group in settings.ADMISSION_LIMITS:
+        counters = {event: 0 for event in EVENTS}
+        counters["wait_seconds"] = 0.0
+        counters.update(stats.get(group, {}))
+        for gauge, prefix in (("active", "global"), ("waiting", "queue")):
+            prefix = "%s-%s-" % (group, prefix)
+            counters[gauge] = sum(1 for name in holders if name.startswith(prefix))
+        result[group] = counters
+    return result
+
+
+def too_busy(status, message, retry_after):
+    response = HttpResponse(message, status=status, content_type="text/plain")
+    response["Retry-After"] = str(int(retry_after))
+    return response
+
+
+def acquire(group, request):
+    # returns (slots, None) when admitted or (None, error response)
+    limits = settings.ADMISSION_LIMITS[group]
+    retry_after = limits.get("retry_after", limits["timeout"]) or 1
+    client_slot = try_acquire(
+        client_prefix(group, request), limits["per_client"], remove=True
+    )
+    if client_slot is None:
+        record(group, "rejected_client")
+        return None, too_busy(
+            429, "Too many concurrent requests from this client", retry_after
+        )
+
+    global_prefix = "%s-global" % (group,)
+    global_slot = try_acquire(global_prefix, limits["global"], track=True)
+    if global_slot is None:
+        queue_slot = try_acquire("%s-queue" % (group,), limits["queue"], track=True)
+        if queue_slot is None:
+            client_slot.release()
+            record(group, "rejected_queue_full")
+            return None, too_busy(503, "Server busy, try again later", retry_after)
+        started = time.monotonic()
+        deadline = started + limits["timeout"]
+        delay = 0.01
+        try:
+            while global_slot is None and time.monotonic() < deadline:
+                time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+                delay = min(delay * 2, 0.25)
+                global_slot = try_acquire(global_prefix, limits["global"], track=True)
+        finally:
+            queue_slot.release()
+        if global_slot is None:
+            client_slot.release()
+            record(group, "timed_out", time.monotonic() - started)
+            return None, too_busy(503, "Server busy, try again later", retry_after)
+        record(group, "queued", time.monotonic() - started)
+    record(group, "admitted")
+    return [global_slot, client_slot], None
+
+
+def release_on_close(response, slots):
+    # The slots are held until the response is closed, which for streaming
+    # responses is after the last chunk has been sent.
+    for slot in slots:
+        response._resource_closers.append(slot.release)
+    return response
+
+
+def release_all(slots):
+    for slot in slots:
+        slot.release()
+
+
+def limit_concurrency(group):
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            if group not in settings.ADMISSION_LIMITS:
+                return view_func(request, *args, **kwargs)
+            slots, error_response = acquire(group, request)
+            if error_response is not None:
+                return error_response
+            try:
+                response = view_func(request, *args, **kwargs)
+            except BaseException:
+                release_all(slots)
+                raise
+            return release_on_close(response, slots)
+
+        return wrapped_view
+
+    return decorator
+
+
+def limit_concurrency_async(group):
+    # for async views, waiting for a slot happens in a worker thread
+    # and does not block the event loop
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapped_view(request, *args, **kwargs):
+            if group not in settings.ADMISSION_LIMITS:
+                return await view_func(request, *args, **kwargs)
+            slots, error_response = await sync_to_async(
+                acquire, thread_sensitive=False
+            )(group, request)
+            if error_response is not None:
+                return error_response
+            try:
+                response = await view_func(request, *args, **kwargs)
+            except BaseException:
+                release_all(slots)
+                raise
+            return release_on_close(response, slots)
+
+        return wrapped_view
+
+    return decorator
@@ -0,0 +1,98 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from schemas.admission import limit_concurrency
+from schemas.bulk import clone_schema
+from schemas.models import DataSchemas
+from schemas.routers import replica_reads
+from schemas.serializers import export_schemas, import_schemas
+from schemas.validation import validate_csv
+from schemas.views import schema_etag, schema_last_modified
+
+
+@replica_reads
+@require_GET
+def schema_list_api(request):
+    # ?ids=1,2,3 exports the given schemas, no ids exports all of them
+    queryset = DataSchemas.objects.all()
+    ids = request.GET.get("ids")
+    if ids:
+        try:
+            queryset = queryset.filter(pk__in=[int(pk) for pk in ids.split(",")])
+        except ValueError:
+            return JsonResponse({"errors": ["ids must be integers"]}, status=400)
+    return JsonResponse({"schemas": export_schemas(queryset)})
+
+
+@replica_reads
+@require_GET
+@condition(etag_func=schema_etag, last_modified_func=schema_last_modified)
+def schema_detail_api(request, pk):
+    schemas = export_schemas(DataSchemas.objects.filter(pk=pk))
+    if not schemas:
+        raise Http404("No schema found")
+    return JsonResponse(schemas[0])
+
+
+@require_POST
+@limit_concurrency("import")
+def schema_import_api(request):
+    # accepts the output of schema_list_api: {"schemas": [...]}, with the
+    # CSRF token in the X-CSRFToken header like the forms of the site
+    try:
+        data = json.loads(request.body)
+        schemas_data = data["schemas"]
+        if not isinstance(schemas_data, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse(
+            {"errors": ['Expected a JSON object like {"schemas": [...]}']}, status=400
+        )
+    try:
+        schemas = import_schemas(schemas_data)
+    except ValidationError as err:
+        return JsonResponse({"errors": err.messages}, status=400)
+    return JsonResponse({"ids": [schema.pk for schema in schemas]}, status=201)
+
+
+@require_POST
+@limit_concurrency("clone")
+def schema_clone_api(request, pk):
+    schema = get_object_or_404(DataSchemas, pk=pk)
+    name = request.POST.get("name")
+    if name is not None:
+        try:
+            DataSchemas(
+                name=name,
+                column_separator=schema.column_separator,
+                string_character=schema.string_character,
+            ).full_clean()
+        except ValidationError as err:
+            return JsonResponse({"errors": err.messages}, status=400)
+    clone = clone_schema(schema, name=name)
+    return JsonResponse(
+        export_schemas(DataSchemas.objects.filter(pk=clone.pk))[0], status=201
+    )
+
+
+@csrf_exempt
+@require_POST
+def schema_validate_csv_api(request, pk):
+    # either a multipart upload in the "file" field, which Django spools to a
+    # temporary file, or the CSV itself as the request body, read as a stream
+    schema = get_object_or_404(DataSchemas, pk=pk)
+    if request.content_type == "multipart/form-data":
+        if "file" not in request.FILES:
+            return JsonResponse({"errors": ["No file uploaded"]}, status=400)
+        stream = request.FILES["file"]
+    else:
+        stream = request
+    summary = validate_csv(
+        schema, stream, has_header=request.GET.get("header", "1") != "0"
+    )
+    return JsonResponse(summary)
@@ -0,0 +1,92 @@
+import asyncio
+from contextvars import ContextVar
+
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.http import FileResponse, StreamingHttpResponse
+
+# Django 3.2's ASGIHandler iterates streaming responses synchronously on the
+# event loop, so generating one chunk of an export would stop every other
+# download of the process. Responses with the AsyncIterationMixin are
+# iterated with `async for` by StreamingASGIHandler instead: each chunk is
+# produced in a worker thread, and the next one is only produced once the
+# server has accepted the previous one, so slow clients get backpressure.
+
+_DONE = object()
+
+asgi_receive = ContextVar("asgi_receive", default=None)
+
+
+class AsyncIterationMixin:
+    def __aiter__(self):
+        return self._async_chunks()
+
+    async def _async_chunks(self):
+        iterator = iter(self)
+        next_chunk = sync_to_async(next, thread_sensitive=False)
+        while True:
+            chunk = await next_chunk(iterator, _DONE)
+            if chunk is _DONE:
+                return
+            yield chunk
+
+
+class AsyncStreamingHttpResponse(AsyncIterationMixin, StreamingHttpResponse):
+    pass
+
+
+class AsyncFileResponse(AsyncIterationMixin, FileResponse):
+    pass
+
+
+class StreamingASGIHandler(ASGIHandler):
+    async def __call__(self, scope, receive, send):
+        token = asgi_receive.set(receive)
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            asgi_receive.reset(token)
+
+    async def send_response(self, response, send):
+        if not hasattr(response, "__aiter__"):
+            return await super().send_response(response, send)
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append(
+                (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": response_headers,
+            }
+        )
+        # the request body has been read by now, so the next message can only
+        # be http.disconnect: stop producing chunks nobody will receive
+        disconnected = asyncio.ensure_future(asgi_receive.get()())
+        try:
+            async for part in response:
+                if disconnected.done():
+                    return
+                for chunk, _ in self.chunk_bytes(part):
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            await send({"type": "http.response.body"})
+        finally:
+            disconnected.cancel()
+            # releases the admission slots and the cached file
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_streaming_asgi_application():
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
@@ -0,0 +1,82 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import metrics
+from .admission import limit_concurrency_async
+from .asgi import AsyncFileResponse, AsyncStreamingHttpResponse
+from .generation import load_columns
+from .models import DataSchemas
+from .routers import replica_reads
+from .views import (
+    all_schemas_etag,
+    all_schemas_last_modified,
+    export_params,
+    export_response,
+)
+
+# Async versions of the schema list and the export, used instead of the
+# views in views.py when the site runs under ASGI (see root_app/asgi.py).
+# Django 3.2 has no async ORM, so queries run through sync_to_async; the
+# export streams through schemas.asgi without blocking the event loop.
+
+
+def require_GET_async(view_func):
+    # django.views.decorators.http only wraps sync views in Django 3.2
+    @wraps(view_func)
+    async def wrapped_view(request, *args, **kwargs):
+        if request.method != "GET":
+            return HttpResponseNotAllowed(["GET"])
+        return await view_func(request, *args, **kwargs)
+
+    return wrapped_view
+
+
+def all_schemas_validators(request):
+    last_modified = all_schemas_last_modified(request)
+    return all_schemas_etag(request), last_modified
+
+
+@replica_reads
+async def all_schemas(request):
+    # same responses as AllSchemasView with its condition() decorator
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    etag, last_modified = await sync_to_async(all_schemas_validators)(request)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        schemas = await sync_to_async(list)(DataSchemas.objects.all())
+        response = await sync_to_async(render)(
+            request,
+            "all_schemas.html",
+            {"object_list": schemas, "dataschemas_list": schemas},
+        )
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+        response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@replica_reads
+@require_GET_async
+@limit_concurrency_async("export")
+async def export_schema(request, pk):
+    schema = await sync_to_async(get_object_or_404)(DataSchemas, pk=pk)
+    params, error_response = export_params(request)
+    if error_response is not None:
+        return error_response
+    metrics.tag(request, "export", format=params[0])
+    columns = await sync_to_async(load_columns)(schema)
+    return await sync_to_async(export_response, thread_sensitive=False)(
+        schema,
+        columns,
+        *params,
+        streaming_class=AsyncStreamingHttpResponse,
+        file_class=AsyncFileResponse,
+    )
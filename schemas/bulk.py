@@ -0,0 +1,176 @@
+from collections import defaultdict
+from itertools import groupby
+
+from django.db import router, transaction
+from django.db.models import Case, Value, When
+
+from schemas.models import (
+    COLUMN_MODELS,
+    FOREIGN_KEY_CH,
+    DataSchemas,
+    ForeignKeyColumn,
+    SchemaColumn,
+)
+from schemas.search_indexes import remove_from_search_index, update_search_index
+
+
+def fetch_inserted_pks(model, objs, using):
+    # Backends without INSERT ... RETURNING (SQLite in Django 3.2) leave
+    # the pks of bulk_create() objects unset. We run inside the same
+    # transaction that holds the database write lock since the first insert,
+    # so the newest len(objs) rows are exactly the ones we have just inserted.
+    if not objs or objs[0].pk is not None:
+        return
+    pks = list(
+        model._base_manager.using(using)
+        .order_by("-pk")
+        .values_list("pk", flat=True)[: len(objs)]
+    )
+    for obj, pk in zip(objs, reversed(pks)):
+        obj.pk = pk
+
+
+def bulk_create_schemas(schemas, batch_size=None, update_index=True):
+    using = router.db_for_write(DataSchemas)
+    with transaction.atomic(using=using):
+        DataSchemas.objects.using(using).bulk_create(schemas, batch_size=batch_size)
+        fetch_inserted_pks(DataSchemas, schemas, using)
+    if update_index:
+        update_search_index(schemas)
+    return schemas
+
+
+def bulk_create_columns(columns, batch_size=None, update_index=True):
+    # Django refuses bulk_create() for multi-table inherited models, so the
+    # SchemaColumn rows are inserted first and then every typed table
+    # (IntegerColumn, PhoneColumn, ...) gets its own batched INSERT.
+    # save() with validate_unique() is skipped, the caller has to pass
+    # columns with unique names and orders.
+    using = router.db_for_write(SchemaColumn)
+    with transaction.atomic(using=using):
+        parents = [
+            SchemaColumn(
+                name=column.name, schema_id=column.schema_id, order=column.order
+            )
+            for column in columns
+        ]
+        SchemaColumn.objects.using(using).bulk_create(parents, batch_size=batch_size)
+        fetch_inserted_pks(SchemaColumn, parents, using)
+        for column, parent in zip(columns, parents):
+            column.id = parent.pk
+            column.pk = parent.pk
+
+        columns_by_model = sorted(columns, key=lambda column: type(column).__name__)
+        for model, model_columns in groupby(columns_by_model, key=type):
+            model_columns = list(model_columns)
+            model._base_manager.using(using)._batched_insert(
+                model_columns, model._meta.local_concrete_fields, batch_size
+            )
+            for column in model_columns:
+                column._state.adding = False
+                column._state.db = using
+
+        DataSchemas.touch(*{column.schema_id for column in columns})
+    if update_index:
+        update_search_index(columns)
+    return columns
+
+
+def clone_schemas(schemas, names=None):
+    # a fixed number of queries whatever the number of schemas and columns:
+    # read the typed columns, insert the schemas, bulk insert the columns
+    schemas = list(schemas)
+    if names is None:
+        max_length = DataSchemas._meta.get_field("name").max_length
+        names = [("Copy of %s" % (schema.name,))[:max_length] for schema in schemas]
+    using = router.db_for_write(DataSchemas)
+    with transaction.atomic(using=using):
+        columns_by_schema = defaultdict(list)
+        for column in (
+            SchemaColumn.objects.using(using)
+            .with_subclasses()
+            .filter(schema__in=[schema.pk for schema in schemas])
+        ):
+            columns_by_schema[column.schema_id].append(column.typed_column)
+        clones = bulk_create_schemas(
+            [
+                DataSchemas(
+                    name=name,
+                    column_separator=schema.column_separator,
+                    string_character=schema.string_character,
+                )
+                for schema, name in zip(schemas, names)
+            ]
+        )
+        sources = [
+            column for schema in schemas for column in columns_by_schema[schema.pk]
+        ]
+        copies = bulk_create_columns(
+            [
+                type(column)(
+                    schema=clone,
+                    name=column.name,
+                    order=column.order,
+                    **column.parameters
+                )
+                for schema, clone in zip(schemas, clones)
+                for column in columns_by_schema[schema.pk]
+            ]
+        )
+        # foreign keys to columns of the cloned schemas reference the copies
+        copy_pks = {source.pk: copy.pk for source, copy in zip(sources, copies)}
+        remapped = {
+            copy.pk: copy_pks[copy.referenced_column_id]
+            for copy in copies
+            if copy.column_type == FOREIGN_KEY_CH
+            and copy.referenced_column_id in copy_pks
+        }
+        if remapped:
+            ForeignKeyColumn._base_manager.using(using).filter(pk__in=remapped).update(
+                referenced_column=Case(
+                    *(When(pk=pk, then=Value(to)) for pk, to in remapped.items())
+                )
+            )
+    return clones
+
+
+def clone_schema(schema, name=None):
+    return clone_schemas([schema], None if name is None else [name])[0]
+
+
+def delete_schemas(queryset):
+    # One DELETE per table instead of Django's collector, which loads every
+    # column first to send the delete signals. The search index documents
+    # are removed here instead. Returns (schemas, columns) deleted.
+    using = router.db_for_write(DataSchemas)
+    with transaction.atomic(using=using):
+        schema_pks = list(queryset.using(using).values_list("pk", flat=True))
+        column_pks = {
+            model: list(
+                model._base_manager.using(using)
+                .filter(schema_id__in=schema_pks)
+                .values_list("pk", flat=True)
+            )
+            for model in COLUMN_MODELS.values()
+        }
+        # what on_delete=SET_NULL does for foreign keys of other schemas
+        referencing = (
+            ForeignKeyColumn._base_manager.using(using)
+            .filter(referenced_column__schema_id__in=schema_pks)
+            .exclude(schema_id__in=schema_pks)
+        )
+        referencing_schema_pks = set(referencing.values_list("schema_id", flat=True))
+        if referencing_schema_pks:
+            referencing.update(referenced_column=None)
+            DataSchemas.touch(*referencing_schema_pks)
+        for model in list(COLUMN_MODELS.values()) + [SchemaColumn]:
+            model._base_manager.using(using).filter(
+                schema_id__in=schema_pks
+            )._raw_delete(using)
+        DataSchemas._base_manager.using(using).filter(pk__in=schema_pks)._raw_delete(
+            using
+        )
+    remove_from_search_index(DataSchemas, schema_pks)
+    for model, pks in column_pks.items():
+        remove_from_search_index(model, pks)
+    return len(schema_pks), sum(len(pks) for pks in column_pks.values())
@@ -0,0 +1,84 @@
+import gzip
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Exports are compressed in blocks of EXPORT_COMPRESSION_BLOCK_BYTES on a
+# pool of EXPORT_COMPRESSION_THREADS threads, zlib and zstandard release the
+# GIL while they compress, and the blocks are written in their order. Every
+# block is a complete gzip member or zstd frame: gzip -d, zcat, zstd -d and
+# Python's gzip module read the concatenation as one file. Every block
+# starts without history, the ratio is a little below that of one stream.
+#
+# At most two blocks per thread are in flight, so memory use does not
+# depend on the size of the export, and the next rows are generated while
+# the previous blocks are compressed.
+
+
+def gzip_block(block, level):
+    return gzip.compress(block, compresslevel=level, mtime=0)
+
+
+def zstd_block(block, level):
+    return zstandard.ZstdCompressor(level=level).compress(block)
+
+
+# method -> (compress a block, default level, file extension, content type),
+# zstd only with the zstandard package installed
+compression_methods = {
+    "gzip": (gzip_block, 6, "gz", "application/gzip"),
+}
+if zstandard is not None:
+    compression_methods["zstd"] = (zstd_block, 3, "zst", "application/zstd")
+
+
+def blocks(chunks, block_bytes):
+    # at least one block, an empty export still becomes a valid file
+    buffer = bytearray()
+    count = 0
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= block_bytes:
+            yield bytes(buffer[:block_bytes])
+            del buffer[:block_bytes]
+            count += 1
+    if buffer or not count:
+        yield bytes(buffer)
+
+
+def compress_chunks(chunks, method="gzip", threads=None, level=None):
+    compress, default_level = compression_methods[method][:2]
+    if level is None:
+        level = default_level
+    if threads is None:
+        threads = settings.EXPORT_COMPRESSION_THREADS
+    block_iterator = blocks(chunks, settings.EXPORT_COMPRESSION_BLOCK_BYTES)
+    if threads <= 1:
+        for block in block_iterator:
+            yield compress(block, level)
+        return
+    executor = ThreadPoolExecutor(threads, thread_name_prefix="compress")
+    pending = deque()
+    try:
+        for block in block_iterator:
+            pending.append(executor.submit(compress, block, level))
+            if len(pending) >= 2 * threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # a client that disconnects closes the generator, blocks not
+        # started yet are dropped
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def compressed_filename(filename, method):
+    return "%s.%s" % (filename, compression_methods[method][2])
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+from schemas.generation import (
+    DEFAULT_CHUNK_SIZE,
+    generate_column_chunks,
+    referenced_column,
+)
+from schemas.models import FOREIGN_KEY_CH
+
+# Generated datasets are stored in DATASET_CACHE_DIR under the hash of
+# everything that decides their content, so a changed schema or column gets
+# a new key and the old file simply ages out. The file mtime is the last use,
+# the least recently used files are removed once the directory grows over
+# DATASET_CACHE_MAX_BYTES.
+#
+# Below it, COLUMNS_DIR keeps the generated values of every column on its
+# own, keyed by a fingerprint of the column definition. A column's values
+# only depend on its own definition, the seed and the row count (see
+# generation.py), so after a schema edit only the edited columns are
+# generated again and the rest are read back from disk.
+
+# bump when the generators change what they produce for the same input
+GENERATOR_VERSION = 2
+
+COLUMNS_DIR = "columns"
+TEMP_PREFIX = ".tmp-"
+# temporary files of exports that died without cleaning up
+STALE_TEMP_SECONDS = 24 * 60 * 60
+
+
+def cache_enabled():
+    return bool(settings.DATASET_CACHE_DIR)
+
+
+def content_hash(description):
+    data = json.dumps(description, sort_keys=True, default=str).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def column_fingerprint(column, rows, seed):
+    # the pk seeds the column's random generator, the name does not matter
+    description = {
+        "generator": GENERATOR_VERSION,
+        "chunk_size": DEFAULT_CHUNK_SIZE,
+        "column": [column.pk, column.column_type, column.parameters],
+        "rows": rows,
+        "seed": seed,
+    }
+    if column.column_type == FOREIGN_KEY_CH:
+        # foreign keys are values of the referenced column
+        referenced = referenced_column(column)
+        if referenced is not None:
+            description["references"] = [
+                referenced.column_type,
+                referenced.parameters,
+            ]
+    return content_hash(description)
+
+
+def dataset_key(schema, columns, rows, export_format, seed):
+    return content_hash(
+        {
+            "generator": GENERATOR_VERSION,
+            "schema": [schema.name, schema.column_separator, schema.string_character],
+            "columns": [
+                [column.name, column_fingerprint(column, rows, seed)]
+                for column in columns
+            ],
+            "format": export_format,
+        }
+    )
+
+
+def dataset_path(key):
+    return os.path.join(settings.DATASET_CACHE_DIR, key)
+
+
+def column_path(fingerprint):
+    return os.path.join(settings.DATASET_CACHE_DIR, COLUMNS_DIR, fingerprint)
+
+
+def open_cached(path):
+    try:
+        cached = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        # evicted in between, the open file stays readable
+        pass
+    return cached
+
+
+def open_cached_dataset(key):
+    return open_cached(dataset_path(key))
+
+
+def read_blocks(cached_file, block_bytes=1024**2):
+    with cached_file:
+        yield from iter(lambda: cached_file.read(block_bytes), b"")
+
+
+def store_chunks(path, chunks, encode=None):
+    # Passes the chunks through while writing them to a temporary file that
+    # replaces `path` once the last chunk is written. A consumer that stops
+    # early, like a client that disconnects, leaves nothing behind.
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temp_file = tempfile.NamedTemporaryFile(
+        dir=directory, prefix=TEMP_PREFIX, delete=False
+    )
+    completed = False
+    try:
+        with temp_file:
+            for chunk in chunks:
+                temp_file.write(encode(chunk) if encode else chunk)
+                yield chunk
+        os.replace(temp_file.name, path)
+        completed = True
+    finally:
+        if not completed:
+            os.unlink(temp_file.name)
+
+
+def cache_dataset(key, chunks):
+    yield from store_chunks(dataset_path(key), chunks)
+    evict_datasets()
+
+
+def encode_column_chunk(values):
+    # one JSON array per chunk and line, json keeps ints, strings and None
+    return json.dumps(values, separators=(",", ":")).encode() + b"\n"
+
+
+def read_column_chunks(column_file):
+    with column_file:
+        for line in column_file:
+            yield json.loads(line)
+
+
+def column_chunks(column, rows, seed):
+    path = column_path(column_fingerprint(column, rows, seed))
+    column_file = open_cached(path)
+    if column_file is not None:
+        return read_column_chunks(column_file)
+    return store_chunks(
+        path, generate_column_chunks(column, rows, seed), encode_column_chunk
+    )
+
+
+def dataset_chunks(columns, rows, seed):
+    # same chunks as generation.generate_chunks(), but only the columns
+    # missing from the store are generated, and those are stored on the way
+    sources = [column_chunks(column, rows, seed) for column in columns]
+    try:
+        for chunk in zip(*sources):
+            yield list(chunk)
+        # zip() stops at the first exhausted source, the others have to
+        # reach their end too for their files to be stored
+        for source in sources:
+            for chunk in source:
+                pass
+    finally:
+        for source in sources:
+            source.close()
+
+
+def cache_files():
+    for directory in (
+        settings.DATASET_CACHE_DIR,
+        os.path.join(settings.DATASET_CACHE_DIR, COLUMNS_DIR),
+    ):
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def evict_datasets(max_bytes=None):
+    # datasets and stored columns share the size limit
+    if max_bytes is None:
+        max_bytes = settings.DATASET_CACHE_MAX_BYTES
+    cached = []
+    total_size = 0
+    now = time.time()
+    for entry in cache_files():
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if entry.name.startswith(TEMP_PREFIX):
+            if stat.st_mtime < now - STALE_TEMP_SECONDS:
+                remove_cached(entry.path)
+            continue
+        cached.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size += stat.st_size
+    cached.sort()
+    for mtime, size, path in cached:
+        if total_size <= max_bytes:
+            break
+        remove_cached(path)
+        total_size -= size
+
+
+def remove_cached(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,191 @@
+import csv
+import io
+import struct
+from itertools import chain, repeat
+
+from schemas.generation import VALUE_MAX_LENGTHS, generate_chunks, value_column_type
+from schemas.models import INTEGER_CH
+
+# Every writer takes the schema, its columns and the chunks produced by
+# generation.generate_chunks() and yields the encoded output chunk by chunk,
+# so an export of any size needs the memory of one chunk only.
+
+INSERT_BATCH_SIZE = 1000
+
+COPY_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+PGCOPY_NULL = struct.pack(">i", -1)
+pack_pgcopy_int4 = struct.Struct(">ii").pack
+pack_pgcopy_length = struct.Struct(">i").pack
+
+
+def quote_identifier(name):
+    return '"%s"' % (name.replace('"', '""'),)
+
+
+def sql_type(column):
+    column_type = value_column_type(column)
+    if column_type == INTEGER_CH:
+        return "integer"
+    return "varchar(%s)" % (VALUE_MAX_LENGTHS[column_type],)
+
+
+def create_table_sql(schema, columns):
+    column_definitions = ",\n".join(
+        "    %s %s" % (quote_identifier(column.name), sql_type(column))
+        for column in columns
+    )
+    return "CREATE TABLE %s (\n%s\n);\n" % (
+        quote_identifier(schema.name),
+        column_definitions,
+    )
+
+
+def column_list_sql(columns):
+    return ", ".join(quote_identifier(column.name) for column in columns)
+
+
+def write_csv(schema, columns, chunks):
+    def encode(rows):
+        buffer = io.StringIO()
+        writer = csv.writer(
+            buffer,
+            delimiter=schema.column_separator,
+            quotechar=schema.string_character,
+            quoting=csv.QUOTE_NONNUMERIC,
+            lineterminator="\n",
+        )
+        writer.writerows(rows)
+        return buffer.getvalue().encode()
+
+    yield encode([[column.name for column in columns]])
+    for chunk in chunks:
+        yield encode(zip(*chunk))
+
+
+def copy_text_integers(values):
+    return ["\\N" if value is None else str(value) for value in values]
+
+
+def copy_text_strings(values):
+    return [
+        "\\N" if value is None else value.translate(COPY_TEXT_ESCAPES)
+        for value in values
+    ]
+
+
+def write_copy_text(schema, columns, chunks):
+    # psql script: CREATE TABLE followed by COPY ... FROM STDIN in text format
+    encoders = [
+        (
+            copy_text_integers
+            if value_column_type(column) == INTEGER_CH
+            else copy_text_strings
+        )
+        for column in columns
+    ]
+    yield create_table_sql(schema, columns).encode()
+    yield (
+        "COPY %s (%s) FROM STDIN;\n"
+        % (quote_identifier(schema.name), column_list_sql(columns))
+    ).encode()
+    for chunk in chunks:
+        fields = [encode(values) for encode, values in zip(encoders, chunk)]
+        yield ("\n".join(map("\t".join, zip(*fields))) + "\n").encode()
+    yield b"\\.\n"
+
+
+def pgcopy_integers(values):
+    return [
+        PGCOPY_NULL if value is None else pack_pgcopy_int4(4, value) for value in values
+    ]
+
+
+def pgcopy_strings(values):
+    pieces = []
+    for value in values:
+        if value is None:
+            pieces.append(PGCOPY_NULL)
+        else:
+            data = value.encode()
+            pieces.append(pack_pgcopy_length(len(data)) + data)
+    return pieces
+
+
+def write_copy_binary(schema, columns, chunks):
+    # COPY binary format payload, to be loaded with
+    # COPY table FROM STDIN WITH (FORMAT binary), table from the "ddl" export
+    encoders = [
+        pgcopy_integers if value_column_type(column) == INTEGER_CH else pgcopy_strings
+        for column in columns
+    ]
+    field_count = struct.pack(">h", len(columns))
+    yield PGCOPY_HEADER
+    for chunk in chunks:
+        fields = [encode(values) for encode, values in zip(encoders, chunk)]
+        yield b"".join(chain.from_iterable(zip(repeat(field_count), *fields)))
+    yield PGCOPY_TRAILER
+
+
+def sql_literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, int):
+        return str(value)
+    return "'%s'" % (value.replace("'", "''"),)
+
+
+def write_inserts(schema, columns, chunks):
+    # psql script: CREATE TABLE and multi-row INSERTs in one transaction
+    insert = "INSERT INTO %s (%s) VALUES\n" % (
+        quote_identifier(schema.name),
+        column_list_sql(columns),
+    )
+    yield ("BEGIN;\n" + create_table_sql(schema, columns)).encode()
+    for chunk in chunks:
+        rows = [
+            "(%s)" % ", ".join(row)
+            for row in zip(*[map(sql_literal, values) for values in chunk])
+        ]
+        yield "".join(
+            insert + ",\n".join(rows[start : start + INSERT_BATCH_SIZE]) + ";\n"
+            for start in range(0, len(rows), INSERT_BATCH_SIZE)
+        ).encode()
+    yield b"COMMIT;\n"
+
+
+def write_ddl(schema, columns, chunks):
+    yield create_table_sql(schema, columns).encode()
+
+
+# format -> (writer, content type, file extension)
+export_formats = {
+    "csv": (write_csv, "text/csv", "csv"),
+    "copy": (write_copy_text, "application/sql", "sql"),
+    "copy-binary": (write_copy_binary, "application/octet-stream", "pgcopy"),
+    "insert": (write_inserts, "application/sql", "sql"),
+    "ddl": (write_ddl, "application/sql", "sql"),
+}
+
+EXPORT_FORMAT_CHOICES = [
+    ("csv", "CSV"),
+    ("copy", "PostgreSQL COPY script"),
+    ("copy-binary", "PostgreSQL binary COPY data"),
+    ("insert", "SQL INSERT script"),
+    ("ddl", "CREATE TABLE only"),
+]
+
+
+def export_schema(schema, columns, rows, export_format="csv", seed=0, chunks=None):
+    # chunks default to freshly generated ones, the dataset cache passes
+    # chunks read back from its stored columns instead
+    if chunks is None:
+        chunks = generate_chunks(columns, rows, seed)
+    writer = export_formats[export_format][0]
+    return writer(schema, columns, chunks)
+
+
+def export_filename(schema, export_format):
+    return "schema_%s.%s" % (schema.pk, export_formats[export_format][2])
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from django import forms
 from django.forms import ModelForm
 from crispy_forms.helper import FormHelper
@@ -11,10 +13,49 @@ from crispy_forms.layout import (
     Hidden,
     ButtonHolder,
     HTML,
+    LayoutObject,
 )
 from crispy_forms.bootstrap import FormActions
+from django.template.loader import render_to_string
 from schemas.models import *
 from django.apps import apps
+from schemas.tracing import span, traced
+
+
+class TracedFormHelper(FormHelper):
+    def render_layout(self, *args, **kwargs):
+        with span("crispy.layout"):
+            return super().render_layout(*args, **kwargs)
+
+
+class ColumnRows(LayoutObject):
+    # Crispy renders every field and button of a row through its own
+    # templates, for wide schemas most of the page's CPU time. Unbound forms
+    # get the same markup from schema_column_rows.html in one loop instead,
+    # bound ones (values and errors to show) the crispy rows.
+    template = "schema_column_rows.html"
+
+    def __init__(self, rows, columns, compiled=True):
+        self.fields = list(rows)
+        self.columns = columns
+        self.compiled = compiled
+
+    def render(self, form, form_style, context, template_pack="bootstrap4", **kwargs):
+        if not self.compiled or form.is_bound or template_pack != "bootstrap4":
+            return self.get_rendered_fields(
+                form, form_style, context, template_pack, **kwargs
+            )
+        rows = []
+        for pk in self.columns:
+            names = ["col_%s_%s" % (field, pk) for field in ("name", "type", "order")]
+            if hasattr(form, "rendered_fields"):
+                form.rendered_fields.update(names)
+            name, column_type, order = [form.fields[name].initial for name in names]
+            column_type = column_type[0] if column_type else None
+            rows.append({"pk": pk, "name": name, "type": column_type, "order": order})
+        return render_to_string(
+            self.template, {"rows": rows, "type_choices": COLUMN_TYPE_CHOICES}
+        )
 
 
 class DataSchemaForm(forms.Form):
@@ -27,12 +68,18 @@ class DataSchemaForm(forms.Form):
     string_character = forms.ChoiceField(
         label="String character", choices=STRING_CHARACTER_CHOICES
     )
+    # the schema version the page was rendered with, see SchemaView
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
 
     # i_want_to_add_a_new_column = forms.BooleanField(required=False)
 
+    compiled_rows = True
+
+    @traced("form.init")
     def __init__(self, *args, **kwargs):
         # print("Inside DataSchemaForm Init")
         schema_pk = kwargs.pop("schema_pk")
+        compiled_rows = kwargs.pop("compiled_rows", self.compiled_rows)
 
         subclasses = [
             str(subClass).split(".")[-1][:-2].lower()
@@ -45,6 +92,7 @@ class DataSchemaForm(forms.Form):
             "jobcolumn": JOB_CH,
             "companycolumn": COMPANY_CH,
             "phonecolumn": PHONE_CH,
+            "foreignkeycolumn": FOREIGN_KEY_CH,
         }
 
         coulmn_rows = []
@@ -66,6 +114,8 @@ class DataSchemaForm(forms.Form):
                 range_high=40,
             )
 
+        self.schema = schema
+        self.fields["version"].initial = schema.version
         self.fields["name"].initial = schema.name
         self.fields["column_separator"].initial = schema.column_separator
         self.fields["string_character"].initial = schema.string_character
@@ -118,7 +168,7 @@ class DataSchemaForm(forms.Form):
 
             coulmn_rows.append(current_row)
 
-        self.helper = FormHelper()
+        self.helper = TracedFormHelper()
 
         submit_form_btn = "submit_form_%s" % (schema.pk,)
 
@@ -135,13 +185,18 @@ class DataSchemaForm(forms.Form):
                 ),
                 Field("column_separator", css_class="form-group col-md-6 mb-0"),
                 Field("string_character", css_class="form-group col-md-6 mb-0"),
+                "version",
             )
         )
 
         self.helper.layout.append(Fieldset("Schema Column", css_class="fieldsets"))
-        for coulmn_row in coulmn_rows:
-            # print(coulmn_row)
-            self.helper.layout[-1].append(coulmn_row)
+        self.helper.layout[-1].append(
+            ColumnRows(
+                coulmn_rows,
+                [column.pk for column in schema_columns],
+                compiled=compiled_rows,
+            )
+        )
 
         current_row = Row(
             HTML(
@@ -169,3 +224,35 @@ class DataSchemaForm(forms.Form):
 
         add_column_btn = "add_column_btn_%s" % (schema.pk,)
         self.helper.layout.append(Submit(add_column_btn, "Add New Column"))
+
+
+def referenced_column_label(column):
+    return "%s: %s" % (column.schema.name, column.name)
+
+
+@lru_cache(maxsize=None)
+def column_form_class(model_class):
+    # one class per column type for the life of the process, building a
+    # ModelForm class runs the metaclass over all the model fields
+    class ColumnFormGeneral(ModelForm):
+        version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+        def __init__(self, *args, column_pk, **kwargs):
+            super(ColumnFormGeneral, self).__init__(*args, **kwargs)
+            self.helper = FormHelper(self)
+            save_chng_btn = "save_schema_columns_chng_btn_%s" % (column_pk,)
+            self.helper.layout.append(Submit(save_chng_btn, "Save changes"))
+            if "referenced_column" in self.fields:
+                field = self.fields["referenced_column"]
+                field.queryset = (
+                    SchemaColumn.objects.filter(foreignkeycolumn__isnull=True)
+                    .select_related("schema")
+                    .order_by("schema__name", "schema_id", "order")
+                )
+                field.label_from_instance = referenced_column_label
+
+        class Meta:
+            model = model_class
+            exclude = ["schema", "order"]
+
+    return ColumnFormGeneral
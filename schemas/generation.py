@@ -0,0 +1,335 @@
+import random
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy
+from django.conf import settings
+
+from schemas.models import (
+    INTEGER_CH,
+    FULLNAME_CH,
+    JOB_CH,
+    PHONE_CH,
+    COMPANY_CH,
+    FOREIGN_KEY_CH,
+    IntegerColumn,
+    FullNameColumn,
+    JobColumn,
+    CompanyColumn,
+    PhoneColumn,
+    UNIFORM,
+    NORMAL,
+    ZIPF,
+    SEQUENTIAL,
+)
+from schemas.tracing import span
+
+DEFAULT_CHUNK_SIZE = 10000
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael",
+    "Linda", "William", "Elizabeth", "David", "Barbara", "Richard", "Susan",
+    "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen", "Anna",
+    "Peter", "Maria", "Jan", "Eva", "Martin", "Lucia", "Tomas", "Zuzana",
+]  # fmt: skip
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller",
+    "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez",
+    "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Lee", "Novak", "Horvath", "Kovac", "Varga", "Toth", "Nagy", "Balaz",
+]  # fmt: skip
+JOBS = [
+    "Accountant", "Architect", "Baker", "Carpenter", "Chemist", "Data Analyst",
+    "Dentist", "Designer", "Electrician", "Engineer", "Journalist", "Lawyer",
+    "Librarian", "Mechanic", "Nurse", "Pharmacist", "Photographer", "Pilot",
+    "Plumber", "Professor", "Programmer", "Sales Manager", "Surgeon", "Teacher",
+]  # fmt: skip
+COMPANIES = [
+    "Acme Corp", "Globex", "Initech", "Umbrella", "Hooli", "Stark Industries",
+    "Wayne Enterprises", "Wonka Industries", "Cyberdyne Systems", "Soylent",
+    "Tyrell Corporation", "Vandelay Industries", "Massive Dynamic", "Aperture",
+    "Oscorp", "Gringotts", "Monsters Inc", "Pied Piper", "Dunder Mifflin",
+]  # fmt: skip
+
+# longest value each column type can produce, used for SQL types and validation
+VALUE_MAX_LENGTHS = {
+    FULLNAME_CH: FullNameColumn._meta.get_field("first_name").max_length
+    + 1
+    + FullNameColumn._meta.get_field("last_name").max_length,
+    JOB_CH: JobColumn._meta.get_field("job_name").max_length,
+    COMPANY_CH: CompanyColumn._meta.get_field("company_name").max_length,
+    PHONE_CH: PhoneColumn._meta.get_field("phone_number").max_length,
+}
+
+# Every generator returns the values of one column for rows
+# start .. start + size - 1. Columns are generated independently, each with
+# its own random generator seeded from (seed, column pk), so a column's
+# values do not depend on the other columns of the schema.
+
+
+def integer_range(column):
+    low = column.range_low
+    high = column.range_high
+    if low is None:
+        low = IntegerColumn._meta.get_field("range_low").default
+    if high is None:
+        high = IntegerColumn._meta.get_field("range_high").default
+    if low > high:
+        low, high = high, low
+    return low, high
+
+
+# Integer values are drawn as whole numpy arrays per chunk. The numpy
+# generator of each chunk is seeded from the column's random.Random, which
+# keeps the output reproducible and independent of the other columns.
+
+
+def uniform_integers(column, rng, size, start, low, high):
+    return rng.integers(low, high, size, endpoint=True)
+
+
+def normal_integers(column, rng, size, start, low, high):
+    # centered in the range, which holds +-3 standard deviations
+    values = rng.normal((low + high) / 2, max(high - low, 1) / 6, size)
+    return numpy.clip(numpy.rint(values), low, high).astype(numpy.int64)
+
+
+def zipf_integers(column, rng, size, start, low, high):
+    # low is the most frequent value, draws past the range are drawn again
+    ranks = rng.zipf(column.zipf_exponent, size)
+    outside = ranks > high - low + 1
+    while outside.any():
+        ranks[outside] = rng.zipf(column.zipf_exponent, int(outside.sum()))
+        outside = ranks > high - low + 1
+    return ranks + (low - 1)
+
+
+def sequential_integers(column, rng, size, start, low, high):
+    # wraps around to low when the range is used up
+    return low + numpy.arange(start, start + size, dtype=numpy.int64) % (high - low + 1)
+
+
+integer_distributions = {
+    UNIFORM: uniform_integers,
+    NORMAL: normal_integers,
+    ZIPF: zipf_integers,
+    SEQUENTIAL: sequential_integers,
+}
+
+
+def generate_integers(column, rng, size, start):
+    low, high = integer_range(column)
+    chunk_rng = numpy.random.default_rng(rng.getrandbits(64))
+    values = integer_distributions[column.distribution](
+        column, chunk_rng, size, start, low, high
+    ).tolist()
+    if column.null_ratio:
+        for index in numpy.flatnonzero(
+            chunk_rng.random(size) < column.null_ratio
+        ).tolist():
+            values[index] = None
+    return values
+
+
+def generate_fullnames(column, rng, size, start):
+    first_names = [column.first_name] if column.first_name else FIRST_NAMES
+    last_names = [column.last_name] if column.last_name else LAST_NAMES
+    return [
+        "%s %s" % names
+        for names in zip(
+            rng.choices(first_names, k=size), rng.choices(last_names, k=size)
+        )
+    ]
+
+
+def generate_jobs(column, rng, size, start):
+    if column.job_name:
+        return [column.job_name] * size
+    return rng.choices(JOBS, k=size)
+
+
+def generate_companies(column, rng, size, start):
+    if column.company_name:
+        return [column.company_name] * size
+    return rng.choices(COMPANIES, k=size)
+
+
+def generate_phones(column, rng, size, start):
+    if column.phone_number:
+        return [column.phone_number] * size
+    return ["+1%010d" % rng.randrange(10**10) for _ in range(size)]
+
+
+column_generators = {
+    INTEGER_CH: generate_integers,
+    FULLNAME_CH: generate_fullnames,
+    JOB_CH: generate_jobs,
+    PHONE_CH: generate_phones,
+    COMPANY_CH: generate_companies,
+}
+
+
+def load_columns(schema):
+    return [
+        column.typed_column
+        for column in schema.schemacolumn_set.with_subclasses().order_by("order")
+    ]
+
+
+def column_rng(column, seed):
+    return random.Random("%s:%s" % (seed, column.pk))
+
+
+def referenced_column(column):
+    # the typed column a foreign key column takes its values from, or None
+    if column.referenced_column_id is None:
+        return None
+    return column.referenced_column.typed_column
+
+
+def value_column_type(column):
+    # the type of the values a column produces, for foreign keys the type
+    # of the referenced column
+    if column.column_type != FOREIGN_KEY_CH:
+        return column.column_type
+    referenced = referenced_column(column)
+    return INTEGER_CH if referenced is None else referenced.column_type
+
+
+# A foreign key column samples its values from a key pool: the values the
+# referenced column has in the first parent_rows rows, NULLs left out. The
+# pool is generated again from the referenced column alone, which gives the
+# values of the parent's own export with the same seed, so every key exists
+# in the parent table. Integer pools use the smallest dtype that holds them.
+# Pools that may take more than FOREIGN_KEY_POOL_MEMORY_BYTES are written
+# chunk by chunk to a temporary file that is memory-mapped, the page cache
+# then decides how much of it is held in memory. The most recently used pools
+# are kept per (referenced column, its parameters, parent_rows, seed) up to
+# FOREIGN_KEY_POOL_CACHE_BYTES in total, so repeated exports and previews of
+# a schema do not generate them again.
+
+key_pools = OrderedDict()
+key_pools_lock = threading.Lock()
+
+
+def pool_dtype(column):
+    if value_column_type(column) == INTEGER_CH:
+        return numpy.dtype(numpy.int64)
+    return numpy.dtype("U%s" % (VALUE_MAX_LENGTHS[column.column_type],))
+
+
+def key_pool(column, seed):
+    referenced = referenced_column(column)
+    if referenced is None or column.parent_rows == 0:
+        return numpy.empty(0, dtype=numpy.int64)
+    # at most parent_rows keys, before NULLs are left out
+    in_memory = (
+        column.parent_rows * pool_dtype(referenced).itemsize
+        <= settings.FOREIGN_KEY_POOL_MEMORY_BYTES
+    )
+    key = (
+        referenced.pk,
+        referenced.column_type,
+        tuple(sorted(referenced.parameters.items())),
+        column.parent_rows,
+        seed,
+        in_memory,
+    )
+    with key_pools_lock:
+        pool = key_pools.get(key)
+        if pool is not None:
+            key_pools.move_to_end(key)
+            return pool
+    pool = generate_key_pool(referenced, column.parent_rows, seed, in_memory)
+    if pool.nbytes > settings.FOREIGN_KEY_POOL_CACHE_BYTES:
+        return pool
+    with key_pools_lock:
+        key_pools[key] = pool
+        cached_bytes = sum(cached.nbytes for cached in key_pools.values())
+        while cached_bytes > settings.FOREIGN_KEY_POOL_CACHE_BYTES:
+            cached_bytes -= key_pools.popitem(last=False)[1].nbytes
+    return pool
+
+
+def generate_key_pool(referenced, parent_rows, seed, in_memory):
+    chunks = (
+        [value for value in chunk if value is not None]
+        for chunk in generate_column_chunks(referenced, parent_rows, seed)
+    )
+    dtype = pool_dtype(referenced)
+    if in_memory:
+        pool = numpy.fromiter(
+            (value for chunk in chunks for value in chunk), dtype=dtype
+        )
+        if dtype.kind == "i" and len(pool):
+            pool = pool.astype(
+                numpy.promote_types(
+                    numpy.min_scalar_type(pool.min()), numpy.min_scalar_type(pool.max())
+                )
+            )
+        return pool
+    with tempfile.TemporaryFile(prefix="key-pool-") as pool_file:
+        size = 0
+        for chunk in chunks:
+            numpy.asarray(chunk, dtype=dtype).tofile(pool_file)
+            size += len(chunk)
+        pool_file.flush()
+        if size == 0:
+            return numpy.empty(0, dtype=dtype)
+        # the mapping stays valid after the file is closed and deleted
+        return numpy.memmap(pool_file, dtype=dtype, mode="r", shape=(size,))
+
+
+def foreign_key_generator(column, seed):
+    pool = key_pool(column, seed)
+
+    def generate_foreign_keys(column, rng, size, start):
+        if not len(pool):
+            return [None] * size
+        chunk_rng = numpy.random.default_rng(rng.getrandbits(64))
+        positions = integer_distributions[column.distribution](
+            column, chunk_rng, size, start, 0, len(pool) - 1
+        )
+        values = pool[positions].tolist()
+        if column.null_ratio:
+            for index in numpy.flatnonzero(
+                chunk_rng.random(size) < column.null_ratio
+            ).tolist():
+                values[index] = None
+        return values
+
+    return generate_foreign_keys
+
+
+# column types whose generator needs setting up once per column and seed
+generator_factories = {
+    FOREIGN_KEY_CH: foreign_key_generator,
+}
+
+
+def column_generator(column, seed):
+    factory = generator_factories.get(column.column_type)
+    if factory is not None:
+        return factory(column, seed)
+    return column_generators[column.column_type]
+
+
+def generate_column_chunks(column, rows, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    generator = column_generator(column, seed)
+    rng = column_rng(column, seed)
+    for start in range(0, rows, chunk_size):
+        size = min(chunk_size, rows - start)
+        with span("generate.chunk", column=column.name, rows=size):
+            chunk = generator(column, rng, size, start)
+        yield chunk
+
+
+def generate_chunks(columns, rows, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    # yields one list of values per column for every chunk of rows,
+    # memory use depends on chunk_size only
+    column_chunks = [
+        generate_column_chunks(column, rows, seed, chunk_size) for column in columns
+    ]
+    for chunk in zip(*column_chunks):
+        yield list(chunk)
@@ -0,0 +1,12 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from schemas.admission import admission_stats
+
+
+class Command(BaseCommand):
+    help = "Prints the admission control counters and current slot use as JSON"
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(admission_stats(), indent=2))
@@ -0,0 +1,123 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from schemas.compression import compress_chunks, compression_methods
+from schemas.exports import export_formats, export_schema
+from schemas.generation import load_columns
+from schemas.models import DataSchemas
+from schemas.sharding import MANIFEST_NAME, export_shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates rows for a schema and writes them as CSV, COPY or INSERT SQL, "
+        "optionally compressed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("schema_pk", type=int)
+        parser.add_argument("--rows", type=int, default=100)
+        parser.add_argument("--format", choices=list(export_formats), default="csv")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", help="File to write, standard output if not set"
+        )
+        parser.add_argument("--compress", choices=list(compression_methods))
+        parser.add_argument(
+            "--threads",
+            type=int,
+            help="Compression threads, EXPORT_COMPRESSION_THREADS if not set",
+        )
+        parser.add_argument("--level", type=int, help="Compression level")
+        shards = parser.add_mutually_exclusive_group()
+        shards.add_argument(
+            "--shards",
+            type=int,
+            help="Split the rows into this many files of equal row counts "
+            "in the --output directory, with a manifest.json",
+        )
+        shards.add_argument(
+            "--shard-bytes",
+            type=int,
+            help="Split the output into files of about this many bytes, "
+            "uncompressed",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Keep the shards of an interrupted run with the same arguments",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            schema = DataSchemas.objects.get(pk=options["schema_pk"])
+        except DataSchemas.DoesNotExist:
+            raise CommandError("Schema %s does not exist" % (options["schema_pk"],))
+        if options["rows"] < 0:
+            raise CommandError("--rows must not be negative")
+        if options["shards"] is not None or options["shard_bytes"] is not None:
+            return self.export_shards(schema, options)
+        chunks = export_schema(
+            schema,
+            load_columns(schema),
+            options["rows"],
+            options["format"],
+            options["seed"],
+        )
+        if options["compress"]:
+            chunks = compress_chunks(
+                chunks, options["compress"], options["threads"], options["level"]
+            )
+        if options["output"]:
+            try:
+                output = open(options["output"], "wb")
+            except OSError as err:
+                raise CommandError(err)
+        else:
+            output = sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+            else:
+                output.flush()
+
+    def export_shards(self, schema, options):
+        if not options["output"]:
+            raise CommandError("Sharded exports need an --output directory")
+        shard_rows = None
+        if options["shards"] is not None:
+            if options["shards"] < 1:
+                raise CommandError("--shards must be positive")
+            shard_rows = max(-(-options["rows"] // options["shards"]), 1)
+        elif options["shard_bytes"] < 1:
+            raise CommandError("--shard-bytes must be positive")
+        try:
+            manifest = export_shards(
+                schema,
+                load_columns(schema),
+                options["rows"],
+                options["format"],
+                options["seed"],
+                options["output"],
+                shard_rows=shard_rows,
+                shard_bytes=options["shard_bytes"],
+                compression=options["compress"],
+                threads=options["threads"],
+                level=options["level"],
+                resume=options["resume"],
+            )
+        except (ValueError, OSError) as err:
+            raise CommandError(err)
+        self.stdout.write(
+            "%s shards, %s bytes, manifest in %s"
+            % (
+                len(manifest["shards"]),
+                sum(shard["bytes"] for shard in manifest["shards"]),
+                os.path.join(options["output"], MANIFEST_NAME),
+            )
+        )
@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from schemas.exports import export_filename, export_formats, export_schema
+from schemas.generation import load_columns
+from schemas.models import DataSchemas
+from schemas.relations import dataset_plan
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports schemas together with the schemas their foreign keys "
+        "reference, parent tables first, into one file per table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("schemas", nargs="+", type=int, metavar="schema_pk")
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=1000,
+            help="Rows of the tables no foreign key references, the others "
+            "get the parent_rows of their foreign keys",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--format", choices=export_formats, default="csv")
+        parser.add_argument("--output", default=".", help="Directory of the files")
+
+    def handle(self, *args, **options):
+        if options["rows"] < 0:
+            raise CommandError("--rows must not be negative")
+        schemas = DataSchemas.objects.in_bulk(options["schemas"])
+        missing = set(options["schemas"]) - set(schemas)
+        if missing:
+            raise CommandError(
+                "No schema with pk %s" % ", ".join(map(str, sorted(missing)))
+            )
+        try:
+            plan = dataset_plan(schemas.values(), options["rows"])
+        except ValidationError as err:
+            raise CommandError("; ".join(err.messages))
+        os.makedirs(options["output"], exist_ok=True)
+        for position, (schema, rows) in enumerate(plan, start=1):
+            path = os.path.join(
+                options["output"],
+                "%02d_%s" % (position, export_filename(schema, options["format"])),
+            )
+            started = time.perf_counter()
+            with open(path, "wb") as output:
+                for chunk in export_schema(
+                    schema,
+                    load_columns(schema),
+                    rows,
+                    options["format"],
+                    options["seed"],
+                ):
+                    output.write(chunk)
+            self.stdout.write(
+                "%s: %s rows of %s in %.1f s"
+                % (path, rows, schema.name, time.perf_counter() - started)
+            )
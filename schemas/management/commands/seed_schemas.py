@@ -0,0 +1,193 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from schemas.bulk import bulk_create_columns, bulk_create_schemas
+from schemas.generation import COMPANIES, FIRST_NAMES, JOBS, LAST_NAMES
+from schemas.models import (
+    COLUMN_MODELS,
+    COLUMN_SEPARATOR_CHOICES,
+    DISTRIBUTION_CHOICES,
+    STRING_CHARACTER_CHOICES,
+    CompanyColumn,
+    DataSchemas,
+    ForeignKeyColumn,
+    FullNameColumn,
+    IntegerColumn,
+    JobColumn,
+    PhoneColumn,
+)
+
+# share of the non-integer columns with a fixed value instead of random ones
+FIXED_VALUE_RATIO = 0.1
+
+
+def integer_parameters(rng):
+    low = rng.randint(-1000, 1000)
+    return {
+        "range_low": low,
+        "range_high": low + rng.choice([1, 10, 100, 1000, 100000]),
+        "distribution": rng.choice(DISTRIBUTION_CHOICES)[0],
+        "zipf_exponent": rng.choice([1.1, 1.5, 2.0, 3.0]),
+        "null_ratio": rng.choice([0.0, 0.0, 0.0, 0.05, 0.5]),
+    }
+
+
+def fixed_value(rng, values, max_length):
+    if rng.random() >= FIXED_VALUE_RATIO:
+        return None
+    return rng.choice([value for value in values if len(value) <= max_length])
+
+
+def fullname_parameters(rng):
+    return {
+        "first_name": fixed_value(rng, FIRST_NAMES, 10),
+        "last_name": fixed_value(rng, LAST_NAMES, 15),
+    }
+
+
+def job_parameters(rng):
+    return {"job_name": fixed_value(rng, JOBS, 100)}
+
+
+def company_parameters(rng):
+    return {"company_name": fixed_value(rng, COMPANIES, 100)}
+
+
+def phone_parameters(rng):
+    phone = "+1%010d" % rng.randrange(10**10)
+    return {"phone_number": fixed_value(rng, [phone], 17)}
+
+
+def foreign_key_parameters(rng):
+    # without a referenced column, the values are all empty
+    return {
+        "parent_rows": rng.choice([10, 1000, 100000]),
+        "distribution": rng.choice(DISTRIBUTION_CHOICES)[0],
+        "zipf_exponent": rng.choice([1.1, 1.5, 2.0, 3.0]),
+        "null_ratio": rng.choice([0.0, 0.0, 0.0, 0.05, 0.5]),
+    }
+
+
+column_parameters = {
+    IntegerColumn: integer_parameters,
+    FullNameColumn: fullname_parameters,
+    JobColumn: job_parameters,
+    CompanyColumn: company_parameters,
+    PhoneColumn: phone_parameters,
+    ForeignKeyColumn: foreign_key_parameters,
+}
+
+
+def parse_weights(value):
+    # "IntegerColumn=3,PhoneColumn=1" -> {IntegerColumn: 3.0, PhoneColumn: 1.0}
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        model = COLUMN_MODELS.get(name.strip())
+        if model is None:
+            raise CommandError(
+                "Unknown column type %r, use one of %s"
+                % (name.strip(), ", ".join(COLUMN_MODELS))
+            )
+        try:
+            weights[model] = float(weight or 1)
+        except ValueError:
+            raise CommandError("Invalid weight %r for %s" % (weight, name))
+    if not any(weight > 0 for weight in weights.values()):
+        raise CommandError("At least one column type needs a positive weight")
+    return weights
+
+
+def make_columns(rng, schema, count, weights):
+    models = rng.choices(list(weights), weights=list(weights.values()), k=count)
+    return [
+        model(
+            schema=schema,
+            name="%s_%s" % (model.__name__[: -len("Column")].lower(), order),
+            order=order,
+            **column_parameters[model](rng)
+        )
+        for order, model in enumerate(models, start=1)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates schemas with random columns of every type, "
+        "for profiling and benchmarks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--schemas", type=int, default=100)
+        parser.add_argument("--min-columns", type=int, default=5)
+        parser.add_argument("--max-columns", type=int, default=30)
+        parser.add_argument(
+            "--types",
+            help="Column type weights, e.g. IntegerColumn=3,PhoneColumn=1, "
+            "all types equally likely if not set",
+        )
+        parser.add_argument("--name-prefix", default="Seed schema")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Columns per transaction and per INSERT batch",
+        )
+        parser.add_argument(
+            "--skip-search-index",
+            action="store_true",
+            help="Leave the search index alone, run rebuild_index afterwards",
+        )
+
+    def handle(self, *args, **options):
+        min_columns, max_columns = options["min_columns"], options["max_columns"]
+        if options["schemas"] < 0 or not 0 <= min_columns <= max_columns:
+            raise CommandError(
+                "--schemas must not be negative and "
+                "0 <= --min-columns <= --max-columns"
+            )
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        if options["types"]:
+            weights = parse_weights(options["types"])
+        else:
+            weights = {model: 1.0 for model in COLUMN_MODELS.values()}
+        rng = random.Random(options["seed"])
+        update_index = not options["skip_search_index"]
+        started = time.perf_counter()
+        schema_count = column_count = 0
+        # schemas are created in groups of about batch_size columns, so
+        # memory use does not grow with the number of schemas
+        schemas_per_batch = max(options["batch_size"] // max(max_columns, 1), 1)
+        while schema_count < options["schemas"]:
+            batch = min(schemas_per_batch, options["schemas"] - schema_count)
+            schemas = [
+                DataSchemas(
+                    name="%s %s" % (options["name_prefix"], schema_count + index + 1),
+                    column_separator=rng.choice(COLUMN_SEPARATOR_CHOICES)[0],
+                    string_character=rng.choice(STRING_CHARACTER_CHOICES)[0],
+                )
+                for index in range(batch)
+            ]
+            bulk_create_schemas(schemas, update_index=update_index)
+            columns = []
+            for schema in schemas:
+                count = rng.randint(min_columns, max_columns)
+                columns += make_columns(rng, schema, count, weights)
+            bulk_create_columns(
+                columns, batch_size=options["batch_size"], update_index=update_index
+            )
+            schema_count += batch
+            column_count += len(columns)
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    "%s schemas, %s columns" % (schema_count, column_count)
+                )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            "Created %s schemas with %s columns in %.1f s (%.0f columns/s)"
+            % (schema_count, column_count, elapsed, column_count / (elapsed or 1))
+        )
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from schemas.models import DataSchemas
+from schemas.validation import validate_csv
+
+
+class Command(BaseCommand):
+    help = "Checks a CSV file against a schema and prints an error summary as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("schema_pk", type=int)
+        parser.add_argument("path")
+        parser.add_argument("--no-header", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument("--max-errors", type=int, default=100)
+
+    def handle(self, *args, **options):
+        try:
+            schema = DataSchemas.objects.get(pk=options["schema_pk"])
+        except DataSchemas.DoesNotExist:
+            raise CommandError("Schema %s does not exist" % (options["schema_pk"],))
+        try:
+            csv_file = open(options["path"], "rb")
+        except OSError as err:
+            raise CommandError(err)
+        with csv_file:
+            summary = validate_csv(
+                schema,
+                csv_file,
+                has_header=not options["no_header"],
+                batch_size=options["batch_size"],
+                max_errors=options["max_errors"],
+            )
+        self.stdout.write(json.dumps(summary, indent=2))
+        if summary["errors_count"]:
+            raise CommandError(
+                "%s errors in %s rows" % (summary["errors_count"], summary["rows"])
+            )
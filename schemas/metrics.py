@@ -0,0 +1,340 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from .admission import admission_stats, process_exists
+from .middleware import add_query_wrapper, remove_query_wrapper
+
+# Counters and histograms of this process, written to METRICS_DIR/<pid>.json
+# by a background thread every METRICS_FLUSH_SECONDS. The /metrics view adds
+# up the files of all processes, so every gunicorn worker is counted
+# whichever one serves the scrape. At the next scrape, the counts of a
+# process that no longer runs are added to METRICS_DIR/archive.json and its
+# file is removed, so the totals never go down when workers are restarted,
+# which Prometheus would take for counter resets.
+#
+# Every request is measured in the "request" group, labelled with its URL
+# name; views add more groups with tag(), e.g. the SchemaView button handler
+# or the export format. Each group has a duration, an SQL query count and a
+# response size histogram.
+
+ARCHIVE_FILE = "archive.json"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = tuple(1024 * 4**power for power in range(10))
+
+GROUPS = {
+    "request": "per URL name",
+    "handler": "per SchemaView button handler",
+    "export": "per export format",
+}
+
+HISTOGRAMS = {}
+for group, description in GROUPS.items():
+    HISTOGRAMS["schemas_%s_duration_seconds" % (group,)] = (
+        "Time until the response was sent, %s" % (description,),
+        LATENCY_BUCKETS,
+    )
+    HISTOGRAMS["schemas_%s_queries" % (group,)] = (
+        "SQL queries, %s" % (description,),
+        QUERY_BUCKETS,
+    )
+    HISTOGRAMS["schemas_%s_response_bytes" % (group,)] = (
+        "Response size, %s" % (description,),
+        SIZE_BUCKETS,
+    )
+
+COUNTERS = {
+    "schemas_requests_total": "Requests by URL name, method and status",
+}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        self.histograms = {}
+        self.dirty = False
+        self.flusher = None
+
+    def changed(self):
+        # called with the lock held; a forked worker starts with its own
+        # counts and, as threads are not forked, its own flusher
+        self.dirty = True
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+            self.flusher.start()
+
+    def check_pid(self):
+        if self.pid != os.getpid():
+            self.reset()
+
+    def increment(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.check_pid()
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self.changed()
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = HISTOGRAMS[name][1]
+        with self.lock:
+            self.check_pid()
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            index = 0
+            while index < len(buckets) and value > buckets[index]:
+                index += 1
+            histogram[0][index] += 1
+            histogram[1] += value
+            self.changed()
+
+    def flush_loop(self):
+        while self.flusher is threading.current_thread():
+            time.sleep(settings.METRICS_FLUSH_SECONDS)
+            if self.dirty:
+                self.flush()
+
+    def flush(self):
+        if not settings.METRICS_DIR:
+            return
+        with self.lock:
+            self.check_pid()
+            if not self.dirty:
+                return
+            self.dirty = False
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            write_state(
+                os.path.join(settings.METRICS_DIR, "%s.json" % (self.pid,)),
+                self.counters,
+                self.histograms,
+            )
+
+
+def write_state(path, counters, histograms):
+    state = {
+        "counters": [
+            [name, dict(labels), value] for (name, labels), value in counters.items()
+        ],
+        "histograms": [
+            [name, dict(labels), counts, total]
+            for (name, labels), (counts, total) in histograms.items()
+        ],
+    }
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as metrics_file:
+        json.dump(state, metrics_file)
+    os.replace(temp_path, path)
+
+
+def add_state(path, counters, histograms):
+    # adds the counts of one file to counters and histograms
+    try:
+        with open(path) as metrics_file:
+            state = json.load(metrics_file)
+    except (OSError, ValueError):
+        return
+    for name, labels, value in state["counters"]:
+        key = (name, tuple(sorted(labels.items())))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, counts, total in state["histograms"]:
+        if name not in HISTOGRAMS:
+            continue
+        key = (name, tuple(sorted(labels.items())))
+        histogram = histograms.setdefault(key, [[0] * len(counts), 0.0])
+        histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+        histogram[1] += total
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def tag(request, group, **labels):
+    # measures the current request in one more group
+    request._metrics_groups = getattr(request, "_metrics_groups", []) + [
+        (group, labels)
+    ]
+
+
+def record_request(groups, started, queries, size):
+    duration = time.monotonic() - started
+    for group, labels in groups:
+        registry.observe("schemas_%s_duration_seconds" % (group,), labels, duration)
+        registry.observe("schemas_%s_queries" % (group,), labels, queries)
+        registry.observe("schemas_%s_response_bytes" % (group,), labels, size)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def counting_chunks(chunks, counter):
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    # Records the metrics of a request when its response is closed, which
+    # for streamed responses is after the last chunk has been sent.
+
+    def process_request(self, request):
+        if settings.METRICS_DIR:
+            request._metrics_started = time.monotonic()
+            request._metrics_queries = QueryCounter()
+            add_query_wrapper(request._metrics_queries)
+
+    def process_response(self, request, response):
+        queries = getattr(request, "_metrics_queries", None)
+        if queries is None:
+            return response
+        remove_query_wrapper(queries)
+        started = request._metrics_started
+
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unmatched"
+        registry.increment(
+            "schemas_requests_total",
+            {"view": view, "method": request.method, "status": response.status_code},
+        )
+        groups = [("request", {"view": view, "method": request.method})]
+        groups += getattr(request, "_metrics_groups", [])
+
+        size = [0]
+        if not response.streaming:
+            size[0] = len(response.content)
+        elif response.has_header("Content-Length"):
+            size[0] = int(response["Content-Length"])
+        else:
+            response.streaming_content = counting_chunks(
+                response.streaming_content, size
+            )
+        response._resource_closers.append(
+            lambda: record_request(groups, started, queries.count, size[0])
+        )
+        return response
+
+
+def read_metrics():
+    # sums the files of all processes, after writing this one's
+    registry.flush()
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    archive_path = os.path.join(settings.METRICS_DIR, ARCHIVE_FILE)
+    counters = {}
+    histograms = {}
+    # scrapes take turns, so that the counts of an exited process are
+    # archived once and never seen both in the archive and in its own file
+    with open(os.path.join(settings.METRICS_DIR, "archive.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        paths = glob.glob(os.path.join(settings.METRICS_DIR, "*.json"))
+        exited = []
+        for path in paths:
+            pid = os.path.basename(path)[: -len(".json")]
+            if pid.isdigit() and not process_exists(int(pid)):
+                exited.append(path)
+        if exited:
+            archived_counters = {}
+            archived_histograms = {}
+            for path in [archive_path] + exited:
+                add_state(path, archived_counters, archived_histograms)
+            write_state(archive_path, archived_counters, archived_histograms)
+            for path in exited:
+                os.remove(path)
+            paths = [path for path in paths if path not in exited]
+            if archive_path not in paths:
+                paths.append(archive_path)
+        for path in paths:
+            add_state(path, counters, histograms)
+    return counters, histograms
+
+
+def format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"'
+        % (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in items
+    )
+
+
+def format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def admission_lines():
+    lines = [
+        "# HELP schemas_admission_events_total Admission control decisions",
+        "# TYPE schemas_admission_events_total counter",
+    ]
+    gauges = []
+    for group, counters in admission_stats().items():
+        for event, value in counters.items():
+            if event in ("active", "waiting"):
+                gauges.append((event, group, value))
+            elif event != "wait_seconds":
+                labels = format_labels((), group=group, event=event)
+                lines.append("schemas_admission_events_total%s %s" % (labels, value))
+    for event in ("active", "waiting"):
+        lines.append("# HELP schemas_admission_%s Requests %s now" % (event, event))
+        lines.append("# TYPE schemas_admission_%s gauge" % (event,))
+        for name, group, value in gauges:
+            if name == event:
+                lines.append(
+                    "schemas_admission_%s%s %s"
+                    % (event, format_labels((), group=group), value)
+                )
+    return lines
+
+
+def prometheus_text():
+    counters, histograms = read_metrics()
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s counter" % (name,))
+        for (key_name, labels), value in sorted(counters.items()):
+            if key_name == name:
+                lines.append("%s%s %s" % (name, format_labels(labels), value))
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s histogram" % (name,))
+        for (key_name, labels), (counts, total) in sorted(histograms.items()):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(
+                    "%s_bucket%s %s"
+                    % (name, format_labels(labels, le=format_number(bound)), cumulative)
+                )
+            lines.append("%s_sum%s %s" % (name, format_labels(labels), repr(total)))
+            lines.append("%s_count%s %s" % (name, format_labels(labels), cumulative))
+    lines += admission_lines()
+    return "\n".join(lines) + "\n"
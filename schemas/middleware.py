@@ -0,0 +1,117 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.deprecation import MiddlewareMixin
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from schemas.routers import read_alias
+
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+# The middleware of this project derives from MiddlewareMixin, which runs in
+# the mode of the handler it wraps. Under ASGI, sync-only middleware would
+# run every request through the one thread that Django 3.2 keeps for
+# thread-sensitive code, so a request waiting in its view holds up all the
+# others.
+
+# Execute wrappers of the current request. connection.execute_wrapper()
+# only applies to the connection of the calling thread, while under ASGI
+# the queries of a request run in sync_to_async threads. query_dispatcher,
+# installed on every connection, calls the wrappers in this ContextVar,
+# which sync_to_async carries into those threads.
+query_wrappers = ContextVar("query_wrappers", default=())
+
+
+def query_dispatcher(execute, sql, params, many, context):
+    for wrapper in reversed(query_wrappers.get()):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_dispatcher(sender, connection, **kwargs):
+    if query_dispatcher not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_dispatcher)
+
+
+def add_query_wrapper(wrapper):
+    # connections of this thread opened before this module was imported
+    for connection in connections.all():
+        install_query_dispatcher(None, connection)
+    query_wrappers.set(query_wrappers.get() + (wrapper,))
+
+
+def remove_query_wrapper(wrapper):
+    query_wrappers.set(tuple(w for w in query_wrappers.get() if w is not wrapper))
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    # WhiteNoiseMiddleware 5 is sync-only, this adds the async mode the way
+    # MiddlewareMixin does
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        response = await sync_to_async(self.process_request)(request)
+        return response or await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    # Sends the queries of views marked with replica_reads to the
+    # REPLICA_DATABASE_ALIAS database. After a successful write, the client
+    # gets a short-lived cookie that keeps its reads on the primary, so it
+    # always sees its own changes even if the replica lags behind.
+
+    def process_response(self, request, response):
+        read_alias.set(None)
+        if (
+            settings.REPLICA_DATABASE_ALIAS
+            and request.method not in ("GET", "HEAD", "OPTIONS", "TRACE")
+            and response.status_code < 400
+        ):
+            pin_seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE,
+                str(int(time.time() + pin_seconds)),
+                max_age=pin_seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        alias = settings.REPLICA_DATABASE_ALIAS
+        if not alias or request.method not in ("GET", "HEAD"):
+            return None
+        view_class = getattr(view_func, "view_class", None)
+        if not (
+            getattr(view_func, "replica_reads", False)
+            or getattr(view_class, "replica_reads", False)
+        ):
+            return None
+        try:
+            pinned_until = int(request.COOKIES.get(PRIMARY_PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        if pinned_until > time.time():
+            return None
+        read_alias.set(alias)
+        return None
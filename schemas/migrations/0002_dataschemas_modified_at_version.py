@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schemas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataschemas',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='dataschemas',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
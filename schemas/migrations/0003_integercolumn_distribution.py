@@ -0,0 +1,29 @@
+# Generated by Django 3.2.5 on 2026-10-19 14:28
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schemas', '0002_dataschemas_modified_at_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='integercolumn',
+            name='distribution',
+            field=models.CharField(choices=[('uniform', 'Uniform'), ('normal', 'Normal'), ('zipf', 'Zipf (skewed to the low end)'), ('sequential', 'Sequential (unique until the range is used up)')], default='uniform', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='integercolumn',
+            name='null_ratio',
+            field=models.FloatField(default=0.0, help_text='Share of empty values, from 0 to 1', validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(1.0)]),
+        ),
+        migrations.AddField(
+            model_name='integercolumn',
+            name='zipf_exponent',
+            field=models.FloatField(default=2.0, help_text='Only used by the Zipf distribution, higher is more skewed', validators=[django.core.validators.MinValueValidator(1.01)]),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.5 on 2026-10-19 14:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schemas', '0003_integercolumn_distribution'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('normalized_sql', models.TextField()),
+                ('example_sql', models.TextField()),
+                ('plan', models.TextField(blank=True)),
+                ('database', models.CharField(max_length=100)),
+                ('view', models.CharField(blank=True, max_length=100)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('total_seconds', models.FloatField(default=0.0)),
+                ('max_seconds', models.FloatField(default=0.0)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.5 on 2026-10-19 15:09
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schemas', '0004_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForeignKeyColumn',
+            fields=[
+                ('schemacolumn_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='schemas.schemacolumn')),
+                ('parent_rows', models.PositiveIntegerField(default=1000, help_text="Rows of the referenced schema's table, export it with as many")),
+                ('distribution', models.CharField(choices=[('uniform', 'Uniform'), ('normal', 'Normal'), ('zipf', 'Zipf (skewed to the low end)'), ('sequential', 'Sequential (unique until the range is used up)')], default='uniform', help_text='How the referenced rows are picked', max_length=10)),
+                ('zipf_exponent', models.FloatField(default=2.0, help_text='Only used by the Zipf distribution, higher is more skewed', validators=[django.core.validators.MinValueValidator(1.01)])),
+                ('null_ratio', models.FloatField(default=0.0, help_text='Share of empty values, from 0 to 1', validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(1.0)])),
+                ('referenced_column', models.ForeignKey(blank=True, help_text='Key column of the referenced schema, e.g. a sequential integer', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='referencing_columns', to='schemas.schemacolumn')),
+            ],
+            bases=('schemas.schemacolumn',),
+        ),
+    ]
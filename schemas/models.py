@@ -1,17 +1,24 @@
+from django.conf import settings
 from django.db import models
-from django.core.validators import RegexValidator
+from django.db.models import F
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
+from django.urls import reverse
+from django.utils import timezone
 
 INTEGER_CH = "IntegerColumn"
 FULLNAME_CH = "FullNameColumn"
 JOB_CH = "JobColumn"
 PHONE_CH = "PhoneColumn"
 COMPANY_CH = "CompanyColumn"
+FOREIGN_KEY_CH = "ForeignKeyColumn"
 COLUMN_TYPE_CHOICES = [
     (INTEGER_CH, "Integer"),
     (FULLNAME_CH, "Full Name"),
     (JOB_CH, "Job"),
     (PHONE_CH, "Phone"),
     (COMPANY_CH, "Company"),
+    (FOREIGN_KEY_CH, "Foreign key"),
 ]
 
 DOUBLE_QUOTE = '"'
@@ -21,6 +28,17 @@ STRING_CHARACTER_CHOICES = [
     (SINGLE_QUOTE, "Single-quote(')"),
 ]
 
+UNIFORM = "uniform"
+NORMAL = "normal"
+ZIPF = "zipf"
+SEQUENTIAL = "sequential"
+DISTRIBUTION_CHOICES = [
+    (UNIFORM, "Uniform"),
+    (NORMAL, "Normal"),
+    (ZIPF, "Zipf (skewed to the low end)"),
+    (SEQUENTIAL, "Sequential (unique until the range is used up)"),
+]
+
 COMMA = ","
 SEMICOLON = ";"
 COLUMN_SEPARATOR_CHOICES = [(COMMA, "Comma(,)"), (SEMICOLON, "Semicolon(;)")]
@@ -40,9 +58,49 @@ class DataSchemas(models.Model):
         default=DOUBLE_QUOTE,
     )
     modif_date = models.DateField(auto_now=True)
+    # modif_date only has a day resolution, so conditional GET
+    # (ETag / Last-Modified) relies on these two fields instead
+    modified_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1)
 
     def get_absolute_url(self):
-        return reverse("schema_add_update", args=[str(self.id)])
+        return reverse("schema_detail", args=[str(self.id)])
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+        super(DataSchemas, self).save(*args, **kwargs)
+
+    @classmethod
+    def claim_version(cls, pk, version):
+        # UPDATE ... SET version = version + 1 WHERE id = %s AND version = %s,
+        # False when the schema has changed since the caller read `version`.
+        # The row stays locked until the transaction ends, a concurrent
+        # claim of the same version waits for it and then matches nothing.
+        now = timezone.now()
+        updated = cls.objects.filter(pk=pk, version=version).update(
+            version=F("version") + 1,
+            modified_at=now,
+            modif_date=timezone.localdate(now),
+        )
+        return updated == 1
+
+    @classmethod
+    def touch(cls, *schema_pks):
+        # called on every column write, so that the schema version
+        # and modification time also cover the columns
+        now = timezone.now()
+        cls.objects.filter(pk__in=schema_pks).update(
+            version=F("version") + 1,
+            modified_at=now,
+            modif_date=timezone.localdate(now),
+        )
+
+
+class SchemaColumnQuerySet(models.QuerySet):
+    def with_subclasses(self):
+        # one LEFT JOIN per column type instead of a hasattr() query per column
+        return self.select_related(*COLUMN_SUBCLASSES)
 
 
 class SchemaColumn(models.Model):
@@ -50,17 +108,72 @@ class SchemaColumn(models.Model):
     schema = models.ForeignKey(DataSchemas, on_delete=models.CASCADE)
     order = models.PositiveIntegerField()
 
+    objects = SchemaColumnQuerySet.as_manager()
+
     class Meta:
         unique_together = [["schema", "name"], ["schema", "order"]]
 
     def save(self, *args, **kwargs):
         self.validate_unique()
         super(SchemaColumn, self).save(*args, **kwargs)
+        DataSchemas.touch(self.schema_id)
+
+    def delete(self, *args, **kwargs):
+        # foreign keys of other schemas referencing this column are set to
+        # NULL, which changes the output of their schemas too
+        schema_pks = {self.schema_id}
+        schema_pks.update(self.referencing_columns.values_list("schema_id", flat=True))
+        result = super(SchemaColumn, self).delete(*args, **kwargs)
+        DataSchemas.touch(*schema_pks)
+        return result
+
+    @property
+    def typed_column(self):
+        # concrete IntegerColumn, PhoneColumn etc. instance of this column
+        if type(self) is not SchemaColumn:
+            return self
+        for subclass in COLUMN_SUBCLASSES:
+            if hasattr(self, subclass):
+                return getattr(self, subclass)
+        return self
+
+    @property
+    def column_type(self):
+        return type(self.typed_column).__name__
+
+    def get_column_type_display(self):
+        return dict(COLUMN_TYPE_CHOICES).get(self.column_type, self.column_type)
+
+    @property
+    def parameters(self):
+        # type specific fields, e.g. {"range_low": -20, "range_high": 40},
+        # foreign keys by their attname: {"referenced_column_id": 7, ...}
+        column = self.typed_column
+        if type(column) is SchemaColumn:
+            return {}
+        return {
+            field.attname: getattr(column, field.attname)
+            for field in column._meta.local_concrete_fields
+            if not field.primary_key
+        }
 
 
 class IntegerColumn(SchemaColumn):
     range_low = models.IntegerField(blank=True, null=True, default=-20)
     range_high = models.IntegerField(blank=True, null=True, default=40)
+    distribution = models.CharField(
+        max_length=10, choices=DISTRIBUTION_CHOICES, default=UNIFORM
+    )
+    zipf_exponent = models.FloatField(
+        default=2.0,
+        validators=[MinValueValidator(1.01)],
+        help_text="Only used by the Zipf distribution, higher is more skewed",
+    )
+    null_ratio = models.FloatField(
+        default=0.0,
+        validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
+        help_text="Share of empty values, from 0 to 1",
+    )
 
 
 class FullNameColumn(SchemaColumn):
@@ -84,3 +197,91 @@ class PhoneColumn(SchemaColumn):
     phone_number = models.CharField(
         validators=[phone_regex], max_length=17, blank=True, null=True
     )  # validators should be a list
+
+
+class ForeignKeyColumn(SchemaColumn):
+    # values of the referenced column, the key of another schema's table,
+    # as generated for the first parent_rows rows of that table
+    referenced_column = models.ForeignKey(
+        SchemaColumn,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="referencing_columns",
+        help_text="Key column of the referenced schema, e.g. a sequential integer",
+    )
+    parent_rows = models.PositiveIntegerField(
+        default=1000,
+        help_text="Rows of the referenced schema's table, export it with as many",
+    )
+    distribution = models.CharField(
+        max_length=10,
+        choices=DISTRIBUTION_CHOICES,
+        default=UNIFORM,
+        help_text="How the referenced rows are picked",
+    )
+    zipf_exponent = models.FloatField(
+        default=2.0,
+        validators=[MinValueValidator(1.01)],
+        help_text="Only used by the Zipf distribution, higher is more skewed",
+    )
+    null_ratio = models.FloatField(
+        default=0.0,
+        validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
+        help_text="Share of empty values, from 0 to 1",
+    )
+
+    def clean(self):
+        super().clean()
+        try:
+            referenced = self.referenced_column
+        except SchemaColumn.DoesNotExist:
+            raise ValidationError({"referenced_column": "Unknown column."})
+        if referenced is not None and referenced.column_type == FOREIGN_KEY_CH:
+            raise ValidationError(
+                {"referenced_column": "A foreign key cannot reference a foreign key."}
+            )
+        # the key pool is the referenced column generated for parent_rows rows
+        if self.parent_rows is not None and self.parent_rows > settings.EXPORT_MAX_ROWS:
+            raise ValidationError(
+                {
+                    "parent_rows": "Ensure this value is less than or equal to %s."
+                    % (settings.EXPORT_MAX_ROWS,)
+                }
+            )
+
+
+# lowercase names of the column types, as used by hasattr() and select_related()
+COLUMN_SUBCLASSES = [
+    subClass.__name__.lower() for subClass in SchemaColumn.__subclasses__()
+]
+
+# column type (COLUMN_TYPE_CHOICES value) -> model class
+COLUMN_MODELS = {
+    subClass.__name__: subClass for subClass in SchemaColumn.__subclasses__()
+}
+
+
+class SlowQuery(models.Model):
+    # one row per normalized statement, see schemas/slow_queries.py
+    fingerprint = models.CharField(max_length=40, unique=True)
+    normalized_sql = models.TextField()
+    example_sql = models.TextField()
+    plan = models.TextField(blank=True)
+    database = models.CharField(max_length=100)
+    view = models.CharField(max_length=100, blank=True)
+    count = models.PositiveIntegerField(default=1)
+    total_seconds = models.FloatField(default=0.0)
+    max_seconds = models.FloatField(default=0.0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "slow queries"
+
+    def __str__(self):
+        return self.normalized_sql[:100]
+
+    @property
+    def average_seconds(self):
+        return self.total_seconds / self.count if self.count else 0.0
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .generation import DEFAULT_CHUNK_SIZE, generate_chunks, load_columns
+from .models import DataSchemas
+
+# The first SCHEMA_PREVIEW_ROWS rows of a schema as an export of at least
+# DEFAULT_CHUNK_SIZE rows produces them with PREVIEW_SEED, cached per schema
+# version. Every column change bumps the version, so an entry is never
+# invalidated, the old ones expire after SCHEMA_PREVIEW_CACHE_SECONDS. The
+# values of a foreign key column follow the referenced column, an edit of
+# that one shows up with the next version of the schema.
+
+PREVIEW_SEED = 0
+
+
+def preview_key(schema_pk, version):
+    return "schema-preview:%s:%s:%s" % (
+        schema_pk,
+        version,
+        settings.SCHEMA_PREVIEW_ROWS,
+    )
+
+
+def generate_preview(schema):
+    # returns (column names, rows)
+    columns = load_columns(schema)
+    rows = settings.SCHEMA_PREVIEW_ROWS
+    # the generators draw their values chunk by chunk, so the first rows
+    # only match an export that fills its first chunk
+    preview_rows = []
+    for chunk in generate_chunks(columns, max(rows, DEFAULT_CHUNK_SIZE), PREVIEW_SEED):
+        preview_rows.extend(list(row) for row in zip(*chunk))
+        if len(preview_rows) >= rows:
+            break
+    return [column.name for column in columns], preview_rows[:rows]
+
+
+def schema_preview(schema_pk, version):
+    key = preview_key(schema_pk, version)
+    preview = cache.get(key)
+    if preview is None:
+        preview = generate_preview(DataSchemas(pk=schema_pk))
+        cache.set(key, preview, settings.SCHEMA_PREVIEW_CACHE_SECONDS)
+    return preview
@@ -0,0 +1,65 @@
+from django.core.exceptions import ValidationError
+
+from schemas.models import DataSchemas, ForeignKeyColumn
+
+# A relational dataset is a set of schemas together with every schema their
+# foreign key columns reference, directly or through other schemas. A
+# referenced schema is generated with the parent_rows of the foreign keys
+# pointing at it, so these have to agree, the others with the rows asked
+# for. Parents come before the tables referencing them, which is the order
+# to load them in with foreign key constraints.
+
+
+def referenced_schemas(schemas):
+    # returns ({pk: schema}, {child pk: {parent pks}}, {parent pk: rows}),
+    # one query per level of references
+    schemas = {schema.pk: schema for schema in schemas}
+    parents = {}
+    parent_rows = {}
+    pending = list(schemas)
+    while pending:
+        new_pks = set()
+        for column in ForeignKeyColumn.objects.filter(
+            schema_id__in=pending, referenced_column__isnull=False
+        ).select_related("referenced_column"):
+            parent_pk = column.referenced_column.schema_id
+            parents.setdefault(column.schema_id, set()).add(parent_pk)
+            rows = parent_rows.setdefault(parent_pk, column.parent_rows)
+            if rows != column.parent_rows:
+                raise ValidationError(
+                    "Foreign keys reference schema %s with %s and %s parent rows"
+                    % (parent_pk, rows, column.parent_rows)
+                )
+            if parent_pk not in schemas:
+                new_pks.add(parent_pk)
+        schemas.update(DataSchemas.objects.in_bulk(new_pks))
+        pending = list(new_pks)
+    return schemas, parents, parent_rows
+
+
+def parents_first(pks, parents):
+    # topological order, schemas referencing each other in a cycle
+    # (not counting a schema referencing itself) follow in pk order
+    ordered = []
+    remaining = {pk: parents.get(pk, set()) - {pk} for pk in pks}
+    while remaining:
+        ready = sorted(
+            pk
+            for pk, pk_parents in remaining.items()
+            if not pk_parents & set(remaining)
+        )
+        if not ready:
+            ready = sorted(remaining)
+        for pk in ready:
+            ordered.append(pk)
+            del remaining[pk]
+    return ordered
+
+
+def dataset_plan(schemas, rows):
+    # [(schema, rows)] for the schemas and all the schemas they reference
+    schemas, parents, parent_rows = referenced_schemas(schemas)
+    return [
+        (schemas[pk], parent_rows.get(pk, rows))
+        for pk in parents_first(schemas, parents)
+    ]
@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# database alias for the reads of the current request or task,
+# None means the router has no opinion and Django uses "default"
+read_alias = ContextVar("read_alias", default=None)
+
+
+@contextmanager
+def reads_from(alias):
+    token = read_alias.set(alias)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def replica_reads(view_func):
+    # marks a read-only view whose queries may go to the replica,
+    # class based views set replica_reads = True instead
+    view_func.replica_reads = True
+    return view_func
+
+
+class PrimaryReplicaRouter:
+    # Reads of the schemas app go to the alias chosen for the current request
+    # by ReplicaRoutingMiddleware, everything else stays on "default".
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == "schemas":
+            return read_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same data as the primary
+        return True
@@ -0,0 +1,212 @@
+import json
+import re
+import sqlite3
+
+from django.apps import apps
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, log_query
+from haystack.constants import DJANGO_CT, DJANGO_ID, ID
+from haystack.models import SearchResult
+from haystack.utils import get_identifier, get_model_ct
+
+# Haystack engine backed by an SQLite FTS5 index in a local file, see
+# HAYSTACK_CONNECTIONS in settings. The documents table keeps the stored
+# fields, documents_fts is an external content full-text index over it,
+# kept in sync by triggers.
+INDEX_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS documents (
+        id INTEGER PRIMARY KEY,
+        identifier TEXT NOT NULL UNIQUE,
+        django_ct TEXT NOT NULL,
+        django_id TEXT NOT NULL,
+        text TEXT NOT NULL,
+        data TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS documents_django_ct ON documents (django_ct)",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+        text, content='documents', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts (rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts (documents_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+        INSERT INTO documents_fts (documents_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO documents_fts (rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+
+UPSERT_DOCUMENT = """
+    INSERT INTO documents (identifier, django_ct, django_id, text, data)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (identifier) DO UPDATE SET text = excluded.text, data = excluded.data
+"""
+
+word_re = re.compile(r'"(?P<phrase>[^"]*)"|(?P<negated>-)?(?P<word>\w+)')
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    def __init__(self, connection_alias, **connection_options):
+        super(SQLiteFTSSearchBackend, self).__init__(
+            connection_alias, **connection_options
+        )
+        self.path = str(connection_options["PATH"])
+        self.batch_size = connection_options.get("BATCH_SIZE", 1000)
+        self._connection = None
+
+    @property
+    def connection(self):
+        # haystack keeps one backend per thread, so one sqlite3 connection each
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            with self._connection:
+                for statement in INDEX_SCHEMA:
+                    self._connection.execute(statement)
+        return self._connection
+
+    def update(self, index, iterable, commit=True):
+        content_field = index.get_content_field()
+        batch = []
+        for obj in iterable:
+            prepared = index.full_prepare(obj)
+            text = prepared.pop(content_field, "")
+            batch.append(
+                (
+                    prepared.pop(ID),
+                    prepared.pop(DJANGO_CT),
+                    str(prepared.pop(DJANGO_ID)),
+                    text,
+                    json.dumps(prepared, default=str),
+                )
+            )
+            if len(batch) >= self.batch_size:
+                self._upsert(batch)
+                batch = []
+        if batch:
+            self._upsert(batch)
+
+    def _upsert(self, batch):
+        with self.connection:
+            self.connection.executemany(UPSERT_DOCUMENT, batch)
+
+    def remove(self, obj_or_string, commit=True):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM documents WHERE identifier = ?",
+                (get_identifier(obj_or_string),),
+            )
+
+    def remove_many(self, identifiers):
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM documents WHERE identifier = ?",
+                [(identifier,) for identifier in identifiers],
+            )
+
+    def clear(self, models=None, commit=True):
+        with self.connection:
+            if models:
+                self.connection.executemany(
+                    "DELETE FROM documents WHERE django_ct = ?",
+                    [(get_model_ct(model),) for model in models],
+                )
+            else:
+                self.connection.execute("DELETE FROM documents")
+
+    @log_query
+    def search(
+        self,
+        query_string,
+        start_offset=0,
+        end_offset=None,
+        models=None,
+        result_class=None,
+        **kwargs
+    ):
+        result_class = result_class or SearchResult
+        conditions = []
+        params = []
+        if query_string and query_string != "*":
+            conditions.append("documents_fts MATCH ?")
+            params.append(query_string)
+        if models:
+            content_types = [get_model_ct(model) for model in models]
+            conditions.append(
+                "documents.django_ct IN (%s)" % ", ".join("?" * len(content_types))
+            )
+            params.extend(content_types)
+        # results come in index order instead of ORDER BY rank: ranking has to
+        # score every match, which is slow for terms found in millions of rows
+        from_clause = (
+            "documents_fts JOIN documents ON documents.id = documents_fts.rowid"
+        )
+        where_clause = " AND ".join(conditions) or "1"
+        limit = -1 if end_offset is None else end_offset - start_offset
+        try:
+            (hits,) = self.connection.execute(
+                "SELECT count(*) FROM %s WHERE %s" % (from_clause, where_clause),
+                params,
+            ).fetchone()
+            rows = self.connection.execute(
+                "SELECT documents.django_ct, documents.django_id, documents.data "
+                "FROM %s WHERE %s LIMIT ? OFFSET ?" % (from_clause, where_clause),
+                params + [limit, start_offset],
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # malformed MATCH expression
+            return {"results": [], "hits": 0}
+
+        results = []
+        for django_ct, django_id, data in rows:
+            app_label, model_name = django_ct.split(".")
+            try:
+                apps.get_model(app_label, model_name)
+            except LookupError:
+                continue
+            results.append(
+                result_class(app_label, model_name, django_id, 0, **json.loads(data))
+            )
+        return {"results": results, "hits": hits}
+
+    def prep_value(self, value):
+        return value
+
+    def more_like_this(self, model_instance, *args, **kwargs):
+        return {"results": [], "hits": 0}
+
+
+class SQLiteFTSSearchQuery(BaseSearchQuery):
+    def build_query_fragment(self, field, filter_type, value):
+        # Every filter searches the whole document. "exact phrases" and
+        # whole words are kept, other words match as prefixes and
+        # -words are excluded.
+        query_string = str(getattr(value, "query_string", value))
+        included = []
+        excluded = []
+        for match in word_re.finditer(query_string):
+            if match.group("phrase") is not None:
+                words = re.findall(r"\w+", match.group("phrase"))
+                if words:
+                    included.append('"%s"' % " ".join(words))
+            elif match.group("negated"):
+                excluded.append('"%s"' % match.group("word"))
+            elif filter_type == "exact":
+                included.append('"%s"' % match.group("word"))
+            else:
+                included.append('"%s"*' % match.group("word"))
+        if not included:
+            return ""
+        fragment = " AND ".join(included)
+        for word in excluded:
+            fragment = "(%s) NOT %s" % (fragment, word)
+        return fragment
+
+
+class SQLiteFTSEngine(BaseEngine):
+    backend = SQLiteFTSSearchBackend
+    query = SQLiteFTSSearchQuery
@@ -0,0 +1,72 @@
+from itertools import groupby
+
+from haystack import connection_router, connections, indexes
+from haystack.signals import RealtimeSignalProcessor
+from haystack.utils import get_model_ct
+
+from schemas.models import COLUMN_MODELS, DataSchemas, SchemaColumn
+
+
+class DataSchemasIndex(indexes.SearchIndex, indexes.Indexable):
+    text = indexes.CharField(document=True, model_attr="name")
+    name = indexes.CharField(model_attr="name")
+
+    def get_model(self):
+        return DataSchemas
+
+
+class ColumnIndex(indexes.SearchIndex):
+    # Haystack looks indexes up by the model class sent with post_save and
+    # post_delete, which is the concrete IntegerColumn, PhoneColumn etc.,
+    # so every column type gets its own index built from this class.
+    text = indexes.CharField(document=True)
+    name = indexes.CharField(model_attr="name")
+    column_type = indexes.CharField()
+    schema_id = indexes.IntegerField(model_attr="schema_id")
+
+    def prepare_text(self, obj):
+        return "%s %s %s" % (obj.name, obj.get_column_type_display(), obj.column_type)
+
+    def prepare_column_type(self, obj):
+        return obj.get_column_type_display()
+
+
+for column_model in COLUMN_MODELS.values():
+    index_name = "%sIndex" % (column_model.__name__,)
+    globals()[index_name] = type(
+        index_name,
+        (ColumnIndex, indexes.Indexable),
+        {"get_model": lambda self, model=column_model: model},
+    )
+
+
+class ColumnSignalProcessor(RealtimeSignalProcessor):
+    # The schema editor saves the name and order of a column through a plain
+    # SchemaColumn, which has no index. Its typed column is indexed instead,
+    # read again as the one cached by typed_column may be outdated. Deletes
+    # need nothing more, Django also sends post_delete for the typed row.
+
+    def handle_save(self, sender, instance, **kwargs):
+        if sender is SchemaColumn:
+            instance = (
+                SchemaColumn.objects.with_subclasses().get(pk=instance.pk).typed_column
+            )
+            sender = type(instance)
+        super().handle_save(sender, instance, **kwargs)
+
+
+def update_search_index(objects):
+    # for writes that bypass post_save, such as bulk_create()
+    objects = sorted(objects, key=lambda obj: type(obj).__name__)
+    for model, model_objects in groupby(objects, key=type):
+        model_objects = list(model_objects)
+        for using in connection_router.for_write(instance=model_objects[0]):
+            index = connections[using].get_unified_index().get_index(model)
+            index.get_backend(using).update(index, model_objects)
+
+
+def remove_from_search_index(model, pks):
+    # for deletes that bypass post_delete, such as QuerySet._raw_delete()
+    identifiers = ["%s.%s" % (get_model_ct(model), pk) for pk in pks]
+    for using in connection_router.for_write(models=[model]):
+        connections[using].get_backend().remove_many(identifiers)
@@ -0,0 +1,212 @@
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+
+from schemas.bulk import bulk_create_columns, bulk_create_schemas
+from schemas.models import (
+    COLUMN_MODELS,
+    FOREIGN_KEY_CH,
+    DataSchemas,
+    ForeignKeyColumn,
+    SchemaColumn,
+)
+
+SCHEMA_FIELDS = ["name", "column_separator", "string_character"]
+
+
+def column_to_dict(column):
+    data = {"name": column.name, "order": column.order, "type": column.column_type}
+    data.update(column.parameters)
+    if column.column_type == FOREIGN_KEY_CH:
+        # a column id only means something in this database, the referenced
+        # column is exported as the id its schema has in the export and its
+        # name, see resolve_references()
+        referenced = column.referenced_column
+        del data["referenced_column_id"]
+        data["referenced_column"] = (
+            None
+            if referenced is None
+            else {"schema": referenced.schema_id, "column": referenced.name}
+        )
+    return data
+
+
+def schema_to_dict(schema, columns):
+    data = {"id": schema.pk}
+    data.update({field: getattr(schema, field) for field in SCHEMA_FIELDS})
+    data["version"] = schema.version
+    data["modified_at"] = schema.modified_at.isoformat()
+    data["columns"] = [column_to_dict(column) for column in columns]
+    return data
+
+
+def export_schemas(queryset):
+    # two queries whatever the number of schemas and columns:
+    # the schemas, and all their columns joined with the typed tables
+    schemas = list(queryset.order_by("pk"))
+    columns_by_schema = defaultdict(list)
+    columns = (
+        SchemaColumn.objects.with_subclasses()
+        .select_related("foreignkeycolumn__referenced_column")
+        .filter(schema__in=queryset)
+        .order_by("schema_id", "order")
+    )
+    for column in columns:
+        columns_by_schema[column.schema_id].append(column.typed_column)
+    return [schema_to_dict(schema, columns_by_schema[schema.pk]) for schema in schemas]
+
+
+def column_from_dict(data):
+    if not isinstance(data, dict):
+        raise ValidationError("Columns must be JSON objects")
+    data = dict(data)
+    column_type = data.pop("type", None)
+    if column_type not in COLUMN_MODELS:
+        raise ValidationError("Unknown column type: %s" % (column_type,))
+    reference = None
+    if column_type == FOREIGN_KEY_CH and "referenced_column" in data:
+        reference = data.pop("referenced_column")
+        if reference is not None:
+            if not (
+                isinstance(reference, dict)
+                and set(reference) == {"schema", "column"}
+                and isinstance(reference["schema"], int)
+                and isinstance(reference["column"], str)
+            ):
+                raise ValidationError(
+                    'referenced_column must be {"schema": <id>, "column": <name>}'
+                )
+            reference = (reference["schema"], reference["column"])
+    column_model = COLUMN_MODELS[column_type]
+    allowed = {"name", "order"} | {
+        field.attname
+        for field in column_model._meta.local_concrete_fields
+        if not field.primary_key
+    }
+    unknown = set(data) - allowed
+    if unknown:
+        raise ValidationError(
+            "Unknown %s fields: %s" % (column_type, ", ".join(sorted(unknown)))
+        )
+    column = column_model(**data)
+    column.reference = reference
+    return column
+
+
+def schema_from_dict(data):
+    if not isinstance(data, dict):
+        raise ValidationError("Schemas must be JSON objects")
+    unknown = (
+        set(data) - set(SCHEMA_FIELDS) - {"id", "version", "modified_at", "columns"}
+    )
+    if unknown:
+        raise ValidationError("Unknown schema fields: %s" % ", ".join(sorted(unknown)))
+    schema = DataSchemas(
+        **{field: data[field] for field in SCHEMA_FIELDS if field in data}
+    )
+    schema.full_clean()
+    columns = [column_from_dict(column) for column in data.get("columns", [])]
+    for field in ("name", "order"):
+        values = [getattr(column, field) for column in columns]
+        if len(values) != len(set(values)):
+            raise ValidationError(
+                "Column %ss must be unique within schema %s" % (field, schema.name)
+            )
+    for column in columns:
+        # uniqueness is checked above, without a query per column
+        column.full_clean(
+            exclude=["schema", column._meta.pk.name], validate_unique=False
+        )
+    return schema, columns
+
+
+def import_schemas(data, batch_size=None):
+    # validate everything first, then insert with a handful of
+    # bulk INSERTs per table instead of a save() per object
+    parsed = []
+    for position, schema_data in enumerate(data):
+        try:
+            parsed.append(schema_from_dict(schema_data))
+        except ValidationError as err:
+            raise ValidationError(
+                "Schema #%s: %s" % (position, "; ".join(err.messages))
+            )
+        except (TypeError, AttributeError):
+            raise ValidationError("Schema #%s: malformed data" % (position,))
+    links = resolve_references(data, parsed)
+    with transaction.atomic():
+        schemas = bulk_create_schemas(
+            [schema for schema, columns in parsed], batch_size
+        )
+        all_columns = []
+        for schema, columns in parsed:
+            for column in columns:
+                column.schema = schema
+            all_columns.extend(columns)
+        bulk_create_columns(all_columns, batch_size)
+        if links:
+            ForeignKeyColumn._base_manager.filter(
+                pk__in=[column.pk for column, target in links]
+            ).update(
+                referenced_column=Case(
+                    *(
+                        When(pk=column.pk, then=Value(target.pk))
+                        for column, target in links
+                    )
+                )
+            )
+            for column, target in links:
+                column.referenced_column_id = target.pk
+    return schemas
+
+
+def resolve_references(data, parsed):
+    # A reference to a column of a schema in the import is linked to its
+    # imported copy once that has a pk, which the returned (column, target)
+    # pairs are for, as clone_schemas() does. Any other reference has to
+    # name an existing column.
+    imported = {
+        (schema_data.get("id"), column.name): column
+        for schema_data, (schema, columns) in zip(data, parsed)
+        for column in columns
+    }
+    references = [
+        (position, column)
+        for position, (schema, columns) in enumerate(parsed)
+        for column in columns
+        if getattr(column, "reference", None) is not None
+    ]
+    outside = {
+        column.reference
+        for position, column in references
+        if column.reference not in imported
+    }
+    existing = {}
+    if outside:
+        condition = Q()
+        for schema_pk, name in outside:
+            condition |= Q(schema_id=schema_pk, name=name)
+        existing = {
+            (column.schema_id, column.name): column.typed_column
+            for column in SchemaColumn.objects.with_subclasses().filter(condition)
+        }
+    links = []
+    for position, column in references:
+        target = imported.get(column.reference) or existing.get(column.reference)
+        if target is None:
+            raise ValidationError(
+                "Schema #%s: %s references unknown column %s of schema %s"
+                % (position, column.name, column.reference[1], column.reference[0])
+            )
+        if target.column_type == FOREIGN_KEY_CH:
+            raise ValidationError(
+                "Schema #%s: %s: A foreign key cannot reference a foreign key."
+                % (position, column.name)
+            )
+        if column.reference in imported:
+            links.append((column, target))
+        else:
+            column.referenced_column_id = target.pk
+    return links
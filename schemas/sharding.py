@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from schemas.compression import compress_chunks, compressed_filename
+from schemas.exports import export_filename, export_formats
+from schemas.generation import generate_chunks
+
+# A sharded export is a directory with the export split into files of
+# shard_rows rows or of about shard_bytes bytes each, and manifest.json
+# listing them in order with their first row, row count, size and SHA-256.
+# Every shard is a complete file of its format, a CSV shard starts with the
+# header line, so loaders can take them in parallel. The data rows of all
+# shards together are those of the unsharded export with the same seed.
+#
+# A shard is written to a temporary file and renamed when complete, and the
+# manifest is rewritten after every shard, so an interrupted export can be
+# resumed: shards that are in the manifest and still match their checksum
+# are kept. Their rows are generated again all the same, every column's
+# random generator runs through the rows in order, but not encoded.
+#
+# The script formats start with CREATE TABLE and cannot be loaded in
+# parallel, only the data formats are sharded.
+
+SHARD_FORMATS = ["csv", "copy-binary"]
+MANIFEST_NAME = "manifest.json"
+MANIFEST_PARAMETERS = [
+    "schema",
+    "schema_version",
+    "format",
+    "compression",
+    "rows",
+    "seed",
+    "shard_rows",
+    "shard_bytes",
+]
+
+
+class RowReader:
+    # hands out the generated chunks again, cut at the given row limits
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = None
+        self.position = 0
+
+    def read(self, limit=None):
+        if self.pending is None:
+            self.pending = next(self.chunks, None)
+        chunk = self.pending
+        if chunk is None:
+            return None
+        size = len(chunk[0]) if chunk else 0
+        if limit is not None and size > limit:
+            self.pending = [values[limit:] for values in chunk]
+            chunk = [values[:limit] for values in chunk]
+            size = limit
+        else:
+            self.pending = None
+        self.position += size
+        return chunk
+
+    def skip(self, rows):
+        end = self.position + rows
+        while self.position < end and self.read(end - self.position) is not None:
+            pass
+
+
+def shard_filename(schema, export_format, compression, index):
+    root, extension = os.path.splitext(export_filename(schema, export_format))
+    filename = "%s.%05d%s" % (root, index, extension)
+    if compression is not None:
+        filename = compressed_filename(filename, compression)
+    return filename
+
+
+def file_digest(path):
+    # returns (size, SHA-256), None for a missing file
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as shard_file:
+            for block in iter(lambda: shard_file.read(1024**2), b""):
+                digest.update(block)
+            return shard_file.tell(), digest.hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def write_atomically(path, pieces):
+    # returns (size, SHA-256) of the written file
+    digest = hashlib.sha256()
+    size = 0
+    temp_file = tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), prefix=".shard-", delete=False
+    )
+    try:
+        with temp_file:
+            for piece in pieces:
+                temp_file.write(piece)
+                digest.update(piece)
+                size += len(piece)
+        os.replace(temp_file.name, path)
+    except BaseException:
+        os.unlink(temp_file.name)
+        raise
+    return size, digest.hexdigest()
+
+
+def write_manifest(directory, manifest):
+    data = json.dumps(manifest, indent=2).encode() + b"\n"
+    write_atomically(os.path.join(directory, MANIFEST_NAME), [data])
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+
+def completed_shards(directory, manifest):
+    # the leading shards of a previous run with the same parameters
+    # that are still on disk unchanged
+    previous = read_manifest(directory)
+    if previous is None:
+        return []
+    for name in MANIFEST_PARAMETERS:
+        if previous.get(name) != manifest[name]:
+            raise ValueError(
+                "%s differs from the export to resume: %r instead of %r"
+                % (name, manifest[name], previous.get(name))
+            )
+    shards = []
+    for shard in previous["shards"]:
+        path = os.path.join(directory, shard["path"])
+        if file_digest(path) != (shard["bytes"], shard["sha256"]):
+            break
+        shards.append(shard)
+    return shards
+
+
+def export_shards(
+    schema,
+    columns,
+    rows,
+    export_format,
+    seed,
+    directory,
+    shard_rows=None,
+    shard_bytes=None,
+    compression=None,
+    threads=None,
+    level=None,
+    resume=False,
+):
+    # shard_bytes counts the uncompressed output, a shard ends with the
+    # first chunk of rows that reaches it; returns the manifest
+    if export_format not in SHARD_FORMATS:
+        raise ValueError(
+            "Only %s exports can be sharded" % (" and ".join(SHARD_FORMATS),)
+        )
+    os.makedirs(directory, exist_ok=True)
+    manifest = {
+        "schema": schema.pk,
+        "schema_version": schema.version,
+        "name": schema.name,
+        "format": export_format,
+        "compression": compression,
+        "rows": rows,
+        "seed": seed,
+        "shard_rows": shard_rows,
+        "shard_bytes": shard_bytes,
+        "complete": False,
+        "shards": [],
+    }
+    completed = completed_shards(directory, manifest) if resume else []
+    writer = export_formats[export_format][0]
+    reader = RowReader(generate_chunks(columns, rows, seed))
+    while reader.position < rows or not manifest["shards"]:
+        index = len(manifest["shards"])
+        first_row = reader.position
+        if index < len(completed):
+            shard = completed[index]
+            reader.skip(shard["rows"])
+            manifest["shards"].append(shard)
+            continue
+        written = 0
+
+        def shard_chunks():
+            while shard_rows is None or reader.position - first_row < shard_rows:
+                if shard_bytes is not None and written >= shard_bytes:
+                    return
+                limit = None
+                if shard_rows is not None:
+                    limit = first_row + shard_rows - reader.position
+                chunk = reader.read(limit)
+                if chunk is None:
+                    return
+                yield chunk
+
+        def counted(pieces):
+            nonlocal written
+            for piece in pieces:
+                written += len(piece)
+                yield piece
+
+        pieces = counted(writer(schema, columns, shard_chunks()))
+        if compression is not None:
+            pieces = compress_chunks(pieces, compression, threads, level)
+        filename = shard_filename(schema, export_format, compression, index)
+        size, sha256 = write_atomically(os.path.join(directory, filename), pieces)
+        manifest["shards"].append(
+            {
+                "path": filename,
+                "first_row": first_row,
+                "rows": reader.position - first_row,
+                "bytes": size,
+                "sha256": sha256,
+            }
+        )
+        write_manifest(directory, manifest)
+        if reader.position == first_row:
+            # a schema without columns has no rows to shard
+            break
+    manifest["complete"] = True
+    write_manifest(directory, manifest)
+    return manifest
@@ -0,0 +1,128 @@
+import hashlib
+import re
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+
+from .middleware import add_query_wrapper, remove_query_wrapper
+from .models import SlowQuery
+
+# Statements of schemas views taking SLOW_QUERY_SECONDS or longer are stored
+# in SlowQuery, one row per fingerprint: the statement with its literals and
+# the length of IN (...) and VALUES lists normalized away. A new fingerprint
+# gets the plan of its statement from EXPLAIN (EXPLAIN QUERY PLAN on SQLite).
+# Only the SLOW_QUERY_KEEP rows with the highest total time are kept.
+
+NORMALIZE_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%s|\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),
+    (re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+"), "(?)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def normalize_sql(sql):
+    for pattern, replacement in NORMALIZE_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()
+
+
+EXPLAINABLE = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+def explain(alias, sql, params):
+    if sql.split(None, 1)[0].upper() not in EXPLAINABLE:
+        return ""
+    connection = connections[alias]
+    try:
+        # a savepoint, so that a failing EXPLAIN does not break the
+        # transaction of the request on PostgreSQL
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute(
+                "%s %s" % (connection.ops.explain_query_prefix(), sql), params
+            )
+            return "\n".join(
+                " ".join(str(value) for value in row) for row in cursor.fetchall()
+            )
+    except DatabaseError as error:
+        return "EXPLAIN failed: %s" % (error,)
+
+
+def store(query, view):
+    alias, sql, params, seconds = query
+    normalized = normalize_sql(sql)
+    key = fingerprint(normalized)
+    now = timezone.now()
+    updated = SlowQuery.objects.filter(fingerprint=key).update(
+        count=F("count") + 1,
+        total_seconds=F("total_seconds") + seconds,
+        max_seconds=Greatest(F("max_seconds"), seconds),
+        last_seen=now,
+    )
+    if updated:
+        return
+    plan = explain(alias, sql, params)
+    try:
+        with transaction.atomic():
+            SlowQuery.objects.create(
+                fingerprint=key,
+                normalized_sql=normalized,
+                example_sql=sql,
+                plan=plan,
+                database=alias,
+                view=view,
+                total_seconds=seconds,
+                max_seconds=seconds,
+                last_seen=now,
+            )
+    except IntegrityError:
+        # stored by a concurrent request in the meantime
+        return store(query, view)
+    kept = SlowQuery.objects.order_by("-total_seconds")[: settings.SLOW_QUERY_KEEP]
+    SlowQuery.objects.exclude(pk__in=list(kept.values_list("pk", flat=True))).delete()
+
+
+class SlowQueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started
+            if seconds >= settings.SLOW_QUERY_SECONDS and not many:
+                alias = context["connection"].alias
+                self.queries.append((alias, sql, params, seconds))
+
+
+class SlowQueryMiddleware(MiddlewareMixin):
+    # Statements are timed while the view runs. Storing them and running
+    # EXPLAIN happens afterwards, outside of the timing.
+
+    def process_request(self, request):
+        if settings.SLOW_QUERY_SECONDS is not None:
+            request._slow_query_recorder = SlowQueryRecorder()
+            add_query_wrapper(request._slow_query_recorder)
+
+    def process_response(self, request, response):
+        recorder = getattr(request, "_slow_query_recorder", None)
+        if recorder is None:
+            return response
+        remove_query_wrapper(recorder)
+        match = request.resolver_match
+        if recorder.queries and match and match.func.__module__.startswith("schemas."):
+            for query in recorder.queries:
+                store(query, match.url_name or "")
+        return response
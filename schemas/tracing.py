@@ -0,0 +1,155 @@
+import fcntl
+import json
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from .middleware import add_query_wrapper, remove_query_wrapper
+
+# Tracing of sampled requests: span() measures one phase of the request, the
+# SQL queries run inside it are spans of their own. TRACING_SAMPLE_RATE of
+# the requests are traced, and those taking TRACING_SLOW_SECONDS or more are
+# appended as one JSON line to TRACING_FILE. Outside of a traced request,
+# span() costs one ContextVar lookup.
+
+current_trace = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+        self.dropped = 0
+        self.finished = False
+
+    def add(self, name, started, duration, depth, attributes):
+        if len(self.spans) >= settings.TRACING_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append(
+            {
+                "name": name,
+                "start": started - self.started,
+                "duration": duration,
+                "depth": depth,
+                "attributes": attributes,
+            }
+        )
+
+    def as_dict(self, duration, **attributes):
+        return dict(
+            attributes,
+            name=self.name,
+            timestamp=self.timestamp,
+            duration=duration,
+            spans=sorted(self.spans, key=lambda span: span["start"]),
+            dropped=self.dropped,
+        )
+
+
+@contextmanager
+def span(name, **attributes):
+    trace = current_trace.get()
+    if trace is None or trace.finished:
+        yield
+        return
+    started = time.perf_counter()
+    depth = trace.depth = trace.depth + 1
+    try:
+        yield
+    finally:
+        trace.depth = depth - 1
+        trace.add(name, started, time.perf_counter() - started, depth, attributes)
+
+
+def traced(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_query(execute, sql, params, many, context):
+    with span("sql", sql=sql[:200]):
+        return execute(sql, params, many, context)
+
+
+def export_trace(trace, duration, **attributes):
+    line = json.dumps(trace.as_dict(duration, **attributes)) + "\n"
+    directory = os.path.dirname(settings.TRACING_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(settings.TRACING_FILE, "a") as trace_file:
+        fcntl.flock(trace_file, fcntl.LOCK_EX)
+        # the file is rotated once, keeping the previous one as .1, unless
+        # another process has rotated it while this one waited for the lock
+        file_stat = os.fstat(trace_file.fileno())
+        if file_stat.st_size >= settings.TRACING_MAX_BYTES and (
+            os.stat(settings.TRACING_FILE).st_ino == file_stat.st_ino
+        ):
+            os.replace(settings.TRACING_FILE, settings.TRACING_FILE + ".1")
+        trace_file.write(line)
+
+
+def finish_trace(trace, **attributes):
+    trace.finished = True
+    duration = time.perf_counter() - trace.started
+    if duration >= settings.TRACING_SLOW_SECONDS:
+        export_trace(trace, duration, **attributes)
+
+
+def recent_traces(limit=50):
+    # the newest traces first
+    traces = deque(maxlen=limit)
+    for path in (settings.TRACING_FILE + ".1", settings.TRACING_FILE):
+        try:
+            with open(path) as trace_file:
+                for line in trace_file:
+                    try:
+                        traces.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
+    return list(reversed(traces))
+
+
+class TracingMiddleware(MiddlewareMixin):
+    # A traced request ends when its response is closed, so the generation
+    # of a streamed export is part of it.
+
+    def process_request(self, request):
+        if not settings.TRACING_FILE or random.random() >= settings.TRACING_SAMPLE_RATE:
+            current_trace.set(None)
+            return
+        request._trace = Trace("%s %s" % (request.method, request.path))
+        current_trace.set(request._trace)
+        add_query_wrapper(trace_query)
+
+    def process_response(self, request, response):
+        trace = getattr(request, "_trace", None)
+        if trace is None:
+            return response
+        remove_query_wrapper(trace_query)
+        match = request.resolver_match
+        attributes = {
+            "view": match.url_name if match else None,
+            "status": response.status_code,
+        }
+        response._resource_closers.append(lambda: finish_trace(trace, **attributes))
+        return response
@@ -1,10 +1,35 @@
+from django.conf import settings
 from django.urls import path
-from . import views
-from .views import SchemaView, AllSchemasView
+from . import views, api, async_views
+from .views import SchemaView, AllSchemasView, SchemaDetailView
+
+# under ASGI, the schema list and the export are served by async views
+if settings.ASYNC_VIEWS:
+    all_schemas_view = async_views.all_schemas
+    export_schema_view = async_views.export_schema
+else:
+    all_schemas_view = AllSchemasView.as_view()
+    export_schema_view = views.export_schema
 
 urlpatterns = [
-path('create_schema/', SchemaView.as_view(), name='schema_create_update'),
-path('schema/<int:pk>/', SchemaView.as_view(), name='schema_create_update'),
-path('', AllSchemasView.as_view(), name='all_schemas'),
-path('delete/<int:pk>/', views.delete_schema, name="delete_schema"),
-]
\ No newline at end of file
+    path("create_schema/", SchemaView.as_view(), name="schema_create_update"),
+    path("schema/<int:pk>/", SchemaView.as_view(), name="schema_create_update"),
+    path("schema/<int:pk>/view/", SchemaDetailView.as_view(), name="schema_detail"),
+    path("schema/<int:pk>/preview/", views.schema_preview, name="schema_preview"),
+    path("", all_schemas_view, name="all_schemas"),
+    path("delete/<int:pk>/", views.delete_schema, name="delete_schema"),
+    path("clone/<int:pk>/", views.clone_schema, name="clone_schema"),
+    path("schema/<int:pk>/export/", export_schema_view, name="export_schema"),
+    path("search/", views.search_schemas, name="search_schemas"),
+    path("metrics", views.metrics_view, name="metrics"),
+    path("traces/", views.traces_view, name="traces"),
+    path("api/schemas/", api.schema_list_api, name="api_schema_list"),
+    path("api/schemas/import/", api.schema_import_api, name="api_schema_import"),
+    path("api/schemas/<int:pk>/", api.schema_detail_api, name="api_schema_detail"),
+    path("api/schemas/<int:pk>/clone/", api.schema_clone_api, name="api_schema_clone"),
+    path(
+        "api/schemas/<int:pk>/validate/",
+        api.schema_validate_csv_api,
+        name="api_schema_validate_csv",
+    ),
+]
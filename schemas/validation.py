@@ -0,0 +1,201 @@
+import codecs
+import csv
+import re
+from collections import Counter
+from itertools import islice
+
+from schemas.generation import (
+    VALUE_MAX_LENGTHS,
+    integer_range,
+    load_columns,
+    referenced_column,
+)
+from schemas.models import (
+    INTEGER_CH,
+    FULLNAME_CH,
+    JOB_CH,
+    PHONE_CH,
+    COMPANY_CH,
+    FOREIGN_KEY_CH,
+    PhoneColumn,
+)
+
+# Every checker gets a column and returns a function that takes the values
+# of that column for a batch of rows and yields (index in batch, message)
+# for the invalid ones. Checking a whole column of a batch at once keeps the
+# per-value work to a couple of local lookups.
+
+INTEGER_RE = re.compile(r"-?[0-9]+")
+
+
+def max_length_checker(max_length):
+    def check(values):
+        for index, value in enumerate(values):
+            if not value:
+                yield index, "Empty value"
+            elif len(value) > max_length:
+                yield index, "Longer than %s characters" % (max_length,)
+
+    return check
+
+
+def check_integer_column(column):
+    # the range the generator draws from, bounds may be swapped or missing
+    low, high = integer_range(column)
+    nullable = column.null_ratio > 0
+
+    def check(values):
+        for index, value in enumerate(values):
+            if nullable and not value:
+                continue
+            # int() also takes "5_000", " 5" and non-ASCII digits
+            if not INTEGER_RE.fullmatch(value):
+                yield index, "Not an integer"
+                continue
+            if not low <= int(value) <= high:
+                yield index, "Not in range %s..%s" % (low, high)
+
+    return check
+
+
+def check_fullname_column(column):
+    return max_length_checker(VALUE_MAX_LENGTHS[FULLNAME_CH])
+
+
+def check_job_column(column):
+    return max_length_checker(VALUE_MAX_LENGTHS[JOB_CH])
+
+
+def check_company_column(column):
+    return max_length_checker(VALUE_MAX_LENGTHS[COMPANY_CH])
+
+
+def check_phone_column(column):
+    search = PhoneColumn.phone_regex.regex.search
+
+    def check(values):
+        for index, value in enumerate(values):
+            if not search(value):
+                yield index, PhoneColumn.phone_regex.message
+
+    return check
+
+
+def check_foreign_key_column(column):
+    # values have to be valid for the referenced column, whether they exist
+    # in the parent table is not checked
+    referenced = referenced_column(column)
+    if referenced is None:
+
+        def check_empty(values):
+            for index, value in enumerate(values):
+                if value:
+                    yield index, "Not empty, no referenced column"
+
+        return check_empty
+    check_referenced = column_checkers[referenced.column_type](referenced)
+    if not column.null_ratio:
+        return check_referenced
+
+    def check(values):
+        present = [index for index, value in enumerate(values) if value]
+        for position, message in check_referenced([values[i] for i in present]):
+            yield present[position], message
+
+    return check
+
+
+column_checkers = {
+    INTEGER_CH: check_integer_column,
+    FULLNAME_CH: check_fullname_column,
+    JOB_CH: check_job_column,
+    PHONE_CH: check_phone_column,
+    COMPANY_CH: check_company_column,
+    FOREIGN_KEY_CH: check_foreign_key_column,
+}
+
+
+def validate_csv(schema, stream, has_header=True, batch_size=10000, max_errors=100):
+    # Streams the binary file-like `stream` through csv.reader configured
+    # with the schema's separator and string character, so memory use only
+    # depends on batch_size. Returns a summary with the first max_errors
+    # errors and per-column error counts.
+    columns = load_columns(schema)
+    checkers = [column_checkers[column.column_type](column) for column in columns]
+    text = codecs.getreader("utf-8")(stream, errors="replace")
+    reader = csv.reader(
+        text, delimiter=schema.column_separator, quotechar=schema.string_character
+    )
+
+    errors = []
+    errors_by_column = Counter()
+    row_errors_count = 0
+    invalid_rows_count = 0
+    rows_count = 0
+
+    def add_error(row_number, column_name, message, value=None):
+        if len(errors) < max_errors:
+            errors.append(
+                {
+                    "row": row_number,
+                    "column": column_name,
+                    "value": value[:100] if value is not None else None,
+                    "message": message,
+                }
+            )
+
+    def numbered_rows():
+        # row numbers are the 1-based line numbers the records start on,
+        # quoted values may span several lines
+        while True:
+            row_number = reader.line_num + 1
+            row = next(reader, None)
+            if row is None:
+                return
+            yield row_number, row
+
+    if has_header:
+        header = next(reader, None)
+        expected = [column.name for column in columns]
+        if header != expected:
+            add_error(1, None, "Header should be: %s" % (", ".join(expected),))
+            row_errors_count += 1
+
+    rows = numbered_rows()
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        # only the current batch is tracked, so memory does not grow with the file
+        invalid_in_batch = set()
+        valid_batch = []
+        valid_numbers = []
+        for row_number, row in batch:
+            if not row:
+                # a blank line
+                continue
+            rows_count += 1
+            if len(row) != len(columns):
+                message = "Expected %s values, got %s" % (len(columns), len(row))
+                add_error(row_number, None, message)
+                row_errors_count += 1
+                invalid_in_batch.add(row_number)
+            else:
+                valid_batch.append(row)
+                valid_numbers.append(row_number)
+        for column, checker, values in zip(columns, checkers, zip(*valid_batch)):
+            for index, message in checker(values):
+                add_error(valid_numbers[index], column.name, message, values[index])
+                errors_by_column[column.name] += 1
+                invalid_in_batch.add(valid_numbers[index])
+        invalid_rows_count += len(invalid_in_batch)
+
+    return {
+        "schema": schema.pk,
+        "rows": rows_count,
+        "invalid_rows": invalid_rows_count,
+        "errors_count": row_errors_count + sum(errors_by_column.values()),
+        "row_errors_count": row_errors_count,
+        "errors_by_column": dict(errors_by_column),
+        "errors": errors,
+    }
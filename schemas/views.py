@@ -1,13 +1,34 @@
+from functools import partial
+
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.generic import TemplateView, ListView
-from django.urls import reverse_lazy
+from django.views.generic import TemplateView, ListView, DetailView
+from django.urls import reverse, reverse_lazy
 from django.views.generic.edit import DeleteView
-from django.views.decorators.http import require_POST
-from .forms import DataSchemaForm
+from django.views.decorators.http import require_GET, require_POST, condition
+from django.views.decorators.cache import cache_control
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.decorators import method_decorator
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.conf import settings
+from .forms import DataSchemaForm, column_form_class
+from . import bulk, dataset_cache, exports, metrics, preview, tracing
+from .compression import compress_chunks, compressed_filename, compression_methods
+from .generation import load_columns
+from .admission import limit_concurrency
+from .routers import replica_reads
+from haystack.query import SearchQuerySet
 from schemas.models import *
-from django.http import HttpResponseServerError
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseServerError,
+    StreamingHttpResponse,
+)
 from django.apps import apps
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.forms.models import model_to_dict
 from django.forms import ModelForm
 from crispy_forms.helper import FormHelper
@@ -23,9 +44,115 @@ from crispy_forms.layout import (
 )
 
 
+def csrf_etag_part(request):
+    # the pages contain forms with CSRF tokens, so a cached copy
+    # is only valid for the same CSRF cookie
+    return request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")[:8]
+
+
+def all_schemas_state(request):
+    # one aggregate query over DataSchemas, memoized for both validators
+    if not hasattr(request, "_all_schemas_state"):
+        request._all_schemas_state = DataSchemas.objects.aggregate(
+            count=Count("pk"), last_modified=Max("modified_at")
+        )
+    return request._all_schemas_state
+
+
+def all_schemas_etag(request, *args, **kwargs):
+    state = all_schemas_state(request)
+    last_modified = state["last_modified"]
+    return '"schemas-%s-%s-%s"' % (
+        state["count"],
+        last_modified.timestamp() if last_modified else 0,
+        csrf_etag_part(request),
+    )
+
+
+def all_schemas_last_modified(request, *args, **kwargs):
+    return all_schemas_state(request)["last_modified"]
+
+
+def schema_state(request, pk):
+    if not hasattr(request, "_schema_state"):
+        request._schema_state = (
+            DataSchemas.objects.filter(pk=pk).values("version", "modified_at").first()
+        )
+    return request._schema_state
+
+
+def schema_etag(request, pk, *args, **kwargs):
+    state = schema_state(request, pk)
+    if state is None:
+        return None
+    return '"schema-%s-%s-%s"' % (pk, state["version"], csrf_etag_part(request))
+
+
+def schema_last_modified(request, pk, *args, **kwargs):
+    state = schema_state(request, pk)
+    return state["modified_at"] if state else None
+
+
+@method_decorator(
+    [
+        cache_control(private=True, no_cache=True),
+        condition(
+            etag_func=all_schemas_etag, last_modified_func=all_schemas_last_modified
+        ),
+    ],
+    name="get",
+)
 class AllSchemasView(ListView):
     model = DataSchemas
     template_name = "all_schemas.html"
+    replica_reads = True
+
+
+@method_decorator(
+    [
+        cache_control(private=True, no_cache=True),
+        condition(etag_func=schema_etag, last_modified_func=schema_last_modified),
+    ],
+    name="get",
+)
+class SchemaDetailView(DetailView):
+    model = DataSchemas
+    template_name = "schema_detail.html"
+    context_object_name = "schema"
+    replica_reads = True
+
+    def get_context_data(self, **kwargs):
+        context = super(SchemaDetailView, self).get_context_data(**kwargs)
+        context["columns"] = load_columns(self.object)
+        context["export_formats"] = exports.EXPORT_FORMAT_CHOICES
+        context["compression_methods"] = list(compression_methods)
+        return context
+
+
+def preview_etag(request, pk, *args, **kwargs):
+    # the fragment has no form, the CSRF cookie does not matter
+    state = schema_state(request, pk)
+    if state is None:
+        return None
+    return '"preview-%s-%s-%s"' % (pk, state["version"], settings.SCHEMA_PREVIEW_ROWS)
+
+
+@replica_reads
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=preview_etag)
+def schema_preview(request, pk):
+    # requested by the editor page once it has loaded, so that a column
+    # edit does not wait for the rows to be generated
+    state = schema_state(request, pk)
+    if state is None:
+        raise Http404
+    column_names, rows = preview.schema_preview(pk, state["version"])
+    return render(
+        request,
+        "schema_preview.html",
+        {"column_names": column_names, "rows": rows},
+    )
 
 
 @require_POST
@@ -36,6 +163,205 @@ def delete_schema(request, pk):
     return redirect("all_schemas")
 
 
+@replica_reads
+def search_schemas(request):
+    query = request.GET.get("q", "").strip()
+    schema_results = []
+    column_results = []
+    hits = 0
+    if query:
+        search_results = SearchQuerySet().auto_query(query)
+        results = list(search_results[:100])
+        hits = search_results.count()
+        # only ids are stored in the column documents,
+        # so schema names are always current
+        schemas = DataSchemas.objects.in_bulk(
+            {result.schema_id for result in results if result.model is not DataSchemas}
+            | {int(result.pk) for result in results if result.model is DataSchemas}
+        )
+        for result in results:
+            if result.model is DataSchemas:
+                if int(result.pk) in schemas:
+                    schema_results.append(schemas[int(result.pk)])
+            elif result.schema_id in schemas:
+                column_results.append((schemas[result.schema_id], result))
+    return render(
+        request,
+        "search_results.html",
+        {
+            "query": query,
+            "hits": hits,
+            "schema_results": schema_results,
+            "column_results": column_results,
+        },
+    )
+
+
+@require_POST
+@limit_concurrency("clone")
+def clone_schema(request, pk):
+    schema = get_object_or_404(DataSchemas, pk=pk)
+    bulk.clone_schema(schema)
+    return redirect("all_schemas")
+
+
+def int_param(request, name, default, low, high):
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        return None
+    return value if low <= value <= high else None
+
+
+def export_params(request):
+    # ?format=csv|copy|copy-binary|insert|ddl&rows=N&seed=S&compress=gzip|zstd,
+    # returns ((format, rows, seed, compression), None) or (None, error response)
+    export_format = request.GET.get("format", "csv")
+    if export_format not in exports.export_formats:
+        return None, HttpResponseBadRequest(
+            "format must be one of: %s" % (", ".join(exports.export_formats),)
+        )
+    rows = int_param(request, "rows", 100, 0, settings.EXPORT_MAX_ROWS)
+    if rows is None:
+        return None, HttpResponseBadRequest(
+            "rows must be between 0 and %s" % (settings.EXPORT_MAX_ROWS,)
+        )
+    seed = int_param(request, "seed", 0, 0, 2**63)
+    if seed is None:
+        return None, HttpResponseBadRequest("seed must be a non-negative integer")
+    compression = request.GET.get("compress") or None
+    if compression is not None and compression not in compression_methods:
+        return None, HttpResponseBadRequest(
+            "compress must be one of: %s" % (", ".join(compression_methods),)
+        )
+    return (export_format, rows, seed, compression), None
+
+
+def export_response(
+    schema,
+    columns,
+    export_format,
+    rows,
+    seed,
+    compression=None,
+    streaming_class=StreamingHttpResponse,
+    file_class=FileResponse,
+):
+    # the same seed always produces the same data, streamed chunk by chunk
+    # or read from the dataset cache, which keeps it uncompressed
+    content_type = exports.export_formats[export_format][1]
+    filename = exports.export_filename(schema, export_format)
+    if compression is not None:
+        content_type = compression_methods[compression][3]
+        filename = compressed_filename(filename, compression)
+    cache_status = None
+    if not dataset_cache.cache_enabled():
+        chunks = exports.export_schema(schema, columns, rows, export_format, seed)
+    else:
+        key = dataset_cache.dataset_key(schema, columns, rows, export_format, seed)
+        dataset = dataset_cache.open_cached_dataset(key)
+        if dataset is not None and compression is None:
+            response = file_class(
+                dataset,
+                as_attachment=True,
+                filename=filename,
+                content_type=content_type,
+            )
+            response["X-Dataset-Cache"] = "hit"
+            return response
+        if dataset is not None:
+            chunks = dataset_cache.read_blocks(dataset)
+            cache_status = "hit"
+        else:
+            chunks = dataset_cache.cache_dataset(
+                key,
+                exports.export_schema(
+                    schema,
+                    columns,
+                    rows,
+                    export_format,
+                    seed,
+                    chunks=dataset_cache.dataset_chunks(columns, rows, seed),
+                ),
+            )
+            cache_status = "miss"
+    if compression is not None:
+        chunks = compress_chunks(chunks, compression)
+    response = streaming_class(chunks, content_type=content_type)
+    response["Content-Disposition"] = 'attachment; filename="%s"' % (filename,)
+    if cache_status is not None:
+        response["X-Dataset-Cache"] = cache_status
+    return response
+
+
+@replica_reads
+@require_GET
+@limit_concurrency("export")
+def export_schema(request, pk):
+    schema = get_object_or_404(DataSchemas, pk=pk)
+    params, error_response = export_params(request)
+    if error_response is not None:
+        return error_response
+    metrics.tag(request, "export", format=params[0])
+    # columns are read here, streaming happens after the view has returned
+    return export_response(schema, load_columns(schema), *params)
+
+
+@staff_member_required
+def traces_view(request):
+    # one row of bars per span depth, positioned relative to the request
+    traces = tracing.recent_traces()
+    for trace in traces:
+        duration = trace["duration"] or 1
+        trace["rows"] = []
+        for span in trace["spans"]:
+            span["left"] = 100 * span["start"] / duration
+            span["width"] = max(100 * span["duration"] / duration, 0.2)
+            while len(trace["rows"]) < span["depth"]:
+                trace["rows"].append([])
+            trace["rows"][span["depth"] - 1].append(span)
+    return render(
+        request,
+        "traces.html",
+        {"traces": traces, "slow_seconds": settings.TRACING_SLOW_SECONDS},
+    )
+
+
+@require_GET
+def metrics_view(request):
+    # scraped from the same machine, never through the Heroku router
+    if (
+        request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS
+        or "HTTP_X_FORWARDED_FOR" in request.META
+        or not settings.METRICS_DIR
+    ):
+        raise Http404
+    return HttpResponse(
+        metrics.prometheus_text(), content_type="text/plain; version=0.0.4"
+    )
+
+
+class EditConflict(Exception):
+    pass
+
+
+def claim_schema_version(schema_pk, form_data):
+    # Optimistic concurrency: the forms carry the schema version they were
+    # rendered with, a write only goes ahead while it is still current and
+    # moves it on. Called inside the transaction of the write, nothing is
+    # locked between requests. Posts without a version (older pages, API
+    # style clients) keep the last write winning.
+    version = form_data.get("version")
+    if not version:
+        return
+    try:
+        version = int(version)
+    except ValueError:
+        raise EditConflict()
+    if not DataSchemas.claim_version(schema_pk, version):
+        raise EditConflict()
+
+
 class SchemaView(TemplateView):
     template_name = "schema_create_update.html"
 
@@ -51,6 +377,7 @@ class SchemaView(TemplateView):
         "jobcolumn": JOB_CH,
         "companycolumn": COMPANY_CH,
         "phonecolumn": PHONE_CH,
+        "foreignkeycolumn": FOREIGN_KEY_CH,
     }
 
     def save_schema_columns(self, schema, form):
@@ -85,18 +412,7 @@ class SchemaView(TemplateView):
                 column.save()
 
     def get_general_column_form(self, model_class, column_pk):
-        class ColumnFormGeneral(ModelForm):
-            def __init__(self, *args, **kwargs):
-                super(ColumnFormGeneral, self).__init__(*args, **kwargs)
-                self.helper = FormHelper(self)
-                save_chng_btn = "save_schema_columns_chng_btn_%s" % (column_pk,)
-                self.helper.layout.append(Submit(save_chng_btn, "Save changes"))
-
-            class Meta:
-                model = model_class
-                exclude = ["schema", "order"]
-
-        return ColumnFormGeneral
+        return partial(column_form_class(model_class), column_pk=column_pk)
 
     def process_btn_add_column(self, elem, form_data):
         # print('Add Column button processing')
@@ -110,9 +426,13 @@ class SchemaView(TemplateView):
             new_column.order = form.cleaned_data["add_column_order"]
             new_column.schema = schema
             try:
-                new_column.save()
-            except Exception as err:
-                pass
+                # a rejected insert rolls the version claim back with it
+                with transaction.atomic():
+                    claim_schema_version(self.pk, form_data)
+                    new_column.save()
+            except (ValidationError, IntegrityError) as err:
+                form.add_error(None, getattr(err, "messages", None) or str(err))
+                return (self.pk, form)
         else:
             return HttpResponseServerError()
         return (self.pk, None)
@@ -120,8 +440,14 @@ class SchemaView(TemplateView):
     def process_btn_delete_column(self, elem, form_data):
         # print('Delete Column button processing')
         column_pk = [int(s) for s in elem.split("_") if s.isdigit()][0]
-        self.pk = SchemaColumn.objects.get(pk=column_pk).schema.pk
-        SchemaColumn.objects.get(pk=column_pk).delete()
+        column = SchemaColumn.objects.filter(pk=column_pk).first()
+        if column is None:
+            # deleted by someone else
+            raise EditConflict()
+        self.pk = column.schema_id
+        with transaction.atomic():
+            claim_schema_version(self.pk, form_data)
+            column.delete()
         return (self.pk, None)
 
     def process_btn_edit_column_details(self, elem, form_data):
@@ -141,11 +467,11 @@ class SchemaView(TemplateView):
                 # print(model_to_dict(column, fields=[field.name for field in column._meta.fields]))
 
                 form_class = self.get_general_column_form(column_model, column_pk)
-                form = form_class(
-                    initial=model_to_dict(
-                        column, fields=[field.name for field in column._meta.fields]
-                    )
+                initial = model_to_dict(
+                    column, fields=[field.name for field in column._meta.fields]
                 )
+                initial["version"] = column.schema.version
+                form = form_class(initial=initial)
                 break
         return (None, form)
 
@@ -154,12 +480,14 @@ class SchemaView(TemplateView):
         self.pk = [int(s) for s in elem.split("_") if s.isdigit()][0]
         form = DataSchemaForm(form_data, schema_pk=self.pk)
         if form.is_valid():
-            schema = get_object_or_404(DataSchemas, pk=self.pk)
-            schema.name = form.cleaned_data["name"]
-            schema.column_separator = form.cleaned_data["column_separator"]
-            schema.string_character = form.cleaned_data["string_character"]
-            schema.save()
-            self.save_schema_columns(schema, form)
+            with transaction.atomic():
+                claim_schema_version(self.pk, form_data)
+                schema = get_object_or_404(DataSchemas, pk=self.pk)
+                schema.name = form.cleaned_data["name"]
+                schema.column_separator = form.cleaned_data["column_separator"]
+                schema.string_character = form.cleaned_data["string_character"]
+                schema.save()
+                self.save_schema_columns(schema, form)
         else:
             return HttpResponseServerError()
         return (self.pk, None)
@@ -183,7 +511,9 @@ class SchemaView(TemplateView):
                 # print()
 
                 if form.is_valid():
-                    form.save()
+                    with transaction.atomic():
+                        claim_schema_version(self.pk, form_data)
+                        form.save()
                 else:
                     return (self.pk, form)
 
@@ -218,6 +548,7 @@ class SchemaView(TemplateView):
                 return redirect("all_schemas")
         form = None
         btn_pressed = None
+        conflict = False
 
         # source of key.startswith idea - https://stackoverflow.com/questions/13101853/select-post-get-parameters-with-regular-expression
         for key in request.POST:
@@ -233,18 +564,38 @@ class SchemaView(TemplateView):
                 btn_pressed = "save_schema_columns_chng"
 
             if btn_pressed is not None:
+                metrics.tag(request, "handler", handler=btn_pressed)
                 funt_to_call = self.btn_functions.get(btn_pressed)
-                self.pk, form = funt_to_call(self, key, form_data=request.POST)
+                with tracing.span("handler", handler=btn_pressed):
+                    try:
+                        self.pk, form = funt_to_call(self, key, form_data=request.POST)
+                    except EditConflict:
+                        # someone else has saved first, nothing was written:
+                        # show the current state of the schema instead
+                        self.pk = self.kwargs.get("pk")
+                        form = None
+                        conflict = True
                 break
 
         # if self.pk:
         # print('We have self.pk')
         # else:
         # print('no self.pk determined, so processing case - create new schema')
+        if conflict and not DataSchemas.objects.filter(pk=self.pk).exists():
+            return redirect("all_schemas")
         if form is None:
             form = DataSchemaForm(schema_pk=self.pk)
         context["form"] = form
-        return super(TemplateView, self).render_to_response({"form": context["form"]})
+        preview_url = None
+        if isinstance(form, DataSchemaForm) and settings.SCHEMA_PREVIEW_ROWS:
+            preview_url = reverse("schema_preview", args=[form.schema.pk])
+        response = super(TemplateView, self).render_to_response(
+            {"form": context["form"], "preview_url": preview_url, "conflict": conflict},
+            status=409 if conflict else 200,
+        )
+        # rendered here instead of by the handler, to be measured on its own
+        with tracing.span("render", template=self.template_name):
+            return response.render()
 
     def get_context_data(self, **kwargs):
         context = super(SchemaView, self).get_context_data(**kwargs)
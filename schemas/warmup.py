@@ -0,0 +1,121 @@
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.utils import get_app_template_dirs
+from django.urls import get_resolver
+from haystack import connections as search_connections
+
+from .forms import column_form_class
+from .models import COLUMN_MODELS
+
+# Work Django and the libraries otherwise leave to the first request of a
+# worker: compiling templates (kept by the cached loader when DEBUG is off),
+# populating the URL resolver, building the column form classes and the
+# search index registry, and connecting to the databases.
+#
+# gunicorn.conf.py runs warm_up(connect=False) in the master after
+# preload_app has imported the project, so the forked workers share the
+# result, and warm_up() in every worker, where only the connections are left
+# to open. Connections are never opened before forking, a child process
+# must not reuse the socket or file of its parent's connection.
+
+
+def template_names(engine):
+    # the project templates and the crispy-forms template pack
+    roots = [(str(directory), "") for directory in engine.engine.dirs]
+    roots += [
+        (str(directory), settings.CRISPY_TEMPLATE_PACK)
+        for directory in get_app_template_dirs("templates")
+    ]
+    names = set()
+    for directory, subdirectory in roots:
+        for dirpath, dirnames, filenames in os.walk(
+            os.path.join(directory, subdirectory)
+        ):
+            for filename in filenames:
+                if filename.endswith(".html"):
+                    path = os.path.relpath(os.path.join(dirpath, filename), directory)
+                    names.add(path.replace(os.sep, "/"))
+    return sorted(names)
+
+
+def compile_templates():
+    count = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        for name in template_names(engine):
+            try:
+                engine.get_template(name)
+            except (TemplateDoesNotExist, TemplateSyntaxError):
+                # fragments only meant to be included somewhere
+                continue
+            count += 1
+    return count
+
+
+def resolve_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict
+    resolver.namespace_dict
+    return len(resolver.url_patterns)
+
+
+def build_forms():
+    for model in COLUMN_MODELS.values():
+        column_form_class(model)
+    return len(COLUMN_MODELS)
+
+
+def build_search_indexes():
+    for alias in search_connections.connections_info:
+        search_connections[alias].get_unified_index().get_indexed_models()
+    return len(search_connections.connections_info)
+
+
+def open_connections():
+    # connections with CONN_MAX_AGE = 0 are closed when a request starts,
+    # opening them here would not save anything
+    count = 0
+    for connection in connections.all():
+        if connection.settings_dict["CONN_MAX_AGE"] != 0:
+            connection.ensure_connection()
+            count += 1
+    for alias in search_connections.connections_info:
+        backend = search_connections[alias].get_backend()
+        if hasattr(backend, "connection"):
+            backend.connection
+            count += 1
+    return count
+
+
+STEPS = {
+    "templates": compile_templates,
+    "urls": resolve_urls,
+    "forms": build_forms,
+    "search": build_search_indexes,
+}
+
+
+def warm_up(connect=True):
+    # returns {step: (items, seconds)}
+    steps = dict(STEPS)
+    if connect:
+        steps["connections"] = open_connections
+    timings = {}
+    for name, step in steps.items():
+        started = time.perf_counter()
+        items = step()
+        timings[name] = (items, time.perf_counter() - started)
+    return timings
+
+
+def format_timings(timings):
+    return ", ".join(
+        "%s %s in %.0f ms" % (name, items, seconds * 1000)
+        for name, (items, seconds) in timings.items()
+    )
@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+from django.conf import settings
+from haystack import connections
+
+# the signal processor indexes every save made by the tests,
+# keep those documents out of the development search index
+connections.connections_info['default']['PATH'] = os.path.join(
+    tempfile.mkdtemp(), 'search_index.sqlite3'
+)
+
+# exported datasets are cached on disk, keep them out of the project directory
+settings.DATASET_CACHE_DIR = tempfile.mkdtemp()
+settings.ADMISSION_LOCK_DIR = tempfile.mkdtemp()
+settings.METRICS_DIR = tempfile.mkdtemp()
+settings.TRACING_FILE = os.path.join(tempfile.mkdtemp(), 'traces.jsonl')
@@ -0,0 +1,108 @@
+import json
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from haystack import connections
+from haystack.query import SearchQuerySet
+from schemas.admin import EstimatedCountPaginator, estimated_count
+from schemas.models import DataSchemas, SchemaColumn, IntegerColumn, FullNameColumn, JobColumn, CompanyColumn, PhoneColumn
+
+
+def make_schema(name, columns_per_type=1):
+    schema = DataSchemas.objects.create(name=name)
+    order = 0
+    for model in [IntegerColumn, FullNameColumn, JobColumn, CompanyColumn, PhoneColumn]:
+        for i in range(columns_per_type):
+            order += 1
+            model.objects.create(name='%s_%s' % (model.__name__.lower(), i), schema=schema, order=order)
+    return schema
+
+
+# the admin pages need no collectstatic manifest with the default storage
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SchemaAdminTests(TestCase):
+
+    def setUp(self):
+        connections['default'].get_backend().clear()
+        self.schema = make_schema('Customers')
+        self.other_schema = make_schema('Suppliers', columns_per_type=2)
+        User.objects.create_superuser('admin', password='secret')
+        self.client = Client()
+        self.client.login(username='admin', password='secret')
+        self.changelist_url = reverse('admin:schemas_dataschemas_changelist')
+
+    def test_changelist_shows_column_counts(self):
+        response = self.client.get(self.changelist_url)
+        self.assertContains(response, '<td class="field-column_count">5</td>', html=True)
+        self.assertContains(response, '<td class="field-column_count">10</td>', html=True)
+        response = self.client.get(self.changelist_url, {'o': '2'})
+        self.assertEqual([schema.name for schema in response.context['cl'].result_list], ['Customers', 'Suppliers'])
+
+    def test_change_page_queries_do_not_grow_with_columns(self):
+        url = reverse('admin:schemas_dataschemas_change', args=[self.schema.pk])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url)
+        self.assertContains(response, 'range_low=-20')
+        self.assertContains(response, 'Full Name')
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('admin:schemas_dataschemas_change', args=[self.other_schema.pk]))
+        self.assertEqual(len(small), len(large))
+
+    def test_column_changelist(self):
+        url = reverse('admin:schemas_schemacolumn_changelist')
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url, {'q': 'integercolumn'})
+        self.assertContains(response, 'Integer')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url, {'q': 'column'})
+        self.assertEqual(len(response.context['cl'].result_list), 15)
+        self.assertEqual(len(small), len(large))
+
+    def test_estimated_count(self):
+        queryset = DataSchemas.objects.order_by('pk')
+        with mock.patch('schemas.admin.estimated_count', return_value=500000) as estimate:
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 500000)
+            self.assertEqual(EstimatedCountPaginator(queryset.filter(name='Customers'), 100).count, 1)
+            estimate.return_value = 10
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 2)
+            estimate.return_value = None
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 2)
+        # SQLite only has statistics after ANALYZE
+        self.assertIsNone(estimated_count(DataSchemas, 'default'))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_count(SchemaColumn, 'default'), 15)
+
+    def test_delete_action(self):
+        data = {'action': 'delete_selected', '_selected_action': [self.schema.pk, self.other_schema.pk]}
+        response = self.client.post(self.changelist_url, data)
+        self.assertContains(response, 'Schema columns: 15')
+        self.assertEqual(DataSchemas.objects.count(), 2)
+        self.assertEqual(SearchQuerySet().auto_query('customers').count(), 1)
+        response = self.client.post(self.changelist_url, dict(data, post='yes'))
+        self.assertRedirects(response, self.changelist_url)
+        self.assertEqual(DataSchemas.objects.count(), 0)
+        self.assertEqual(SchemaColumn.objects.count(), 0)
+        self.assertEqual(IntegerColumn.objects.count(), 0)
+        self.assertEqual(SearchQuerySet().count(), 0)
+
+    def test_clone_action(self):
+        data = {'action': 'clone_selected', '_selected_action': [self.schema.pk, self.other_schema.pk]}
+        self.client.post(self.changelist_url, data)
+        clones = DataSchemas.objects.filter(name__startswith='Copy of').order_by('name')
+        self.assertEqual([clone.name for clone in clones], ['Copy of Customers', 'Copy of Suppliers'])
+        self.assertEqual(clones[1].schemacolumn_set.count(), 10)
+        self.assertEqual(PhoneColumn.objects.filter(schema=clones[1]).count(), 2)
+        self.assertEqual(SearchQuerySet().auto_query('Copy').count(), 2)
+
+    def test_export_action(self):
+        data = {'action': 'export_selected', '_selected_action': [self.other_schema.pk]}
+        response = self.client.post(self.changelist_url, data)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="schemas.json"')
+        schemas = json.loads(response.content)['schemas']
+        self.assertEqual([schema['name'] for schema in schemas], ['Suppliers'])
+        self.assertEqual(len(schemas[0]['columns']), 10)
@@ -0,0 +1,154 @@
+import glob
+import multiprocessing
+import os
+import threading
+import time
+from unittest import mock
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from schemas import admission
+from schemas.models import DataSchemas, IntegerColumn
+
+LIMITS = {
+    'export': {'global': 1, 'per_client': 1, 'queue': 1, 'timeout': 0.2, 'retry_after': 3},
+    'clone': {'global': 1, 'per_client': 1, 'queue': 0, 'timeout': 0.2},
+}
+
+
+def hold_slot(name, connection):
+    slot = admission.try_lock(name)
+    connection.send(slot is not None)
+    time.sleep(30)
+
+
+@override_settings(ADMISSION_LIMITS=LIMITS, DATASET_CACHE_DIR='')
+class AdmissionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schema = DataSchemas.objects.create(name='People')
+        IntegerColumn.objects.create(name='age', schema=cls.schema, order=1)
+
+    def setUp(self):
+        self.url = reverse('export_schema', args=[self.schema.pk])
+        self.stats_before = admission.admission_stats()
+
+    def events(self, group):
+        stats = admission.admission_stats()[group]
+        return {event: stats[event] - self.stats_before[group][event] for event in admission.EVENTS}
+
+    def start_export(self, client_ip='10.0.0.1'):
+        # a streaming response keeps its slots until it is closed
+        response = self.client.get(self.url, {'rows': 10}, REMOTE_ADDR=client_ip)
+        self.assertEqual(response.status_code, 200)
+        self.addCleanup(response.close)
+        return response
+
+    def test_same_client_gets_429(self):
+        self.start_export()
+        response = self.client.get(self.url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(self.events('export')['rejected_client'], 1)
+
+    def test_other_client_waits_then_times_out(self):
+        self.start_export()
+        started = time.monotonic()
+        response = self.client.get(self.url, REMOTE_ADDR='10.0.0.2')
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(admission.admission_stats()['export']['waiting'], 0)
+        self.assertEqual(self.events('export')['timed_out'], 1)
+
+    def test_queued_request_is_admitted_when_slot_frees(self):
+        running = self.start_export()
+        timer = threading.Timer(0.05, running.close)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        with self.settings(ADMISSION_LIMITS=dict(LIMITS, export=dict(LIMITS['export'], timeout=5))):
+            response = self.client.get(self.url, {'rows': 10}, REMOTE_ADDR='10.0.0.2')
+            self.assertEqual(response.status_code, 200)
+            b''.join(response.streaming_content)
+        events = self.events('export')
+        self.assertEqual((events['admitted'], events['queued']), (2, 1))
+
+    def test_full_queue_gets_503_immediately(self):
+        clone_url = reverse('api_schema_clone', args=[self.schema.pk])
+        slot = admission.try_lock('clone-global-0')
+        self.addCleanup(slot.release)
+        started = time.monotonic()
+        response = self.client.post(clone_url)
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.events('clone')['rejected_queue_full'], 1)
+        slot.release()
+        self.assertEqual(self.client.post(clone_url).status_code, 201)
+
+    def test_slots_are_released(self):
+        self.start_export().close()
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}, REMOTE_ADDR='10.0.0.1').status_code, 400)
+        self.assertEqual(self.client.get(self.url + '0').status_code, 404)
+        stats = admission.admission_stats()['export']
+        self.assertEqual((stats['active'], stats['waiting']), (0, 0))
+        self.start_export()
+        self.assertEqual(admission.admission_stats()['export']['active'], 1)
+
+    def test_stats_do_not_take_slots(self):
+        running = self.start_export()
+        with mock.patch.object(admission, 'try_lock', side_effect=AssertionError):
+            stats = admission.admission_stats()['export']
+        self.assertEqual((stats['active'], stats['waiting']), (1, 0))
+        running.close()
+        self.assertEqual(admission.admission_stats()['export']['active'], 0)
+
+    def test_client_lock_files_are_removed(self):
+        request = RequestFactory().get(self.url, REMOTE_ADDR='10.0.0.1')
+        prefix = admission.client_prefix('export', request)
+        running = self.start_export()
+        self.assertTrue(glob.glob(admission.lock_path(prefix + '-*')))
+        running.close()
+        self.assertEqual(glob.glob(admission.lock_path(prefix + '-*')), [])
+        # a lock taken on the file just before it was removed does not count
+        stale = admission.try_lock(prefix + '-0', remove=True)
+        os.remove(admission.lock_path(prefix + '-0'))
+        self.addCleanup(stale.lock_file.close)
+        slot = admission.try_lock(prefix + '-0', remove=True)
+        self.assertIsNotNone(slot)
+        slot.release()
+
+    def test_client_is_last_forwarded_address(self):
+        self.start_export(client_ip='10.0.0.9')
+        response = self.client.get(self.url, REMOTE_ADDR='10.0.0.5', HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.9')
+        # without a trusted proxy the header is ignored
+        self.assertEqual(response.status_code, 503)
+        with self.settings(ADMISSION_TRUST_X_FORWARDED_FOR=True):
+            response = self.client.get(self.url, REMOTE_ADDR='10.0.0.5', HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.9')
+        self.assertEqual(response.status_code, 429)
+
+    def test_clients_do_not_share_slots(self):
+        # 10.0.0.0 and 10.0.0.109 fell into the same one of 256 crc32 buckets
+        first, second = (RequestFactory().get(self.url, REMOTE_ADDR=address) for address in ('10.0.0.0', '10.0.0.109'))
+        self.assertNotEqual(admission.client_prefix('export', first), admission.client_prefix('export', second))
+
+    def test_slots_are_shared_with_other_processes(self):
+        context = multiprocessing.get_context('fork')
+        parent_connection, child_connection = context.Pipe()
+        process = context.Process(target=hold_slot, args=('export-global-0', child_connection))
+        process.start()
+        self.addCleanup(process.join)
+        self.addCleanup(process.kill)
+        self.assertTrue(parent_connection.poll(5))
+        self.assertTrue(parent_connection.recv())
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.3').status_code, 503)
+        # the kernel drops the locks of a process that ends without releasing them
+        process.kill()
+        process.join()
+        response = self.client.get(self.url, REMOTE_ADDR='10.0.0.3')
+        response.close()
+        self.assertEqual(response.status_code, 200)
+
+    def test_groups_without_limits_are_not_limited(self):
+        with self.settings(ADMISSION_LIMITS={}):
+            self.start_export()
+            self.start_export()
@@ -0,0 +1,120 @@
+import json
+from django.test import Client, TestCase
+from django.urls import reverse
+from schemas.models import DataSchemas, SchemaColumn, IntegerColumn, FullNameColumn, JobColumn, CompanyColumn, PhoneColumn
+from model_bakery import baker
+
+items_number = 2
+column_classes_count = 5
+
+def createTestData():
+    schemas = baker.make('schemas.DataSchemas', _quantity=items_number)
+    int_cols = baker.make('schemas.IntegerColumn', schema=schemas[0], _quantity=items_number)
+    fullname_cols = baker.make('schemas.FullNameColumn', schema=schemas[0], _quantity=items_number)
+    job_cols = baker.make('schemas.JobColumn', schema=schemas[0], _quantity=items_number)
+    company_cols = baker.make('schemas.CompanyColumn', schema=schemas[0], _quantity=items_number)
+    phone_cols = baker.make('schemas.PhoneColumn', schema=schemas[0], _quantity=items_number)
+    return(schemas, int_cols, fullname_cols, job_cols, company_cols, phone_cols)
+
+class SchemaApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schemas, cls.int_cols, cls.fullname_cols, cls.job_cols, cls.company_cols, cls.phone_cols = createTestData()
+
+    def test_schema_detail(self):
+        response = self.client.get(reverse('api_schema_detail', args=[self.schemas[0].pk]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['name'], self.schemas[0].name)
+        self.assertEqual(len(data['columns']), items_number * column_classes_count)
+        int_column = [column for column in data['columns'] if column['name'] == self.int_cols[0].name][0]
+        self.assertEqual(int_column['type'], 'IntegerColumn')
+        self.assertEqual(int_column['range_low'], -20)
+        self.assertEqual(int_column['range_high'], 40)
+
+    def test_schema_detail_missing(self):
+        response = self.client.get(reverse('api_schema_detail', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_schema_list_constant_queries(self):
+        baker.make('schemas.PhoneColumn', schema=self.schemas[1], _quantity=10)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api_schema_list'))
+        self.assertEqual(len(response.json()['schemas']), items_number)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api_schema_list'), {'ids': self.schemas[1].pk})
+        self.assertEqual([schema['id'] for schema in response.json()['schemas']], [self.schemas[1].pk])
+
+    def test_import_round_trip(self):
+        exported = self.client.get(reverse('api_schema_list')).json()
+        response = self.client.post(reverse('api_schema_import'), json.dumps(exported), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        new_pk = response.json()['ids'][0]
+        self.assertEqual(DataSchemas.objects.count(), items_number * 2)
+        original = self.client.get(reverse('api_schema_detail', args=[self.schemas[0].pk])).json()
+        imported = self.client.get(reverse('api_schema_detail', args=[new_pk])).json()
+        self.assertEqual(imported['columns'], original['columns'])
+        for model in (IntegerColumn, FullNameColumn, JobColumn, CompanyColumn, PhoneColumn):
+            self.assertEqual(model.objects.filter(schema_id=new_pk).count(), items_number)
+
+    def test_import_invalid_phone(self):
+        data = {'schemas': [{'name': 'Bad', 'columns': [
+            {'name': 'phone', 'order': 1, 'type': 'PhoneColumn', 'phone_number': 'not a phone'}]}]}
+        response = self.client.post(reverse('api_schema_import'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DataSchemas.objects.filter(name='Bad').exists())
+
+    def test_import_duplicate_column_order(self):
+        data = {'schemas': [{'name': 'Bad', 'columns': [
+            {'name': 'a', 'order': 1, 'type': 'JobColumn'},
+            {'name': 'b', 'order': 1, 'type': 'CompanyColumn'}]}]}
+        response = self.client.post(reverse('api_schema_import'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DataSchemas.objects.filter(name='Bad').exists())
+
+    def test_import_malformed(self):
+        response = self.client.post(reverse('api_schema_import'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_non_object_entries(self):
+        for data in ({'schemas': [{'name': 'Bad', 'columns': ['x']}]}, {'schemas': ['x']}):
+            response = self.client.post(reverse('api_schema_import'), json.dumps(data), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(DataSchemas.objects.filter(name='Bad').exists())
+
+    def test_import_requires_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        data = json.dumps({'schemas': [{'name': 'Imported', 'columns': []}]})
+        response = client.post(reverse('api_schema_import'), data, content_type='text/plain')
+        self.assertEqual(response.status_code, 403)
+        client.get(reverse('all_schemas'))
+        response = client.post(reverse('api_schema_import'), data, content_type='application/json', HTTP_X_CSRFTOKEN=client.cookies['csrftoken'].value)
+        self.assertEqual(response.status_code, 201)
+
+    def test_clone(self):
+        response = self.client.post(reverse('api_schema_clone', args=[self.schemas[0].pk]))
+        self.assertEqual(response.status_code, 201)
+        clone = response.json()
+        original = self.client.get(reverse('api_schema_detail', args=[self.schemas[0].pk])).json()
+        self.assertEqual(clone['name'], ('Copy of %s' % original['name'])[:100])
+        self.assertEqual(clone['columns'], original['columns'])
+
+    def test_clone_name(self):
+        url = reverse('api_schema_clone', args=[self.schemas[0].pk])
+        self.assertEqual(self.client.post(url, {'name': 'Renamed'}).json()['name'], 'Renamed')
+        count = DataSchemas.objects.count()
+        self.assertEqual(self.client.post(url, {'name': ''}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'name': 'x' * 101}).status_code, 400)
+        self.assertEqual(DataSchemas.objects.count(), count)
+        self.assertEqual(Client(enforce_csrf_checks=True).post(url).status_code, 403)
+
+    def test_clone_fixed_number_of_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from schemas.bulk import clone_schema
+        with CaptureQueriesContext(connection) as small_clone:
+            clone_schema(self.schemas[0])
+        baker.make('schemas.JobColumn', schema=self.schemas[0], _quantity=50)
+        with self.assertNumQueries(len(small_clone.captured_queries)):
+            clone_schema(self.schemas[0])
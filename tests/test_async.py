@@ -0,0 +1,151 @@
+import asyncio
+import tempfile
+import time
+from unittest import mock
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import include, path, reverse
+from schemas import admission, async_views
+from schemas.asgi import AsyncStreamingHttpResponse, StreamingASGIHandler
+from schemas.models import DataSchemas, IntegerColumn, FullNameColumn, PhoneColumn
+from schemas.views import export_schema as sync_export_schema
+
+# the async views in front of the normal ones, as urls.py does with ASYNC_VIEWS
+urlpatterns = [
+    path('', async_views.all_schemas, name='all_schemas'),
+    path('schema/<int:pk>/export/', async_views.export_schema, name='export_schema'),
+    path('sync/<int:pk>/export/', sync_export_schema),
+    path('', include('schemas.urls')),
+]
+
+
+def request_scope(path, query_string=''):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 5000), 'server': ('testserver', 80),
+    }
+
+
+async def call_asgi(scope, disconnect_after=None):
+    # returns the status and the body chunks of one request, the client
+    # disconnects after `disconnect_after` body chunks if set
+    messages = []
+    disconnected = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+        if message['type'] == 'http.response.body' and message.get('body'):
+            if disconnect_after and len(messages) - 1 >= disconnect_after:
+                disconnected.set()
+                await asyncio.sleep(0)
+
+    await StreamingASGIHandler()(scope, receive, send)
+    return messages[0]['status'], [message.get('body', b'') for message in messages[1:]]
+
+
+@override_settings(ROOT_URLCONF='tests.test_async', DATASET_CACHE_DIR='', ADMISSION_LIMITS={})
+class AsyncViewTests(TransactionTestCase):
+
+    def setUp(self):
+        self.schema = DataSchemas.objects.create(name='People')
+        IntegerColumn.objects.create(name='age', schema=self.schema, order=1)
+        FullNameColumn.objects.create(name='name', schema=self.schema, order=2)
+        PhoneColumn.objects.create(name='phone', schema=self.schema, order=3)
+        self.client = Client()
+
+    def test_schema_list(self):
+        # the first response sets the CSRF cookie, which is part of the ETag
+        self.client.get(reverse('all_schemas'))
+        response = self.client.get(reverse('all_schemas'))
+        self.assertContains(response, 'People')
+        self.assertIn('private', response['Cache-Control'])
+        response = self.client.get(reverse('all_schemas'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.post(reverse('all_schemas')).status_code, 405)
+
+    def test_export_matches_sync_view(self):
+        response = self.client.get(reverse('export_schema', args=[self.schema.pk]), {'rows': 25000, 'seed': 4})
+        sync_response = self.client.get('/sync/%s/export/' % self.schema.pk, {'rows': 25000, 'seed': 4})
+        self.assertEqual(response['Content-Disposition'], sync_response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), b''.join(sync_response.streaming_content))
+        self.assertEqual(self.client.get(reverse('export_schema', args=[self.schema.pk]), {'rows': -1}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_schema', args=[self.schema.pk + 1])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('export_schema', args=[self.schema.pk])).status_code, 405)
+
+    def test_asgi_streaming(self):
+        path = reverse('export_schema', args=[self.schema.pk])
+        status, body = asyncio.run(call_asgi(request_scope(path, 'rows=25000&seed=4')))
+        self.assertEqual(status, 200)
+        self.assertGreater(len(body), 3)
+        sync_response = self.client.get('/sync/%s/export/' % self.schema.pk, {'rows': 25000, 'seed': 4})
+        self.assertEqual(b''.join(body), b''.join(sync_response.streaming_content))
+
+    def test_event_loop_is_not_blocked(self):
+        gaps = []
+
+        async def ticker(done):
+            last = time.monotonic()
+            while not done.is_set():
+                await asyncio.sleep(0.001)
+                gaps.append(time.monotonic() - last)
+                last = time.monotonic()
+
+        async def run():
+            done = asyncio.Event()
+            tick = asyncio.ensure_future(ticker(done))
+            path = reverse('export_schema', args=[self.schema.pk])
+            started = time.monotonic()
+            result = await call_asgi(request_scope(path, 'rows=200000'))
+            elapsed = time.monotonic() - started
+            done.set()
+            await tick
+            return result, elapsed
+
+        (status, body), elapsed = asyncio.run(run())
+        self.assertEqual(status, 200)
+        # generating 200000 rows takes many times the longest pause of the loop
+        self.assertLess(max(gaps), elapsed / 4)
+
+    def test_client_disconnect_stops_the_export(self):
+        path = reverse('export_schema', args=[self.schema.pk])
+        status, body = asyncio.run(call_asgi(request_scope(path, 'rows=1000000'), disconnect_after=2))
+        self.assertEqual(status, 200)
+        self.assertLess(len(body), 10)
+
+    def test_streamed_response_is_closed(self):
+        path = reverse('export_schema', args=[self.schema.pk])
+        for query_string, disconnect_after in (('rows=10', None), ('rows=1000000', 2)):
+            with mock.patch.object(AsyncStreamingHttpResponse, 'close', autospec=True) as close:
+                asyncio.run(call_asgi(request_scope(path, query_string), disconnect_after=disconnect_after))
+            close.assert_called_once()
+
+    def test_queued_export_does_not_delay_other_requests(self):
+        limits = {'export': {'global': 1, 'per_client': 1, 'queue': 1, 'timeout': 2}}
+
+        async def run():
+            export = asyncio.ensure_future(call_asgi(request_scope(reverse('export_schema', args=[self.schema.pk]), 'rows=10')))
+            await asyncio.sleep(0.2)
+            started = time.monotonic()
+            status, body = await call_asgi(request_scope(reverse('all_schemas')))
+            elapsed = time.monotonic() - started
+            return status, elapsed, await export
+
+        with tempfile.TemporaryDirectory() as lock_dir, self.settings(ADMISSION_LIMITS=limits, ADMISSION_LOCK_DIR=lock_dir):
+            # another worker holds the only export slot, so the export waits in the queue
+            slot = admission.try_acquire('export-global', 1)
+            try:
+                status, elapsed, (export_status, export_body) = asyncio.run(run())
+            finally:
+                slot.release()
+        self.assertEqual(status, 200)
+        self.assertLess(elapsed, 1)
+        self.assertEqual(export_status, 503)
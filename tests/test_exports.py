@@ -0,0 +1,450 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from schemas import dataset_cache, sharding
+from schemas.compression import compress_chunks
+from schemas.sharding import export_shards
+from django.urls import reverse
+from schemas.exports import export_schema, PGCOPY_HEADER, PGCOPY_TRAILER
+from schemas.generation import generate_chunks, generate_column_chunks, load_columns
+from schemas.models import DataSchemas, IntegerColumn, FullNameColumn, JobColumn, PhoneColumn, NORMAL, SEQUENTIAL, ZIPF
+from schemas.validation import validate_csv
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schema = DataSchemas.objects.create(name='People', column_separator=';', string_character="'")
+        IntegerColumn.objects.create(name='age', schema=cls.schema, order=1, range_low=18, range_high=65)
+        FullNameColumn.objects.create(name='name', schema=cls.schema, order=2)
+        JobColumn.objects.create(name='job', schema=cls.schema, order=3, job_name="Tab\there O'Neil")
+        PhoneColumn.objects.create(name='phone', schema=cls.schema, order=4)
+
+    def export(self, rows, export_format, seed=0):
+        return b''.join(export_schema(self.schema, load_columns(self.schema), rows, export_format, seed))
+
+    def test_generation_is_deterministic_and_chunked(self):
+        columns = load_columns(self.schema)
+        chunks = list(generate_chunks(columns, 25, seed=3, chunk_size=10))
+        self.assertEqual([len(chunk[0]) for chunk in chunks], [10, 10, 5])
+        self.assertEqual(chunks, list(generate_chunks(columns, 25, seed=3, chunk_size=10)))
+        self.assertNotEqual(chunks, list(generate_chunks(columns, 25, seed=4, chunk_size=10)))
+        self.assertTrue(all(18 <= age <= 65 for chunk in chunks for age in chunk[0]))
+
+    def test_csv_export_validates_against_schema(self):
+        data = self.export(500, 'csv')
+        self.assertTrue(data.startswith(b"'age';'name';'job';'phone'\n"))
+        self.assertEqual(data.count(b'\n'), 501)
+        summary = validate_csv(self.schema, io.BytesIO(data.replace(b"'age';'name';'job';'phone'", b'age;name;job;phone')))
+        self.assertEqual(summary['errors'], [])
+        self.assertEqual(summary['rows'], 500)
+
+    def test_create_table(self):
+        data = self.export(0, 'ddl').decode()
+        self.assertEqual(
+            data,
+            'CREATE TABLE "People" (\n'
+            '    "age" integer,\n'
+            '    "name" varchar(26),\n'
+            '    "job" varchar(100),\n'
+            '    "phone" varchar(17)\n'
+            ');\n'
+        )
+
+    def test_copy_text_export(self):
+        data = self.export(3, 'copy').decode()
+        self.assertIn('COPY "People" ("age", "name", "job", "phone") FROM STDIN;\n', data)
+        self.assertTrue(data.endswith('\\.\n'))
+        rows = data.split('FROM STDIN;\n')[1].splitlines()[:-1]
+        self.assertEqual(len(rows), 3)
+        for row in rows:
+            values = row.split('\t')
+            self.assertEqual(len(values), 4)
+            self.assertEqual(values[2], "Tab\\there O'Neil")
+
+    def test_copy_binary_export(self):
+        data = self.export(20, 'copy-binary')
+        self.assertTrue(data.startswith(PGCOPY_HEADER))
+        self.assertTrue(data.endswith(PGCOPY_TRAILER))
+        offset = len(PGCOPY_HEADER)
+        rows = []
+        while True:
+            (field_count,) = struct.unpack_from('>h', data, offset)
+            offset += 2
+            if field_count == -1:
+                break
+            self.assertEqual(field_count, 4)
+            row = []
+            for _ in range(field_count):
+                (length,) = struct.unpack_from('>i', data, offset)
+                offset += 4
+                row.append(data[offset:offset + length])
+                offset += length
+            rows.append(row)
+        self.assertEqual(offset, len(data))
+        self.assertEqual(len(rows), 20)
+        for age, name, job, phone in rows:
+            self.assertTrue(18 <= struct.unpack('>i', age)[0] <= 65)
+            self.assertEqual(job.decode(), "Tab\there O'Neil")
+
+    def test_insert_export_is_batched(self):
+        data = self.export(2500, 'insert').decode()
+        self.assertTrue(data.startswith('BEGIN;\nCREATE TABLE "People"'))
+        self.assertTrue(data.endswith('COMMIT;\n'))
+        self.assertEqual(data.count('INSERT INTO "People" ("age", "name", "job", "phone") VALUES\n'), 3)
+        self.assertIn("'Tab\there O''Neil'", data)
+
+    def test_csv_and_copy_contain_the_same_values(self):
+        csv_rows = self.export(50, 'csv', seed=7).decode().splitlines()[1:]
+        copy_rows = self.export(50, 'copy', seed=7).decode().split('FROM STDIN;\n')[1].splitlines()[:-1]
+        self.assertEqual([row.split(';')[0] for row in csv_rows], [row.split('\t')[0] for row in copy_rows])
+
+
+class IntegerDistributionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schema = DataSchemas.objects.create(name='Numbers')
+
+    def values(self, rows=20000, **params):
+        params.setdefault('range_low', 10)
+        params.setdefault('range_high', 1009)
+        column = IntegerColumn.objects.create(name='n%s' % IntegerColumn.objects.count(), schema=self.schema, order=IntegerColumn.objects.count() + 1, **params)
+        return [value for chunk in generate_column_chunks(column, rows, chunk_size=3000) for value in chunk]
+
+    def test_values_stay_in_range(self):
+        for distribution in ['uniform', NORMAL, ZIPF, SEQUENTIAL]:
+            values = self.values(distribution=distribution)
+            self.assertEqual(len(values), 20000)
+            self.assertTrue(all(type(value) is int and 10 <= value <= 1009 for value in values), distribution)
+
+    def test_sequential_continues_across_chunks_and_wraps(self):
+        self.assertEqual(self.values(rows=2500, distribution=SEQUENTIAL), list(range(10, 1010)) * 2 + list(range(10, 510)))
+
+    def test_normal_is_centered(self):
+        values = self.values(distribution=NORMAL)
+        self.assertAlmostEqual(sum(values) / len(values), 509.5, delta=10)
+        # one standard deviation is a sixth of the range
+        self.assertAlmostEqual(sum(1 for value in values if 343 <= value <= 676) / len(values), 0.68, delta=0.02)
+
+    def test_zipf_is_skewed_to_low_end(self):
+        values = self.values(distribution=ZIPF, zipf_exponent=2.0)
+        self.assertAlmostEqual(values.count(10) / len(values), 0.61, delta=0.03)
+        self.assertGreater(values.count(10), values.count(11))
+
+    def test_null_ratio(self):
+        values = self.values(null_ratio=0.25)
+        self.assertAlmostEqual(values.count(None) / len(values), 0.25, delta=0.02)
+        self.assertEqual(self.values(null_ratio=1.0).count(None), 20000)
+
+    def test_generated_nulls_pass_validation(self):
+        IntegerColumn.objects.create(name='n', schema=self.schema, order=1, null_ratio=0.5)
+        data = b''.join(export_schema(self.schema, load_columns(self.schema), 100, 'csv'))
+        self.assertIn(b'""', data)
+        self.assertEqual(validate_csv(self.schema, io.BytesIO(data.replace(b'"n"', b'n')))['errors'], [])
+
+    def test_parameters_are_validated(self):
+        column = IntegerColumn(name='n', schema=self.schema, order=1, null_ratio=1.5, zipf_exponent=1, distribution='cubic')
+        with self.assertRaises(ValidationError) as context:
+            column.full_clean()
+        self.assertEqual(set(context.exception.error_dict), {'null_ratio', 'zipf_exponent', 'distribution'})
+
+    def test_edit_form_has_distribution_fields(self):
+        column = IntegerColumn.objects.create(name='n', schema=self.schema, order=1)
+        response = self.client.post(reverse('schema_create_update', args=[self.schema.pk]), {'edit_col_%s' % column.pk: ''})
+        self.assertContains(response, 'name="distribution"')
+        self.assertContains(response, 'name="null_ratio"')
+        response = self.client.post(reverse('schema_create_update', args=[self.schema.pk]), {
+            'save_schema_columns_chng_btn_%s' % column.pk: '', 'name': 'n', 'range_low': 1, 'range_high': 5,
+            'distribution': ZIPF, 'zipf_exponent': 1.5, 'null_ratio': 0.1,
+        })
+        column.refresh_from_db()
+        self.assertEqual((column.distribution, column.zipf_exponent, column.null_ratio), (ZIPF, 1.5, 0.1))
+
+
+class ExportViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schema = DataSchemas.objects.create(name='People')
+        IntegerColumn.objects.create(name='age', schema=cls.schema, order=1)
+
+    def test_streams_attachment(self):
+        response = self.client.get(reverse('export_schema', args=[self.schema.pk]), {'format': 'insert', 'rows': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/sql')
+        self.assertIn('schema_%s.sql' % self.schema.pk, response['Content-Disposition'])
+        data = b''.join(response.streaming_content).decode()
+        self.assertEqual(data.count('\n('), 10)
+
+    def test_bad_parameters(self):
+        url = reverse('export_schema', args=[self.schema.pk])
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'rows': 'many'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'rows': -1}).status_code, 400)
+        with self.settings(EXPORT_MAX_ROWS=10):
+            self.assertEqual(self.client.get(url, {'rows': 11}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_schema', args=[self.schema.pk + 1])).status_code, 404)
+
+    def test_detail_page_has_export_form(self):
+        response = self.client.get(reverse('schema_detail', args=[self.schema.pk]))
+        self.assertContains(response, reverse('export_schema', args=[self.schema.pk]))
+        self.assertContains(response, 'value="copy-binary"')
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'people.sql')
+            call_command('export_schema', self.schema.pk, rows=5, format='copy', output=path)
+            with open(path, 'rb') as output:
+                self.assertTrue(output.read().endswith(b'\\.\n'))
+
+
+class DatasetCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schema = DataSchemas.objects.create(name='People')
+        cls.column = IntegerColumn.objects.create(name='age', schema=cls.schema, order=1, range_low=1, range_high=9)
+        cls.job = JobColumn.objects.create(name='job', schema=cls.schema, order=2)
+        PhoneColumn.objects.create(name='phone', schema=cls.schema, order=3)
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        settings_override = override_settings(DATASET_CACHE_DIR=self.cache_dir, DATASET_CACHE_MAX_BYTES=10 ** 7)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_schema', args=[self.schema.pk]), params)
+        return response, b''.join(response.streaming_content)
+
+    def files(self, *path):
+        directory = os.path.join(self.cache_dir, *path)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name for name in os.listdir(directory) if os.path.isfile(os.path.join(directory, name)))
+
+    def datasets(self):
+        return self.files()
+
+    def stored_columns(self):
+        return self.files(dataset_cache.COLUMNS_DIR)
+
+    def test_repeated_export_is_served_from_disk(self):
+        response, data = self.export(rows=50, seed=1)
+        self.assertEqual(response['X-Dataset-Cache'], 'miss')
+        self.assertEqual(len(self.datasets()), 1)
+        response, cached = self.export(rows=50, seed=1)
+        self.assertEqual(response['X-Dataset-Cache'], 'hit')
+        self.assertIn('schema_%s.csv' % self.schema.pk, response['Content-Disposition'])
+        self.assertEqual(cached, data)
+
+    def test_any_change_misses(self):
+        self.export(rows=50, seed=1)
+        self.assertEqual(self.export(rows=50, seed=2)[0]['X-Dataset-Cache'], 'miss')
+        self.assertEqual(self.export(rows=51, seed=1)[0]['X-Dataset-Cache'], 'miss')
+        self.assertEqual(self.export(rows=50, seed=1, format='copy')[0]['X-Dataset-Cache'], 'miss')
+        self.column.range_high = 5
+        self.column.save()
+        self.assertEqual(self.export(rows=50, seed=1)[0]['X-Dataset-Cache'], 'miss')
+        self.assertEqual(len(self.datasets()), 5)
+
+    def test_stored_columns_match_generated_data(self):
+        columns = load_columns(self.schema)
+        expected = b''.join(export_schema(self.schema, columns, 25000, 'copy', seed=3))
+        for _ in range(2):
+            chunks = dataset_cache.dataset_chunks(columns, 25000, 3)
+            self.assertEqual(b''.join(export_schema(self.schema, columns, 25000, 'copy', seed=3, chunks=chunks)), expected)
+            self.assertEqual(len(self.stored_columns()), 3)
+
+    def test_only_edited_columns_are_generated_again(self):
+        self.export(rows=100, seed=1)
+        stored = self.stored_columns()
+        self.assertEqual(len(stored), 3)
+        self.column.range_high = 5
+        self.column.save()
+        self.job.name = 'occupation'
+        self.job.save()
+        with mock.patch('schemas.dataset_cache.generate_column_chunks', wraps=generate_column_chunks) as generate:
+            response, data = self.export(rows=100, seed=1)
+        self.assertEqual(response['X-Dataset-Cache'], 'miss')
+        self.assertEqual([call.args[0].pk for call in generate.call_args_list], [self.column.pk])
+        self.assertEqual(len(set(self.stored_columns()) - set(stored)), 1)
+        self.assertTrue(data.startswith(b'"age","occupation","phone"\n'))
+        self.assertTrue(all(1 <= int(line.split(b',')[0]) <= 5 for line in data.splitlines()[1:]))
+
+    def test_least_recently_used_are_evicted(self):
+        for seed in range(3):
+            self.export(rows=1000, seed=seed)
+        paths = [os.path.join(self.cache_dir, name) for name in self.datasets()]
+        paths += [os.path.join(self.cache_dir, dataset_cache.COLUMNS_DIR, name) for name in self.stored_columns()]
+        for path in paths:
+            os.utime(path, (time.time() - 100, time.time() - 100))
+        # reading one makes it the most recently used
+        response = self.export(rows=1000, seed=0)[0]
+        self.assertEqual(response['X-Dataset-Cache'], 'hit')
+        (recent,) = [name for name in self.datasets() if os.path.getmtime(os.path.join(self.cache_dir, name)) > time.time() - 50]
+        dataset_cache.evict_datasets(max_bytes=os.path.getsize(os.path.join(self.cache_dir, recent)))
+        self.assertEqual(self.datasets(), [recent])
+        self.assertEqual(self.stored_columns(), [])
+
+    def test_eviction_keeps_recent_files(self):
+        self.export(rows=1000, seed=0)
+        self.export(rows=1000, seed=1)
+        for name in self.stored_columns():
+            path = os.path.join(self.cache_dir, dataset_cache.COLUMNS_DIR, name)
+            os.utime(path, (time.time() - 100, time.time() - 100))
+        datasets_size = sum(os.path.getsize(os.path.join(self.cache_dir, name)) for name in self.datasets())
+        dataset_cache.evict_datasets(max_bytes=datasets_size)
+        self.assertEqual(len(self.datasets()), 2)
+        self.assertEqual(self.stored_columns(), [])
+
+    def test_interrupted_export_is_not_cached(self):
+        response = self.client.get(reverse('export_schema', args=[self.schema.pk]), {'rows': 50000})
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertEqual(self.datasets(), [])
+        self.assertEqual(self.stored_columns(), [])
+
+    def test_cache_can_be_disabled(self):
+        with self.settings(DATASET_CACHE_DIR=''):
+            response, data = self.export(rows=5)
+        self.assertNotIn('X-Dataset-Cache', response)
+        self.assertEqual(data.count(b'\n'), 6)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+@override_settings(EXPORT_COMPRESSION_BLOCK_BYTES=4096, DATASET_CACHE_DIR='')
+class CompressionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schema = DataSchemas.objects.create(name='People')
+        IntegerColumn.objects.create(name='age', schema=cls.schema, order=1)
+        FullNameColumn.objects.create(name='name', schema=cls.schema, order=2)
+
+    def test_blocks_are_gzip_members_in_order(self):
+        data = b''.join(export_schema(self.schema, load_columns(self.schema), 5000, 'csv'))
+        for threads in (1, 4):
+            compressed = b''.join(compress_chunks(export_schema(self.schema, load_columns(self.schema), 5000, 'csv'), 'gzip', threads=threads))
+            self.assertEqual(gzip.decompress(compressed), data)
+            self.assertGreater(compressed.count(b'\x1f\x8b\x08'), 10)
+        self.assertEqual(gzip.decompress(b''.join(compress_chunks([], 'gzip'))), b'')
+
+    def test_closing_early_stops_the_threads(self):
+        chunks = compress_chunks((b'x' * 4096 for _ in range(1000)), 'gzip', threads=2)
+        next(chunks)
+        chunks.close()
+        self.assertFalse(any(thread.name.startswith('compress') for thread in threading.enumerate()))
+
+    def test_export_view(self):
+        url = reverse('export_schema', args=[self.schema.pk])
+        response = self.client.get(url, {'rows': 2000, 'compress': 'gzip'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('schema_%s.csv.gz' % self.schema.pk, response['Content-Disposition'])
+        compressed = b''.join(response.streaming_content)
+        plain = b''.join(self.client.get(url, {'rows': 2000}).streaming_content)
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertEqual(self.client.get(url, {'compress': 'bzip2'}).status_code, 400)
+        self.assertContains(self.client.get(reverse('schema_detail', args=[self.schema.pk])), '<option value="gzip">')
+
+    def test_cached_dataset_is_compressed(self):
+        with tempfile.TemporaryDirectory() as cache_dir, self.settings(DATASET_CACHE_DIR=cache_dir):
+            url = reverse('export_schema', args=[self.schema.pk])
+            plain = b''.join(self.client.get(url, {'rows': 2000}).streaming_content)
+            response = self.client.get(url, {'rows': 2000, 'compress': 'gzip'})
+            self.assertEqual(response['X-Dataset-Cache'], 'hit')
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'people.csv.gz')
+            call_command('export_schema', self.schema.pk, rows=3000, compress='gzip', threads=3, level=1, output=path)
+            with gzip.open(path) as output:
+                self.assertEqual(output.read(), b''.join(export_schema(self.schema, load_columns(self.schema), 3000, 'csv')))
+
+
+class ShardingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schema = DataSchemas.objects.create(name='People', column_separator=';', string_character="'")
+        IntegerColumn.objects.create(name='age', schema=cls.schema, order=1, null_ratio=0.1)
+        FullNameColumn.objects.create(name='name', schema=cls.schema, order=2)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.columns = load_columns(self.schema)
+
+    def read(self, shard):
+        with open(os.path.join(self.directory, shard['path']), 'rb') as shard_file:
+            return shard_file.read()
+
+    def test_shards_by_rows(self):
+        manifest = export_shards(self.schema, self.columns, 25000, 'csv', 3, self.directory, shard_rows=10001)
+        self.assertEqual([(shard['first_row'], shard['rows']) for shard in manifest['shards']], [(0, 10001), (10001, 10001), (20002, 4998)])
+        with open(os.path.join(self.directory, 'manifest.json')) as manifest_file:
+            self.assertEqual(json.load(manifest_file), manifest)
+        self.assertTrue(manifest['complete'])
+        expected = b''.join(export_schema(self.schema, self.columns, 25000, 'csv', 3)).splitlines(keepends=True)
+        rows = []
+        for shard in manifest['shards']:
+            data = self.read(shard)
+            self.assertEqual(len(data), shard['bytes'])
+            self.assertEqual(hashlib.sha256(data).hexdigest(), shard['sha256'])
+            lines = data.splitlines(keepends=True)
+            self.assertEqual(lines[0], expected[0])
+            self.assertEqual(len(lines) - 1, shard['rows'])
+            rows += lines[1:]
+        self.assertEqual(rows, expected[1:])
+
+    def test_shards_by_bytes_and_compressed(self):
+        with self.settings(EXPORT_COMPRESSION_BLOCK_BYTES=4096):
+            manifest = export_shards(self.schema, self.columns, 50000, 'copy-binary', 0, self.directory, shard_bytes=400000, compression='gzip', threads=2)
+        self.assertGreater(len(manifest['shards']), 2)
+        self.assertEqual(sum(shard['rows'] for shard in manifest['shards']), 50000)
+        for shard in manifest['shards']:
+            self.assertTrue(shard['path'].endswith('.pgcopy.gz'))
+            data = gzip.decompress(self.read(shard))
+            self.assertTrue(data.startswith(PGCOPY_HEADER) and data.endswith(PGCOPY_TRAILER))
+        with self.assertRaises(ValueError):
+            export_shards(self.schema, self.columns, 10, 'insert', 0, self.directory, shard_rows=5)
+
+    def test_resume(self):
+        manifest = export_shards(self.schema, self.columns, 30000, 'csv', 0, self.directory, shard_rows=10000)
+        first, second, third = manifest['shards']
+        os.unlink(os.path.join(self.directory, third['path']))
+        with open(os.path.join(self.directory, second['path']), 'ab') as shard_file:
+            shard_file.write(b'garbage')
+        with mock.patch('schemas.sharding.write_atomically', wraps=sharding.write_atomically) as write:
+            resumed = export_shards(self.schema, self.columns, 30000, 'csv', 0, self.directory, shard_rows=10000, resume=True)
+        # the second and third shard and the manifest after each and at the end
+        self.assertEqual(write.call_count, 5)
+        self.assertEqual(resumed, manifest)
+        with self.assertRaises(ValueError):
+            export_shards(self.schema, self.columns, 30000, 'csv', 1, self.directory, shard_rows=10000, resume=True)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_schema', self.schema.pk, rows=100, shards=3, output=self.directory, stdout=out)
+        self.assertIn('3 shards', out.getvalue())
+        self.assertEqual(sorted(os.listdir(self.directory)), ['manifest.json'] + ['schema_%s.%05d.csv' % (self.schema.pk, index) for index in range(3)])
+        with self.assertRaises(CommandError):
+            call_command('export_schema', self.schema.pk, rows=100, shards=3)
@@ -0,0 +1,49 @@
+from crispy_forms.utils import render_crispy_form
+from django.test import TestCase
+from django.urls import reverse
+from schemas.forms import DataSchemaForm
+from schemas.models import DataSchemas, SchemaColumn, IntegerColumn, FullNameColumn, JobColumn, CompanyColumn, PhoneColumn
+
+
+class CompiledRowsTests(TestCase):
+
+    def setUp(self):
+        self.schema = DataSchemas.objects.create(name='People')
+        IntegerColumn.objects.create(name='age', schema=self.schema, order=1)
+        FullNameColumn.objects.create(name='"full" <name>', schema=self.schema, order=2)
+        JobColumn.objects.create(name="it's a job & more", schema=self.schema, order=3)
+        CompanyColumn.objects.create(name='company', schema=self.schema, order=5)
+        PhoneColumn.objects.create(name='phone', schema=self.schema, order=40)
+
+    def render(self, **kwargs):
+        return render_crispy_form(DataSchemaForm(schema_pk=self.schema.pk, **kwargs))
+
+    def test_same_html_as_crispy(self):
+        compiled = self.render()
+        self.assertHTMLEqual(compiled, self.render(compiled_rows=False))
+        self.assertIn('name="col_name_', compiled)
+        self.assertIn('&quot;full&quot; &lt;name&gt;', compiled)
+
+    def test_column_without_type(self):
+        SchemaColumn.objects.create(name='untyped', schema=self.schema, order=50)
+        self.assertHTMLEqual(self.render(), self.render(compiled_rows=False))
+
+    def test_selectable_per_form(self):
+        with self.assertTemplateUsed('schema_column_rows.html'):
+            self.render()
+        with self.assertTemplateNotUsed('schema_column_rows.html'):
+            self.render(compiled_rows=False)
+
+    def test_bound_form_uses_crispy(self):
+        form = DataSchemaForm({'name': ''}, schema_pk=self.schema.pk)
+        self.assertFalse(form.is_valid())
+        with self.assertTemplateNotUsed('schema_column_rows.html'):
+            html = render_crispy_form(form)
+        self.assertIn('is-invalid', html)
+
+    def test_editor_page(self):
+        response = self.client.post(reverse('schema_create_update'))
+        self.assertTemplateUsed(response, 'schema_column_rows.html')
+        column = SchemaColumn.objects.get(schema__name='New Schema')
+        self.assertContains(response, 'name="delete_col_%s"' % column.pk)
+        self.assertContains(response, 'value="First Column"')
@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import tempfile
+from django.conf import settings
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from schemas import metrics
+from schemas.models import DataSchemas, IntegerColumn, FullNameColumn
+
+
+def sample(text, line_start):
+    for line in text.splitlines():
+        if line.startswith(line_start + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        # counts of earlier tests are kept in the registry and in METRICS_DIR
+        metrics.registry.reset()
+        directory = override_settings(METRICS_DIR=tempfile.mkdtemp())
+        directory.enable()
+        self.addCleanup(directory.disable)
+        self.schema = DataSchemas.objects.create(name='People')
+        self.column = IntegerColumn.objects.create(name='age', schema=self.schema, order=1)
+        FullNameColumn.objects.create(name='name', schema=self.schema, order=2)
+        self.client = Client()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_request_metrics(self):
+        before = self.scrape()
+        self.client.get(reverse('all_schemas'))
+        self.client.get(reverse('all_schemas'))
+        text = self.scrape()
+        labels = '{method="GET",view="all_schemas"}'
+        self.assertEqual(sample(text, 'schemas_request_duration_seconds_count' + labels) - sample(before, 'schemas_request_duration_seconds_count' + labels), 2)
+        self.assertEqual(sample(text, 'schemas_requests_total{method="GET",status="200",view="all_schemas"}') - sample(before, 'schemas_requests_total{method="GET",status="200",view="all_schemas"}'), 2)
+        self.assertGreater(sample(text, 'schemas_request_queries_sum' + labels), 0)
+        self.assertGreater(sample(text, 'schemas_request_response_bytes_sum' + labels), 1000)
+        self.assertIn('schemas_request_duration_seconds_bucket{method="GET",view="all_schemas",le="+Inf"}', text)
+        self.assertIn('# TYPE schemas_request_duration_seconds histogram', text)
+
+    def test_handler_and_export_metrics(self):
+        response = self.client.post(reverse('schema_create_update', args=[self.schema.pk]), {'delete_col_%s' % self.column.pk: ''})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('export_schema', args=[self.schema.pk]), {'rows': 100, 'format': 'insert'})
+        size = len(b''.join(response.streaming_content))
+        text = self.scrape()
+        self.assertEqual(sample(text, 'schemas_handler_duration_seconds_count{handler="delete_col"}'), 1)
+        self.assertGreater(sample(text, 'schemas_handler_queries_sum{handler="delete_col"}'), 0)
+        self.assertEqual(sample(text, 'schemas_export_duration_seconds_count{format="insert"}'), 1)
+        self.assertEqual(sample(text, 'schemas_export_response_bytes_sum{format="insert"}'), size)
+
+    def test_other_processes_are_added(self):
+        with open(os.path.join(settings.METRICS_DIR, '1.json'), 'w') as metrics_file:
+            json.dump({
+                'counters': [['schemas_requests_total', {'view': 'clone_schema', 'method': 'POST', 'status': 302}, 5]],
+                'histograms': [['schemas_handler_queries', {'handler': 'add_new_col'}, [0, 1, 2, 0, 0, 0, 0, 0, 0, 0, 0], 8.0]],
+            }, metrics_file)
+        try:
+            text = self.scrape()
+        finally:
+            os.remove(os.path.join(settings.METRICS_DIR, '1.json'))
+        self.assertEqual(sample(text, 'schemas_requests_total{method="POST",status="302",view="clone_schema"}'), 5)
+        self.assertEqual(sample(text, 'schemas_handler_queries_bucket{handler="add_new_col",le="1"}'), 1)
+        self.assertEqual(sample(text, 'schemas_handler_queries_bucket{handler="add_new_col",le="2"}'), 3)
+        self.assertEqual(sample(text, 'schemas_handler_queries_count{handler="add_new_col"}'), 3)
+
+    def test_counts_of_exited_processes_are_archived(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        path = os.path.join(settings.METRICS_DIR, '%s.json' % process.pid)
+        for scrape in range(2):
+            with open(path, 'w') as metrics_file:
+                json.dump({
+                    'counters': [['schemas_requests_total', {'view': 'clone_schema', 'method': 'POST', 'status': 302}, 5]],
+                    'histograms': [['schemas_handler_queries', {'handler': 'add_new_col'}, [0, 1, 2, 0, 0, 0, 0, 0, 0, 0, 0], 8.0]],
+                }, metrics_file)
+            text = self.scrape()
+            self.assertFalse(os.path.exists(path))
+        # the totals do not go down, twice the counts of the exited process
+        self.assertEqual(sample(text, 'schemas_requests_total{method="POST",status="302",view="clone_schema"}'), 10)
+        self.assertEqual(sample(text, 'schemas_handler_queries_count{handler="add_new_col"}'), 6)
+        self.assertEqual(sample(self.scrape(), 'schemas_requests_total{method="POST",status="302",view="clone_schema"}'), 10)
+
+    def test_only_local_scrapes(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 404)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_X_FORWARDED_FOR='127.0.0.1').status_code, 404)
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(metrics.format_labels((('view', 'a"b\\c\nd'),)), '{view="a\\"b\\\\c\\nd"}')
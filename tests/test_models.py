@@ -3,6 +3,9 @@ from schemas.models import DataSchemas, SchemaColumn, IntegerColumn, FullNameCol
 from model_bakery import baker
 import collections
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
 
 items_number = 2
 column_classes_count = 5
@@ -95,4 +98,59 @@ class ModelsTestCase(TestCase):
             if phone_item.full_clean():
                 phone_item.save()                
         self.assertEqual(PhoneColumn.objects.filter(phone_number='fq62gf').count(), 0)
-             
\ No newline at end of file
+             
+
+class SchemaVersionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.schemas, cls.int_cols, cls.fullname_cols, cls.job_cols, cls.company_cols, cls.phone_cols = createTestData()
+
+    def test_schema_save_increments_version(self):
+        schema = DataSchemas.objects.get(pk=self.schemas[1].pk)
+        version = schema.version
+        schema.name = 'Renamed'
+        schema.save()
+        schema.refresh_from_db()
+        self.assertEqual(schema.version, version + 1)
+
+    def test_column_writes_increment_schema_version(self):
+        schema = self.schemas[0]
+        version = DataSchemas.objects.get(pk=schema.pk).version
+        modified_at = DataSchemas.objects.get(pk=schema.pk).modified_at
+        column = IntegerColumn.objects.get(pk=self.int_cols[0].pk)
+        column.range_low = 0
+        column.save()
+        JobColumn.objects.get(pk=self.job_cols[0].pk).delete()
+        schema.refresh_from_db()
+        self.assertEqual(schema.version, version + 2)
+        self.assertGreater(schema.modified_at, modified_at)
+
+    def test_typed_column_parameters(self):
+        column = self.schemas[0].schemacolumn_set.with_subclasses().get(pk=self.int_cols[0].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(column.column_type, 'IntegerColumn')
+            self.assertEqual(column.parameters, {'range_low': -20, 'range_high': 40, 'distribution': 'uniform', 'zipf_exponent': 2.0, 'null_ratio': 0.0})
+
+
+class SeedSchemasTestCase(TestCase):
+    def test_seed_schemas(self):
+        out = StringIO()
+        call_command('seed_schemas', schemas=30, min_columns=2, max_columns=12, batch_size=50, name_prefix='Seeded', stdout=out)
+        self.assertIn('Created 30 schemas', out.getvalue())
+        schemas = DataSchemas.objects.filter(name__startswith='Seeded')
+        self.assertEqual(schemas.count(), 30)
+        for schema in schemas:
+            columns = list(schema.schemacolumn_set.with_subclasses().order_by('order'))
+            self.assertTrue(2 <= len(columns) <= 12)
+            self.assertEqual([column.order for column in columns], list(range(1, len(columns) + 1)))
+            self.assertTrue(all(column.column_type != 'SchemaColumn' for column in columns))
+        types = collections.Counter(column.column_type for column in SchemaColumn.objects.with_subclasses().filter(schema__in=schemas))
+        self.assertEqual(set(types), {'IntegerColumn', 'FullNameColumn', 'JobColumn', 'CompanyColumn', 'PhoneColumn', 'ForeignKeyColumn'})
+        for column in IntegerColumn.objects.filter(schema__in=schemas):
+            column.full_clean()
+
+    def test_type_weights(self):
+        call_command('seed_schemas', schemas=5, types='PhoneColumn=1,JobColumn=0', stdout=StringIO())
+        self.assertEqual(SchemaColumn.objects.count(), PhoneColumn.objects.count())
+        with self.assertRaises(CommandError):
+            call_command('seed_schemas', types='TextColumn=1', stdout=StringIO())
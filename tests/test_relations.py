@@ -0,0 +1,162 @@
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+
+import numpy
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+from schemas import generation
+from schemas.bulk import clone_schemas, delete_schemas
+from schemas.dataset_cache import column_fingerprint
+from schemas.exports import create_table_sql, export_schema
+from schemas.generation import generate_column_chunks, load_columns
+from schemas.models import DataSchemas, ForeignKeyColumn, IntegerColumn, PhoneColumn
+from schemas.relations import dataset_plan
+from schemas.serializers import export_schemas, import_schemas
+from schemas.validation import validate_csv
+
+
+def values(column, rows, seed=0):
+    return [value for chunk in generate_column_chunks(column, rows, seed) for value in chunk]
+
+
+class ForeignKeyTests(TestCase):
+
+    def setUp(self):
+        self.users = DataSchemas.objects.create(name='Users')
+        self.user_id = IntegerColumn.objects.create(name='id', schema=self.users, order=1, range_low=1, range_high=10**6, distribution='sequential')
+        self.orders = DataSchemas.objects.create(name='Orders')
+        self.order_id = IntegerColumn.objects.create(name='id', schema=self.orders, order=1, range_low=1, range_high=10**6, distribution='sequential')
+        self.user_fk = ForeignKeyColumn.objects.create(name='user_id', schema=self.orders, order=2, referenced_column=self.user_id, parent_rows=50, distribution='zipf')
+
+    def test_keys_exist_in_the_parent(self):
+        parent = set(values(self.user_id, 50))
+        keys = values(ForeignKeyColumn.objects.get(pk=self.user_fk.pk), 5000)
+        self.assertTrue(set(keys) <= parent)
+        self.assertGreater(len(set(keys)), 1)
+        self.assertEqual(keys, values(ForeignKeyColumn.objects.get(pk=self.user_fk.pk), 5000))
+
+    def test_memory_mapped_pool(self):
+        column = ForeignKeyColumn.objects.get(pk=self.user_fk.pk)
+        in_memory = values(column, 3000, seed=4)
+        with self.settings(FOREIGN_KEY_POOL_MEMORY_BYTES=80):
+            self.assertEqual(values(column, 3000, seed=4), in_memory)
+
+    def test_string_keys_and_nulls(self):
+        phone = PhoneColumn.objects.create(name='phone', schema=self.users, order=2)
+        fk = ForeignKeyColumn.objects.create(name='user_phone', schema=self.orders, order=3, referenced_column=phone, parent_rows=50, null_ratio=0.5)
+        fk = ForeignKeyColumn.objects.get(pk=fk.pk)
+        keys = values(fk, 1000)
+        self.assertTrue(set(keys) - {None} <= set(values(phone, 50)))
+        self.assertTrue(200 < keys.count(None) < 800)
+        self.assertIn('"user_phone" varchar(17)', create_table_sql(self.orders, load_columns(self.orders)))
+        csv = BytesIO(b''.join(export_schema(self.orders, load_columns(self.orders), 1000)))
+        self.assertEqual(validate_csv(self.orders, csv)['errors'], [])
+
+    def test_without_reference(self):
+        fk = ForeignKeyColumn.objects.create(name='other', schema=self.orders, order=3)
+        self.assertEqual(set(values(ForeignKeyColumn.objects.get(pk=fk.pk), 100)), {None})
+        with self.assertRaises(ValidationError):
+            ForeignKeyColumn(name='fk', schema=self.users, order=3, referenced_column=self.user_fk).full_clean()
+
+    def test_parent_rows_limit(self):
+        with self.settings(EXPORT_MAX_ROWS=100):
+            ForeignKeyColumn(name='fk', schema=self.orders, order=3, referenced_column=self.user_id, parent_rows=100).full_clean()
+            with self.assertRaises(ValidationError):
+                ForeignKeyColumn(name='fk', schema=self.orders, order=3, referenced_column=self.user_id, parent_rows=101).full_clean()
+
+    def test_pool_is_cached(self):
+        column = ForeignKeyColumn.objects.get(pk=self.user_fk.pk)
+        pool = generation.key_pool(column, 3)
+        self.assertIs(generation.key_pool(ForeignKeyColumn.objects.get(pk=self.user_fk.pk), 3), pool)
+        self.assertIsNot(generation.key_pool(column, 4), pool)
+        IntegerColumn.objects.filter(pk=self.user_id.pk).update(range_low=7)
+        self.assertIsNot(generation.key_pool(ForeignKeyColumn.objects.get(pk=self.user_fk.pk), 3), pool)
+        # the cache is bounded by bytes, a 50-key string pool takes 50 * 17 * 4
+        phone = PhoneColumn.objects.create(name='phone', schema=self.users, order=2)
+        phone_fk = ForeignKeyColumn.objects.create(name='user_phone', schema=self.orders, order=3, referenced_column=phone, parent_rows=50)
+        with self.settings(FOREIGN_KEY_POOL_MEMORY_BYTES=50 * 17 * 4, FOREIGN_KEY_POOL_CACHE_BYTES=50 * 17 * 4):
+            phone_pool = generation.key_pool(ForeignKeyColumn.objects.get(pk=phone_fk.pk), 3)
+            self.assertNotIsInstance(phone_pool, numpy.memmap)
+            self.assertEqual(list(generation.key_pools.values()), [phone_pool])
+
+    def test_fingerprint_follows_the_referenced_column(self):
+        fk = ForeignKeyColumn.objects.get(pk=self.user_fk.pk)
+        before = column_fingerprint(fk, 100, 0)
+        IntegerColumn.objects.filter(pk=self.user_id.pk).update(range_low=7)
+        self.assertNotEqual(column_fingerprint(ForeignKeyColumn.objects.get(pk=self.user_fk.pk), 100, 0), before)
+
+    def test_delete_parent_clears_references(self):
+        delete_schemas(DataSchemas.objects.filter(pk=self.users.pk))
+        self.assertIsNone(ForeignKeyColumn.objects.get(pk=self.user_fk.pk).referenced_column_id)
+
+    def test_delete_referenced_column_bumps_referencing_schemas(self):
+        version = DataSchemas.objects.get(pk=self.orders.pk).version
+        IntegerColumn.objects.get(pk=self.user_id.pk).delete()
+        self.assertIsNone(ForeignKeyColumn.objects.get(pk=self.user_fk.pk).referenced_column_id)
+        self.assertGreater(DataSchemas.objects.get(pk=self.orders.pk).version, version)
+
+    def test_clone_and_export(self):
+        ForeignKeyColumn.objects.create(name='parent_order', schema=self.orders, order=3, referenced_column=self.order_id)
+        clone = clone_schemas([self.orders])[0]
+        user_fk = ForeignKeyColumn.objects.get(schema=clone, name='user_id')
+        self.assertEqual(user_fk.referenced_column_id, self.user_id.pk)
+        self.assertEqual(user_fk.parent_rows, 50)
+        self.assertEqual(ForeignKeyColumn.objects.get(schema=clone, name='parent_order').referenced_column_id, IntegerColumn.objects.get(schema=clone, name='id').pk)
+        exported = export_schemas(DataSchemas.objects.filter(pk=self.orders.pk))[0]
+        self.assertEqual(exported['columns'][1]['referenced_column'], {'schema': self.users.pk, 'column': 'id'})
+
+    def test_import_remaps_references(self):
+        exported = export_schemas(DataSchemas.objects.filter(pk__in=[self.users.pk, self.orders.pk]))
+        users, orders = import_schemas(exported)
+        user_fk = ForeignKeyColumn.objects.get(schema=orders, name='user_id')
+        self.assertEqual(user_fk.referenced_column_id, IntegerColumn.objects.get(schema=users, name='id').pk)
+        self.assertEqual(user_fk.parent_rows, 50)
+        # a reference outside of the import keeps pointing at the existing column
+        orders = import_schemas(export_schemas(DataSchemas.objects.filter(pk=self.orders.pk)))[0]
+        self.assertEqual(ForeignKeyColumn.objects.get(schema=orders, name='user_id').referenced_column_id, self.user_id.pk)
+
+    def test_import_unknown_references(self):
+        for reference in ({'referenced_column': {'schema': 9999, 'column': 'id'}}, {'referenced_column': {'schema': self.orders.pk, 'column': 'user_id'}}, {'referenced_column_id': 9999}):
+            data = {'schemas': [{'name': 'Bad', 'columns': [dict({'name': 'fk', 'order': 1, 'type': 'ForeignKeyColumn'}, **reference)]}]}
+            response = self.client.post(reverse('api_schema_import'), json.dumps(data), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(DataSchemas.objects.filter(name='Bad').exists())
+
+
+class GenerateDatasetTests(TestCase):
+
+    def setUp(self):
+        self.users = DataSchemas.objects.create(name='Users')
+        user_id = IntegerColumn.objects.create(name='id', schema=self.users, order=1, range_low=1, range_high=10**6, distribution='sequential')
+        self.orders = DataSchemas.objects.create(name='Orders')
+        order_id = IntegerColumn.objects.create(name='id', schema=self.orders, order=1, range_low=1, range_high=10**6, distribution='sequential')
+        ForeignKeyColumn.objects.create(name='user_id', schema=self.orders, order=2, referenced_column=user_id, parent_rows=20)
+        self.items = DataSchemas.objects.create(name='Items')
+        ForeignKeyColumn.objects.create(name='order_id', schema=self.items, order=1, referenced_column=order_id, parent_rows=30)
+
+    def test_plan(self):
+        plan = dataset_plan([self.items], 100)
+        self.assertEqual([(schema.name, rows) for schema, rows in plan], [('Users', 20), ('Orders', 30), ('Items', 100)])
+
+    def test_conflicting_parent_rows(self):
+        other = DataSchemas.objects.create(name='Reviews')
+        ForeignKeyColumn.objects.create(name='user_id', schema=other, order=1, referenced_column=self.users.schemacolumn_set.get(), parent_rows=21)
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', self.orders.pk, other.pk, stdout=StringIO())
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('generate_dataset', self.items.pk, '--rows', '100', '--output', directory, stdout=StringIO())
+            self.assertEqual(sorted(os.listdir(directory)), ['01_schema_%s.csv' % self.users.pk, '02_schema_%s.csv' % self.orders.pk, '03_schema_%s.csv' % self.items.pk])
+            with open(os.path.join(directory, '01_schema_%s.csv' % self.users.pk), 'rb') as users:
+                self.assertEqual(users.read(), b''.join(export_schema(self.users, load_columns(self.users), 20)))
+            with open(os.path.join(directory, '02_schema_%s.csv' % self.orders.pk)) as orders:
+                self.assertEqual(len(orders.read().splitlines()), 31)
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', 9999, stdout=StringIO())
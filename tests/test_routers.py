@@ -0,0 +1,64 @@
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from django.db import router
+from schemas.middleware import ReplicaRoutingMiddleware, PRIMARY_PIN_COOKIE
+from schemas.models import DataSchemas
+from schemas.routers import replica_reads, reads_from
+
+
+def read_view(request):
+    return HttpResponse(str(router.db_for_read(DataSchemas)))
+
+@replica_reads
+def replica_read_view(request):
+    return read_view(request)
+
+
+@override_settings(REPLICA_DATABASE_ALIAS='replica', REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def run_view(self, view_func, request):
+        middleware = ReplicaRoutingMiddleware(lambda request: middleware.process_view(request, view_func, (), {}) or view_func(request))
+        return middleware(request)
+
+    def test_marked_view_reads_from_replica(self):
+        response = self.run_view(replica_read_view, self.factory.get('/'))
+        self.assertEqual(response.content, b'replica')
+        # the alias does not leak out of the request
+        self.assertEqual(router.db_for_read(DataSchemas), 'default')
+
+    def test_unmarked_view_reads_from_primary(self):
+        response = self.run_view(read_view, self.factory.get('/'))
+        self.assertEqual(response.content, b'default')
+
+    def test_post_reads_from_primary_and_pins_client(self):
+        response = self.run_view(replica_read_view, self.factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+    def test_pinned_client_reads_from_primary(self):
+        pin = self.run_view(read_view, self.factory.post('/')).cookies[PRIMARY_PIN_COOKIE].value
+        request = self.factory.get('/')
+        request.COOKIES[PRIMARY_PIN_COOKIE] = pin
+        self.assertEqual(self.run_view(replica_read_view, request).content, b'default')
+
+    def test_expired_pin_reads_from_replica(self):
+        request = self.factory.get('/')
+        request.COOKIES[PRIMARY_PIN_COOKIE] = '1'
+        self.assertEqual(self.run_view(replica_read_view, request).content, b'replica')
+
+    @override_settings(REPLICA_DATABASE_ALIAS=None)
+    def test_no_replica_configured(self):
+        response = self.run_view(replica_read_view, self.factory.get('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertNotIn(PRIMARY_PIN_COOKIE, self.run_view(read_view, self.factory.post('/')).cookies)
+
+    def test_router_only_routes_schemas_app(self):
+        from django.contrib.auth.models import User
+        with reads_from('replica'):
+            self.assertEqual(router.db_for_read(DataSchemas), 'replica')
+            self.assertEqual(router.db_for_read(User), 'default')
+        self.assertEqual(router.db_for_write(DataSchemas), 'default')
@@ -0,0 +1,65 @@
+from django.test import TestCase
+from django.urls import reverse
+from haystack import connections
+from haystack.query import SearchQuerySet
+from schemas.models import DataSchemas, IntegerColumn, PhoneColumn, JobColumn
+from schemas.serializers import import_schemas
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        connections['default'].get_backend().clear()
+        self.schema = DataSchemas.objects.create(name='Customers')
+        self.phone = PhoneColumn.objects.create(name='customer_phone', schema=self.schema, order=1)
+        self.age = IntegerColumn.objects.create(name='age', schema=self.schema, order=2)
+        self.other_schema = DataSchemas.objects.create(name='Suppliers')
+        JobColumn.objects.create(name='contact_job', schema=self.other_schema, order=1)
+
+    def test_column_name_search(self):
+        results = list(SearchQuerySet().auto_query('customer_phone'))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].model, PhoneColumn)
+        self.assertEqual(results[0].schema_id, self.schema.pk)
+
+    def test_prefix_and_type_search(self):
+        self.assertEqual(SearchQuerySet().auto_query('custom').count(), 2)
+        self.assertEqual(SearchQuerySet().auto_query('integer').count(), 1)
+        self.assertEqual(SearchQuerySet().auto_query('customers -phone').count(), 1)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.phone.name = 'mobile'
+        self.phone.save()
+        self.assertEqual(SearchQuerySet().auto_query('customer_phone').count(), 0)
+        self.assertEqual(SearchQuerySet().auto_query('mobile').count(), 1)
+        self.schema.delete()
+        self.assertEqual(SearchQuerySet().auto_query('mobile').count(), 0)
+        self.assertEqual(SearchQuerySet().auto_query('customers').count(), 0)
+
+    def test_index_follows_the_editor(self):
+        fields = {'name': 'Customers', 'column_separator': ',', 'string_character': '"', 'add_column_name': 'email', 'add_column_order': 3, 'add_column_type': 'JobColumn',
+                  'col_name_%s' % self.phone.pk: 'mobile', 'col_order_%s' % self.phone.pk: 1, 'col_type_%s' % self.phone.pk: 'PhoneColumn',
+                  'col_name_%s' % self.age.pk: 'age', 'col_order_%s' % self.age.pk: 2, 'col_type_%s' % self.age.pk: 'IntegerColumn',
+                  'submit_form_%s' % self.schema.pk: ''}
+        self.client.post(reverse('schema_create_update', args=[self.schema.pk]), fields)
+        self.assertEqual(SearchQuerySet().auto_query('customer_phone').count(), 0)
+        self.assertEqual(SearchQuerySet().auto_query('mobile').count(), 1)
+        self.client.post(reverse('schema_create_update', args=[self.schema.pk]), {'delete_col_%s' % self.phone.pk: ''})
+        self.assertEqual(SearchQuerySet().auto_query('mobile').count(), 0)
+
+    def test_bulk_import_is_indexed(self):
+        import_schemas([{'name': 'Imported', 'columns': [{'name': 'zip_code', 'order': 1, 'type': 'IntegerColumn'}]}])
+        self.assertEqual(SearchQuerySet().auto_query('zip_code').count(), 1)
+        self.assertEqual(SearchQuerySet().auto_query('imported').count(), 1)
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search_schemas'), {'q': 'customer'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'search_results.html')
+        self.assertContains(response, 'customer_phone')
+        self.assertContains(response, 'Customers')
+        self.assertNotContains(response, 'Suppliers')
+
+    def test_search_view_malformed_query(self):
+        response = self.client.get(reverse('search_schemas'), {'q': '"" AND'})
+        self.assertEqual(response.status_code, 200)
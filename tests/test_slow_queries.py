@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from schemas.models import DataSchemas, IntegerColumn, SlowQuery
+from schemas.slow_queries import normalize_sql, fingerprint
+
+
+# the admin pages need no collectstatic manifest with the default storage
+@override_settings(SLOW_QUERY_SECONDS=0, STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SlowQueryTests(TestCase):
+
+    def setUp(self):
+        self.schema = DataSchemas.objects.create(name='People')
+        IntegerColumn.objects.create(name='age', schema=self.schema, order=1)
+        self.client = Client()
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) AND "name" = \'x\'\n  LIMIT 21'),
+            'SELECT "a" FROM "t" WHERE "id" IN (?) AND "name" = ? LIMIT ?',
+        )
+        self.assertEqual(
+            fingerprint(normalize_sql('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s)')),
+            fingerprint(normalize_sql('INSERT INTO "t" ("a", "b") VALUES (%s, %s)')),
+        )
+
+    def test_queries_of_schema_views_are_stored(self):
+        self.client.get(reverse('schema_detail', args=[self.schema.pk]))
+        self.client.get(reverse('schema_detail', args=[self.schema.pk]))
+        queries = SlowQuery.objects.filter(view='schema_detail')
+        self.assertTrue(queries.exists())
+        for query in queries:
+            self.assertEqual(query.count, 2)
+            self.assertGreaterEqual(query.max_seconds, 0)
+            self.assertGreaterEqual(query.total_seconds, query.max_seconds)
+        self.assertTrue(any('schemas_schemacolumn' in query.plan for query in queries), [query.plan for query in queries])
+
+    def test_other_views_and_disabled(self):
+        User.objects.create_superuser('admin', password='secret')
+        self.client.login(username='admin', password='secret')
+        self.client.get(reverse('admin:index'))
+        self.assertFalse(SlowQuery.objects.exists())
+        with self.settings(SLOW_QUERY_SECONDS=None):
+            self.client.get(reverse('all_schemas'))
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_only_the_slowest_are_kept(self):
+        with self.settings(SLOW_QUERY_KEEP=2):
+            self.client.get(reverse('schema_detail', args=[self.schema.pk]))
+            self.client.get(reverse('all_schemas'))
+        self.assertEqual(SlowQuery.objects.count(), 2)
+
+    def test_admin(self):
+        self.client.get(reverse('all_schemas'))
+        User.objects.create_superuser('admin', password='secret')
+        self.client.login(username='admin', password='secret')
+        response = self.client.get(reverse('admin:schemas_slowquery_changelist'))
+        self.assertContains(response, 'schemas_dataschemas')
+        query = SlowQuery.objects.first()
+        response = self.client.get(reverse('admin:schemas_slowquery_change', args=[query.pk]))
+        self.assertContains(response, query.plan.split('\n')[0])
@@ -0,0 +1,67 @@
+import os
+import tempfile
+from django.contrib.auth.models import User
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from schemas import tracing
+from schemas.models import DataSchemas, IntegerColumn, FullNameColumn
+
+
+class TracingTests(TestCase):
+
+    def setUp(self):
+        self.schema = DataSchemas.objects.create(name='People')
+        self.column = IntegerColumn.objects.create(name='age', schema=self.schema, order=1)
+        FullNameColumn.objects.create(name='name', schema=self.schema, order=2)
+        self.client = Client()
+        self.trace_file = os.path.join(tempfile.mkdtemp(), 'traces.jsonl')
+        traced = override_settings(TRACING_FILE=self.trace_file, TRACING_SAMPLE_RATE=1, TRACING_SLOW_SECONDS=0)
+        traced.enable()
+        self.addCleanup(traced.disable)
+
+    def test_schema_page_phases(self):
+        response = self.client.post(reverse('schema_create_update', args=[self.schema.pk]), {'delete_col_%s' % self.column.pk: ''})
+        self.assertEqual(response.status_code, 200)
+        trace = tracing.recent_traces()[0]
+        self.assertEqual(trace['name'], 'POST /schema/%s/' % self.schema.pk)
+        self.assertEqual(trace['view'], 'schema_create_update')
+        spans = {span['name']: span for span in trace['spans']}
+        self.assertEqual(spans['handler']['attributes'], {'handler': 'delete_col'})
+        self.assertIn('form.init', spans)
+        self.assertIn('sql', spans)
+        self.assertGreater(spans['crispy.layout']['depth'], spans['render']['depth'])
+        for span in trace['spans']:
+            self.assertLessEqual(span['start'] + span['duration'], trace['duration'])
+
+    def test_streamed_export_generation(self):
+        response = self.client.get(reverse('export_schema', args=[self.schema.pk]), {'rows': 25000})
+        self.assertEqual(tracing.recent_traces(), [])
+        b''.join(response.streaming_content)
+        trace = tracing.recent_traces()[0]
+        chunks = [span for span in trace['spans'] if span['name'] == 'generate.chunk']
+        self.assertEqual(sum(span['attributes']['rows'] for span in chunks), 2 * 25000)
+
+    def test_sampling_and_threshold(self):
+        with self.settings(TRACING_SAMPLE_RATE=0):
+            self.client.get(reverse('all_schemas'))
+        with self.settings(TRACING_SLOW_SECONDS=60):
+            self.client.get(reverse('all_schemas'))
+        self.assertFalse(os.path.exists(self.trace_file))
+        with tracing.span('outside'):
+            pass
+
+    def test_span_limit(self):
+        with self.settings(TRACING_MAX_SPANS=3):
+            self.client.post(reverse('schema_create_update', args=[self.schema.pk]), {})
+        trace = tracing.recent_traces()[0]
+        self.assertEqual(len(trace['spans']), 3)
+        self.assertGreater(trace['dropped'], 0)
+
+    def test_traces_view_for_staff_only(self):
+        self.client.get(reverse('all_schemas'))
+        self.assertEqual(self.client.get(reverse('traces')).status_code, 302)
+        User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.login(username='staff', password='secret')
+        response = self.client.get(reverse('traces'))
+        self.assertContains(response, 'GET /')
+        self.assertContains(response, 'sql')
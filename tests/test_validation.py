@@ -0,0 +1,100 @@
+import io
+import os
+import tempfile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+from schemas.models import DataSchemas, IntegerColumn, FullNameColumn, PhoneColumn
+from schemas.exports import export_schema
+from schemas.generation import load_columns
+from schemas.validation import validate_csv
+
+
+class CsvValidationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schema = DataSchemas.objects.create(name='People', column_separator=';', string_character="'")
+        IntegerColumn.objects.create(name='age', schema=cls.schema, order=1, range_low=0, range_high=120)
+        FullNameColumn.objects.create(name='name', schema=cls.schema, order=2)
+        PhoneColumn.objects.create(name='phone', schema=cls.schema, order=3)
+
+    def validate(self, text, **kwargs):
+        return validate_csv(self.schema, io.BytesIO(text.encode()), **kwargs)
+
+    def test_valid_file(self):
+        summary = self.validate("age;name;phone\n33;'Smith; John';+421960321654\n0;Ann Lee;+12345678901\n")
+        self.assertEqual(summary['rows'], 2)
+        self.assertEqual(summary['errors_count'], 0)
+        self.assertEqual(summary['errors'], [])
+
+    def test_invalid_values(self):
+        summary = self.validate(
+            "age;name;phone\n"
+            "121;Ann Lee;+12345678901\n"
+            "abc;Ann Lee;12\n"
+            "5;%s;+12345678901\n"
+            "5;Ann Lee\n" % ('x' * 27),
+            batch_size=2,
+        )
+        self.assertEqual(summary['rows'], 4)
+        self.assertEqual(summary['invalid_rows'], 4)
+        self.assertEqual(summary['errors_by_column'], {'age': 2, 'phone': 1, 'name': 1})
+        self.assertEqual(summary['row_errors_count'], 1)
+        self.assertEqual(sorted((error['row'], error['column'] or '') for error in summary['errors']),
+                         [(2, 'age'), (3, 'age'), (3, 'phone'), (4, 'name'), (5, '')])
+
+    def test_blank_lines_and_strict_integers(self):
+        summary = self.validate(
+            "age;name;phone\n"
+            "\n"
+            "33;Ann Lee;+12345678901\n"
+            "5_000;Ann Lee;+12345678901\n"
+            " 5;Ann Lee;+12345678901\n"
+            "\n",
+            batch_size=2,
+        )
+        self.assertEqual(summary['rows'], 3)
+        self.assertEqual(summary['row_errors_count'], 0)
+        self.assertEqual([(error['row'], error['message']) for error in summary['errors']], [(4, 'Not an integer'), (5, 'Not an integer')])
+
+    def test_generator_range_and_multiline_values(self):
+        schema = DataSchemas.objects.create(name='Swapped', column_separator=';', string_character="'")
+        IntegerColumn.objects.create(name='score', schema=schema, order=1, range_low=50, range_high=10)
+        IntegerColumn.objects.create(name='other', schema=schema, order=2, range_low=None, range_high=None)
+        FullNameColumn.objects.create(name='name', schema=schema, order=3)
+        exported = b''.join(export_schema(schema, load_columns(schema), 100))
+        self.assertEqual(validate_csv(schema, io.BytesIO(exported))['errors'], [])
+        summary = validate_csv(schema, io.BytesIO(b"score;other;name\n20;0;'Ann\nLee'\n9;0;Ann Lee\n"))
+        self.assertEqual([(error['row'], error['column']) for error in summary['errors']], [(4, 'score')])
+
+    def test_header_mismatch_and_max_errors(self):
+        summary = self.validate("a;b;c\n" + "x;y;z\n" * 10, max_errors=3)
+        self.assertEqual(summary['errors'][0]['row'], 1)
+        self.assertEqual(len(summary['errors']), 3)
+        self.assertEqual(summary['errors_count'], 1 + 10 * 2)
+
+    def test_no_header(self):
+        summary = self.validate("33;Ann Lee;+12345678901\n", has_header=False)
+        self.assertEqual(summary['rows'], 1)
+        self.assertEqual(summary['errors_count'], 0)
+
+    def test_upload_endpoint(self):
+        url = reverse('api_schema_validate_csv', args=[self.schema.pk])
+        upload = io.BytesIO(b"age;name;phone\n200;Ann Lee;+12345678901\n")
+        upload.name = 'people.csv'
+        response = self.client.post(url, {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['errors_by_column'], {'age': 1})
+        response = self.client.post(url, b"age;name;phone\n20;Ann Lee;+12345678901\n", content_type='text/csv')
+        self.assertEqual(response.json()['errors_count'], 0)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write("age;name;phone\n200;Ann Lee;+12345678901\n")
+        self.addCleanup(os.remove, csv_file.name)
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('validate_csv', self.schema.pk, csv_file.name, stdout=out)
+        self.assertIn('"age": 1', out.getvalue())
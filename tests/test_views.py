@@ -1,7 +1,13 @@
+import csv
+from io import StringIO
 from django.test import TestCase, Client
 from django.urls import reverse, resolve
 from schemas.views import AllSchemasView, SchemaView
 from schemas.models import DataSchemas, SchemaColumn, IntegerColumn, FullNameColumn, JobColumn, CompanyColumn, PhoneColumn
+from schemas.exports import export_schema
+from schemas.generation import DEFAULT_CHUNK_SIZE, load_columns
+from schemas.preview import preview_key, schema_preview
+from django.core.cache import cache
 from model_bakery import baker
 
 items_number = 2
@@ -122,4 +128,189 @@ class SchemaViewTests(TestCase):
     
     @classmethod
     def tearDownClass(self):
-        super().tearDownClass()          
\ No newline at end of file
+        super().tearDownClass()          
+
+class EditConflictTests(TestCase):
+
+    def setUp(self):
+        self.schema = DataSchemas.objects.create(name='People')
+        self.age = IntegerColumn.objects.create(name='age', schema=self.schema, order=1)
+        self.phone = PhoneColumn.objects.create(name='phone', schema=self.schema, order=2)
+        self.url = reverse('schema_create_update', args=[self.schema.pk])
+        self.version = DataSchemas.objects.get(pk=self.schema.pk).version
+
+    def fields(self, version, **changes):
+        # what the editor page posts back
+        fields = {'version': version, 'name': 'People', 'column_separator': ',', 'string_character': '"',
+                  'add_column_name': 'email', 'add_column_order': 3, 'add_column_type': 'JobColumn'}
+        for column, column_type in ((self.age, 'IntegerColumn'), (self.phone, 'PhoneColumn')):
+            fields.update({'col_name_%s' % column.pk: column.name, 'col_order_%s' % column.pk: column.order, 'col_type_%s' % column.pk: column_type})
+        fields.update(changes)
+        return fields
+
+    def test_claim_version(self):
+        self.assertTrue(DataSchemas.claim_version(self.schema.pk, self.version))
+        self.assertFalse(DataSchemas.claim_version(self.schema.pk, self.version))
+        self.assertEqual(DataSchemas.objects.get(pk=self.schema.pk).version, self.version + 1)
+
+    def test_page_carries_the_version(self):
+        response = self.client.post(self.url)
+        self.assertContains(response, 'name="version" value="%s"' % self.version)
+        response = self.client.post(self.url, {'edit_col_%s' % self.age.pk: ''})
+        self.assertContains(response, 'name="version" value="%s"' % self.version)
+
+    def test_second_submit_is_a_conflict(self):
+        submit = 'submit_form_%s' % self.schema.pk
+        response = self.client.post(self.url, self.fields(self.version, name='Customers', **{submit: ''}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'changed by someone else')
+        response = self.client.post(self.url, self.fields(self.version, name='Clients', **{submit: ''}))
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, 'changed by someone else', status_code=409)
+        self.assertContains(response, 'value="Customers"', status_code=409)
+        schema = DataSchemas.objects.get(pk=self.schema.pk)
+        self.assertEqual(schema.name, 'Customers')
+        self.assertContains(response, 'name="version" value="%s"' % schema.version, status_code=409)
+
+    def test_stale_column_writes_are_conflicts(self):
+        DataSchemas.objects.get(pk=self.schema.pk).save()
+        response = self.client.post(self.url, self.fields(self.version, **{'add_column_btn_%s' % self.schema.pk: ''}))
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(self.url, self.fields(self.version, **{'delete_col_%s' % self.phone.pk: ''}))
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(self.url, {'version': self.version, 'save_schema_columns_chng_btn_%s' % self.age.pk: '', 'name': 'years',
+                                               'range_low': 1, 'range_high': 5, 'distribution': 'uniform', 'zipf_exponent': 2.0, 'null_ratio': 0})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([column.name for column in self.schema.schemacolumn_set.order_by('order')], ['age', 'phone'])
+
+    def test_rejected_add_keeps_the_version(self):
+        response = self.client.post(self.url, self.fields(self.version, add_column_name='age', **{'add_column_btn_%s' % self.schema.pk: ''}))
+        self.assertContains(response, 'already exists')
+        self.assertEqual(DataSchemas.objects.get(pk=self.schema.pk).version, self.version)
+        response = self.client.post(self.url, self.fields(self.version, **{'delete_col_%s' % self.phone.pk: ''}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([column.name for column in self.schema.schemacolumn_set.order_by('order')], ['age'])
+
+    def test_current_version_and_no_version(self):
+        response = self.client.post(self.url, self.fields(self.version, **{'delete_col_%s' % self.phone.pk: ''}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.post(self.url, {'delete_col_%s' % self.phone.pk: ''}).status_code, 409)
+        fields = self.fields(self.version, **{'add_column_btn_%s' % self.schema.pk: ''})
+        del fields['version']
+        self.assertEqual(self.client.post(self.url, fields).status_code, 200)
+        self.assertEqual([column.name for column in self.schema.schemacolumn_set.order_by('order')], ['age', 'email'])
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schemas, cls.int_cols, cls.fullname_cols, cls.job_cols, cls.company_cols, cls.phone_cols = createTestData()
+
+    def test_all_schemas_not_modified(self):
+        # the first response sets the CSRF cookie, which is part of the ETag
+        self.client.get(reverse('all_schemas'))
+        response = self.client.get(reverse('all_schemas'))
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('all_schemas'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_all_schemas_modified_after_schema_change(self):
+        etag = self.client.get(reverse('all_schemas'))['ETag']
+        DataSchemas.objects.create(name='Another schema')
+        response = self.client.get(reverse('all_schemas'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_schema_detail_not_modified(self):
+        url = reverse('schema_detail', args=[self.schemas[0].pk])
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.int_cols[0].name)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_schema_detail_modified_after_column_change(self):
+        url = reverse('schema_detail', args=[self.schemas[0].pk])
+        etag = self.client.get(url)['ETag']
+        column = self.int_cols[0]
+        column.range_high = 100
+        column.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_schema_detail_missing(self):
+        response = self.client.get(reverse('schema_detail', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SchemaPreviewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.schema = DataSchemas.objects.create(name='People')
+        self.age = IntegerColumn.objects.create(name='age', schema=self.schema, order=1, range_low=10, range_high=20)
+        PhoneColumn.objects.create(name='phone', schema=self.schema, order=2)
+        self.url = reverse('schema_preview', args=[self.schema.pk])
+
+    def test_editor_loads_the_preview_lazily(self):
+        response = self.client.post(reverse('schema_create_update'))
+        schema = DataSchemas.objects.latest('pk')
+        self.assertContains(response, 'data-url="%s"' % reverse('schema_preview', args=[schema.pk]))
+        self.assertIsNone(cache.get(preview_key(schema.pk, schema.version)))
+        response = self.client.post(reverse('schema_create_update', args=[self.schema.pk]), {'edit_col_%s' % self.age.pk: ''})
+        self.assertNotContains(response, 'schema_preview')
+
+    def test_preview_is_cached_per_version(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<th>phone</th>')
+        self.assertContains(response, '<tr><td>', count=20)
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.content, response.content)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.age.range_low = 1000
+        self.age.range_high = 1000
+        self.age.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<td>1000</td>', count=20)
+
+    def test_preview_matches_the_export(self):
+        FullNameColumn.objects.create(name='name', schema=self.schema, order=3)
+        IntegerColumn.objects.create(name='score', schema=self.schema, order=4, null_ratio=0.3)
+        exported = b''.join(export_schema(self.schema, load_columns(self.schema), DEFAULT_CHUNK_SIZE)).decode()
+        lines = list(csv.reader(StringIO(exported), delimiter=self.schema.column_separator, quotechar=self.schema.string_character))
+        column_names, rows = schema_preview(self.schema.pk, DataSchemas.objects.get(pk=self.schema.pk).version)
+        self.assertEqual(column_names, ['age', 'phone', 'name', 'score'])
+        self.assertEqual([['' if value is None else str(value) for value in row] for row in rows], lines[1:21])
+        self.assertIn('', [row[3] for row in lines[1:21]])
+
+    def test_missing_and_disabled(self):
+        self.assertEqual(self.client.get(reverse('schema_preview', args=[999999])).status_code, 404)
+        with self.settings(SCHEMA_PREVIEW_ROWS=0):
+            response = self.client.post(reverse('schema_create_update'))
+        self.assertNotContains(response, 'schema_preview')
+
+
+class CloneSchemaViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schemas, cls.int_cols, cls.fullname_cols, cls.job_cols, cls.company_cols, cls.phone_cols = createTestData()
+
+    def test_clone_schema(self):
+        response = self.client.post(reverse('clone_schema', args=[self.schemas[0].pk]), follow=True)
+        self.assertRedirects(response, '/')
+        clone = DataSchemas.objects.get(name=('Copy of %s' % self.schemas[0].name)[:100])
+        self.assertEqual(clone.schemacolumn_set.count(), items_number * column_classes_count)
+        self.assertEqual(IntegerColumn.objects.filter(schema=clone).count(), items_number)
+
+    def test_clone_schema_get(self):
+        response = self.client.get(reverse('clone_schema', args=[self.schemas[0].pk]))
+        self.assertEqual(response.status_code, 405)
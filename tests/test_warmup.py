@@ -0,0 +1,50 @@
+from unittest import mock
+from django.db import connections
+from django.template import engines
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from schemas.forms import column_form_class
+from schemas.models import DataSchemas, IntegerColumn, PhoneColumn, COLUMN_MODELS
+from schemas.warmup import template_names, warm_up
+
+
+class WarmUpTests(TestCase):
+
+    def test_steps(self):
+        timings = warm_up()
+        self.assertEqual(list(timings), ['templates', 'urls', 'forms', 'search', 'connections'])
+        self.assertEqual(timings['forms'][0], len(COLUMN_MODELS))
+        self.assertNotIn('connections', warm_up(connect=False))
+
+    def test_templates(self):
+        names = template_names(engines['django'])
+        self.assertIn('schema_create_update.html', names)
+        self.assertIn('bootstrap4/layout/row.html', names)
+        self.assertFalse(any(name.startswith('admin/') for name in names))
+
+    @override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'OPTIONS': {'loaders': [('django.template.loaders.cached.Loader', ['django.template.loaders.app_directories.Loader'])]},
+    }])
+    def test_templates_are_cached(self):
+        warm_up(connect=False)
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertIn('bootstrap4/whole_uni_form.html', list(loader.get_template_cache))
+
+    def test_connections_only_opened_when_kept(self):
+        with mock.patch.object(connections['default'], 'ensure_connection') as ensure_connection:
+            warm_up()
+            ensure_connection.assert_not_called()
+            with mock.patch.dict(connections['default'].settings_dict, CONN_MAX_AGE=600):
+                warm_up()
+            ensure_connection.assert_called_once_with()
+
+    def test_column_form_classes_are_reused(self):
+        self.assertIs(column_form_class(IntegerColumn), column_form_class(IntegerColumn))
+        self.assertIsNot(column_form_class(IntegerColumn), column_form_class(PhoneColumn))
+        schema = DataSchemas.objects.create(name='People')
+        column = IntegerColumn.objects.create(name='age', schema=schema, order=1)
+        response = self.client.post(reverse('schema_create_update', args=[schema.pk]), {'edit_col_%s' % column.pk: ''})
+        self.assertContains(response, 'save_schema_columns_chng_btn_%s' % column.pk)
+        self.assertContains(response, 'range_low')